@@ -0,0 +1,335 @@
+# Agent / 线程复用池
+#
+# 每次启动 MCP demo 都会用相同的 model / instructions / mcp_tool.definitions 调用 create_agent，
+# 再 threads.create 一个新线程，而且从不清理，启动慢还会不断泄漏资源。
+# AgentPool:
+#   - 按 hash(model, instructions, tool definitions) 登记 agent，配置相同就复用已有的 agent id
+#     （本地注册表 + agent metadata 中的 fingerprint，注册表丢失时也能通过 list_agents 找回）
+#   - 注册表中的 agent 每个进程首次使用前用 get_agent 确认仍然存在，已被删除时丢弃该条目并重新创建
+#   - 为新对话预先创建一批空线程（warm pool），取用后在后台补齐
+#   - 取走的线程记入 leased（带最后使用时间），gc() 删除长时间未使用的 agent、过期的空闲线程和对话线程
+#   - 记录每次 acquire 是冷启动（新建 agent/线程）还是热启动及其耗时
+
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from azure.ai.agents import AgentsClient
+from azure.core.exceptions import ResourceNotFoundError
+
+DEFAULT_REGISTRY_PATH = Path(__file__).resolve().parent / "agent_registry.json"
+FINGERPRINT_METADATA_KEY = "pool_fingerprint"
+
+
+def _to_jsonable(obj: Any) -> Any:
+    """把 SDK 模型对象（ToolDefinition 等）转成可稳定序列化的结构"""
+    if hasattr(obj, "as_dict"):
+        return obj.as_dict()
+    if isinstance(obj, (list, tuple)):
+        return [_to_jsonable(o) for o in obj]
+    if isinstance(obj, dict):
+        return {k: _to_jsonable(v) for k, v in obj.items()}
+    return obj
+
+
+def agent_fingerprint(model: str, instructions: str, tools: Optional[List[Any]] = None) -> str:
+    """(model, instructions, tool definitions) 的 hash"""
+    canonical = json.dumps(
+        {"model": model, "instructions": instructions, "tools": _to_jsonable(tools or [])},
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+@dataclass
+class StartTiming:
+    """一次 acquire 的耗时"""
+    kind: str               # cold / warm
+    agent_reused: bool
+    thread_from_pool: bool
+    seconds: float
+
+
+@dataclass
+class PooledSession:
+    agent_id: str
+    thread_id: str
+    fingerprint: str
+    timing: StartTiming
+
+
+class AgentPool:
+    """按配置复用 agent，并维护空闲线程池"""
+
+    def __init__(
+        self,
+        agents_client: AgentsClient,
+        registry_path: Path = DEFAULT_REGISTRY_PATH,
+        warm_threads: int = 2,
+        agent_ttl_s: float = 7 * 24 * 3600,
+        thread_ttl_s: float = 24 * 3600,
+        leased_thread_ttl_s: float = 7 * 24 * 3600,
+    ):
+        """
+        Args:
+            agents_client: AgentsClient
+            registry_path: 本地注册表（JSON）
+            warm_threads: 每个 agent 保持的空闲线程数
+            agent_ttl_s: agent 超过该时间未使用则被 gc 删除
+            thread_ttl_s: 空闲线程超过该时间未被取用则被 gc 删除
+            leased_thread_ttl_s: 已取用的对话线程超过该时间未使用（见 touch()）则被 gc 删除
+        """
+        self.agents_client = agents_client
+        self.registry_path = Path(registry_path)
+        self.warm_threads = warm_threads
+        self.agent_ttl_s = agent_ttl_s
+        self.thread_ttl_s = thread_ttl_s
+        self.leased_thread_ttl_s = leased_thread_ttl_s
+        self.timings: List[StartTiming] = []
+        self._lock = threading.RLock()
+        self._refills_in_flight: Dict[str, int] = {}  # 正在创建中的空闲线程数，避免并发 refill 超量补齐
+        self._refill_threads: List[threading.Thread] = []
+        self._verified_agents: set = set()  # 本进程内已确认存在的 agent id
+        self.registry = self._load()
+
+    # ---------- 注册表 ----------
+
+    def _load(self) -> Dict[str, Any]:
+        if self.registry_path.exists():
+            try:
+                return json.loads(self.registry_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Agent registry unreadable ({e}), starting empty")
+        return {"agents": {}}
+
+    def _save(self) -> None:
+        tmp_path = self.registry_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.registry, indent=2, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, self.registry_path)
+
+    # ---------- agent ----------
+
+    def _find_remote_agent(self, fingerprint: str) -> Optional[str]:
+        """本地注册表没有记录时，通过 metadata 中的 fingerprint 查找已有 agent"""
+        for agent in self.agents_client.list_agents(limit=100):
+            if (agent.metadata or {}).get(FINGERPRINT_METADATA_KEY) == fingerprint:
+                return agent.id
+        return None
+
+    def _agent_exists(self, agent_id: str) -> bool:
+        if agent_id in self._verified_agents:
+            return True
+        try:
+            self.agents_client.get_agent(agent_id)
+        except ResourceNotFoundError:
+            return False
+        self._verified_agents.add(agent_id)
+        return True
+
+    def get_agent_id(self, model: str, instructions: str, tools: Optional[List[Any]] = None,
+                     name: Optional[str] = None, **create_kwargs: Any) -> tuple:
+        """
+        返回配置匹配的 agent id，没有则创建
+
+        Returns:
+            (agent_id, fingerprint, 是否复用)
+        """
+        fingerprint = agent_fingerprint(model, instructions, tools)
+        stale_threads: List[str] = []
+        with self._lock:
+            entry = self.registry["agents"].get(fingerprint)
+            if entry and not self._agent_exists(entry["agent_id"]):
+                # agent 已在门户或其它进程中被删除：丢弃该条目及其线程，按新配置重新创建
+                print(f"⚠️ Registered agent {entry['agent_id']} no longer exists, recreating")
+                del self.registry["agents"][fingerprint]
+                stale_threads = [t["thread_id"] for t in entry["threads"] + entry.get("leased", [])]
+                entry = None
+            agent_id = entry["agent_id"] if entry else self._find_remote_agent(fingerprint)
+            reused = agent_id is not None
+
+            if not reused:
+                metadata = dict(create_kwargs.pop("metadata", None) or {})
+                metadata[FINGERPRINT_METADATA_KEY] = fingerprint
+                agent = self.agents_client.create_agent(
+                    model=model, name=name, instructions=instructions, tools=tools,
+                    metadata=metadata, **create_kwargs,
+                )
+                agent_id = agent.id
+                self._verified_agents.add(agent_id)
+                print(f"Created agent, ID: {agent_id}")
+            else:
+                print(f"Reusing agent, ID: {agent_id}")
+
+            entry = self.registry["agents"].setdefault(
+                fingerprint, {"agent_id": agent_id, "created_at": time.time(), "threads": [], "leased": []}
+            )
+            entry.setdefault("leased", [])  # 兼容旧版注册表
+            entry["agent_id"] = agent_id
+            entry["last_used_at"] = time.time()
+            self._save()
+        for thread_id in stale_threads:
+            self._delete(self.agents_client.threads.delete, thread_id)
+        return agent_id, fingerprint, reused
+
+    # ---------- 线程 ----------
+
+    def _create_thread(self) -> str:
+        return self.agents_client.threads.create().id
+
+    def refill(self, fingerprint: str) -> None:
+        """把该 agent 的空闲线程补到 warm_threads 个"""
+        with self._lock:
+            entry = self.registry["agents"].get(fingerprint)
+            if entry is None:  # 已被 gc 或失效检查移除
+                return
+            in_flight = self._refills_in_flight.get(fingerprint, 0)
+            missing = max(self.warm_threads - len(entry["threads"]) - in_flight, 0)
+            self._refills_in_flight[fingerprint] = in_flight + missing
+        remaining = missing
+        try:
+            for _ in range(missing):
+                thread_id = self._create_thread()
+                with self._lock:
+                    entry = self.registry["agents"].get(fingerprint)
+                    if entry is not None:
+                        entry["threads"].append({"thread_id": thread_id, "created_at": time.time()})
+                        self._save()
+                    self._refills_in_flight[fingerprint] -= 1
+                    remaining -= 1
+                if entry is None:
+                    # 补齐期间 agent 被移除，刚创建的线程不再登记，直接删除
+                    self._delete(self.agents_client.threads.delete, thread_id)
+                    break
+        finally:
+            # 创建失败时把未完成的名额还回去，下次 refill 可以重新补齐
+            with self._lock:
+                self._refills_in_flight[fingerprint] -= remaining
+
+    def refill_async(self, fingerprint: str) -> None:
+        worker = threading.Thread(target=self.refill, args=(fingerprint,), daemon=True)
+        worker.start()
+        self._refill_threads.append(worker)
+
+    def acquire(self, model: str, instructions: str, tools: Optional[List[Any]] = None,
+                name: Optional[str] = None, **create_kwargs: Any) -> PooledSession:
+        """
+        获取一个 agent + 一个全新的空线程
+
+        Returns:
+            PooledSession（含冷 / 热启动耗时）
+        """
+        start = time.time()
+        agent_id, fingerprint, reused = self.get_agent_id(model, instructions, tools, name=name, **create_kwargs)
+
+        with self._lock:
+            idle = self.registry["agents"][fingerprint]["threads"]
+            pooled = idle.pop(0) if idle else None
+            self._save()
+        thread_id = pooled["thread_id"] if pooled else self._create_thread()
+        with self._lock:
+            now = time.time()
+            self.registry["agents"][fingerprint]["leased"].append(
+                {"thread_id": thread_id, "leased_at": now, "last_used_at": now}
+            )
+            self._save()
+        print(f"{'Leased pooled' if pooled else 'Created'} thread, ID: {thread_id}")
+
+        timing = StartTiming(
+            kind="warm" if reused and pooled else "cold",
+            agent_reused=reused,
+            thread_from_pool=pooled is not None,
+            seconds=time.time() - start,
+        )
+        self.timings.append(timing)
+        print(f"⏱️ {timing.kind} start in {timing.seconds:.2f}s "
+              f"(agent {'reused' if reused else 'created'}, thread {'from pool' if pooled else 'created'})")
+
+        # 取走的线程会承载对话历史，不再放回空闲池，而是记入 leased 由 gc 按最后使用时间清理；后台补齐下一次用的空线程
+        if self.warm_threads > 0:
+            self.refill_async(fingerprint)
+        return PooledSession(agent_id, thread_id, fingerprint, timing)
+
+    def touch(self, session: PooledSession) -> None:
+        """更新对话线程的最后使用时间（每轮对话后调用），避免仍在使用的线程被 gc"""
+        with self._lock:
+            entry = self.registry["agents"].get(session.fingerprint)
+            for leased in (entry or {}).get("leased", []):
+                if leased["thread_id"] == session.thread_id:
+                    leased["last_used_at"] = time.time()
+                    self._save()
+                    return
+
+    def wait_for_refill(self, timeout: Optional[float] = None) -> None:
+        for worker in self._refill_threads:
+            worker.join(timeout)
+        self._refill_threads = [w for w in self._refill_threads if w.is_alive()]
+
+    # ---------- 清理 ----------
+
+    def gc(self, now: Optional[float] = None) -> Dict[str, int]:
+        """
+        删除过期资源：超过 agent_ttl_s 未使用的 agent（连同其全部线程）、超过 thread_ttl_s 的空闲线程，
+        以及超过 leased_thread_ttl_s 未使用的对话线程
+
+        Returns:
+            删除的 agent / 线程数量
+        """
+        now = now or time.time()
+        expired_agents: List[str] = []
+        expired_threads: List[str] = []
+        # 持锁时只从注册表中摘除过期资源，删除请求在锁外发出，不阻塞并发的 acquire
+        with self._lock:
+            for fingerprint, entry in list(self.registry["agents"].items()):
+                agent_expired = now - entry.get("last_used_at", entry["created_at"]) > self.agent_ttl_s
+                keep_threads = []
+                for pooled in entry["threads"]:
+                    if agent_expired or now - pooled["created_at"] > self.thread_ttl_s:
+                        expired_threads.append(pooled["thread_id"])
+                    else:
+                        keep_threads.append(pooled)
+                entry["threads"] = keep_threads
+
+                keep_leased = []
+                for leased in entry.get("leased", []):
+                    if agent_expired or now - leased["last_used_at"] > self.leased_thread_ttl_s:
+                        expired_threads.append(leased["thread_id"])
+                    else:
+                        keep_leased.append(leased)
+                entry["leased"] = keep_leased
+
+                if agent_expired:
+                    expired_agents.append(entry["agent_id"])
+                    self._verified_agents.discard(entry["agent_id"])
+                    del self.registry["agents"][fingerprint]
+            self._save()
+
+        for thread_id in expired_threads:
+            self._delete(self.agents_client.threads.delete, thread_id)
+        for agent_id in expired_agents:
+            self._delete(self.agents_client.delete_agent, agent_id)
+        removed = {"agents": len(expired_agents), "threads": len(expired_threads)}
+        if removed["agents"] or removed["threads"]:
+            print(f"🧹 GC removed {removed['agents']} agent(s), {removed['threads']} thread(s)")
+        return removed
+
+    @staticmethod
+    def _delete(delete_fn, resource_id: str) -> None:
+        try:
+            delete_fn(resource_id)
+        except Exception as e:  # 已被手动删除等情况，不影响后续清理
+            print(f"⚠️ Failed to delete {resource_id}: {e}")
+
+    def timing_report(self) -> Dict[str, Any]:
+        """按冷 / 热启动汇总 acquire 耗时"""
+        report = {}
+        for kind in ("cold", "warm"):
+            seconds = [t.seconds for t in self.timings if t.kind == kind]
+            if seconds:
+                report[kind] = {"count": len(seconds), "avg_s": round(sum(seconds) / len(seconds), 3),
+                                "max_s": round(max(seconds), 3)}
+        return report
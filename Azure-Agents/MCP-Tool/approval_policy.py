@@ -0,0 +1,236 @@
+# MCP 工具调用的策略审批
+#
+# 原来每个 RequiredMcpToolCall 都要阻塞在 input() 上等人工确认，run 可能卡住几分钟，也无法无人值守运行。
+# ApprovalPolicy 按声明式规则自动审批：
+#   - 规则按顺序匹配 server_label / 工具名（glob）/ 参数（正则），第一个命中的规则决定 allow / deny / ask
+#   - 每次都先按规则评估（规则评估很便宜，策略文件修改后立即生效）
+#   - ask 交给升级处理器：交互式询问，或无人值守时先拒绝并写入待人工处理的队列；
+#     人工结论按 (server_label, 工具名, 参数 hash) 缓存，可选落盘，同样的调用不再重复询问
+#   - 一个 requires_action 中的所有调用一次性返回，由 RunDriver 通过一次 submit_tool_outputs 批量提交
+#
+# 策略文件示例（mcp_approval_policy.json）:
+#   {
+#     "default": "ask",
+#     "rules": [
+#       {"server_label": "mslearn", "tool": "microsoft_docs_*", "action": "allow"},
+#       {"tool": "*", "args": {"query": "(?i)password|secret"}, "action": "deny"}
+#     ]
+#   }
+
+import fnmatch
+import hashlib
+import json
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from azure.ai.agents.models import RequiredMcpToolCall, ThreadRun, ToolApproval
+
+ALLOW, DENY, ASK = "allow", "deny", "ask"
+
+
+@dataclass
+class ApprovalRule:
+    """单条审批规则，未设置的条件视为匹配任意值"""
+    action: str
+    server_label: str = "*"
+    tool: str = "*"
+    args: Dict[str, str] = field(default_factory=dict)  # 参数名 -> 正则（re.search）
+
+    def __post_init__(self):
+        if self.action not in (ALLOW, DENY, ASK):
+            raise ValueError(f"Invalid action '{self.action}', expected one of: {ALLOW}, {DENY}, {ASK}")
+        self._arg_patterns = {name: re.compile(pattern) for name, pattern in self.args.items()}
+
+    def matches(self, server_label: str, tool: str, arguments: Dict[str, Any]) -> bool:
+        if not fnmatch.fnmatchcase(server_label or "", self.server_label):
+            return False
+        if not fnmatch.fnmatchcase(tool or "", self.tool):
+            return False
+        for name, pattern in self._arg_patterns.items():
+            if name not in arguments or not pattern.search(_arg_to_str(arguments[name])):
+                return False
+        return True
+
+
+@dataclass
+class ApprovalDecision:
+    """一次工具调用的审批结果"""
+    tool_call_id: str
+    server_label: str
+    tool: str
+    approve: bool
+    source: str          # rule:<index> / default / cache / escalation
+    latency_s: float
+
+
+def _arg_to_str(value: Any) -> str:
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+
+def parse_arguments(raw: Any) -> Dict[str, Any]:
+    """RequiredMcpToolCall.arguments 通常是 JSON 字符串，无法解析时按原始字符串处理"""
+    if isinstance(raw, dict):
+        return raw
+    try:
+        parsed = json.loads(raw or "{}")
+    except (TypeError, ValueError):
+        return {"_raw": str(raw)}
+    return parsed if isinstance(parsed, dict) else {"_raw": parsed}
+
+
+def call_cache_key(server_label: str, tool: str, arguments: Dict[str, Any]) -> str:
+    """(server_label, tool, 规范化参数) 的 hash"""
+    canonical = json.dumps(arguments, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    digest = hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+    return f"{server_label}/{tool}/{digest}"
+
+
+# 升级处理器：返回 True/False 表示人工给出的结论
+EscalationHandler = Callable[[RequiredMcpToolCall, Dict[str, Any]], bool]
+
+
+def prompt_escalation(tool_call: RequiredMcpToolCall, arguments: Dict[str, Any]) -> bool:
+    """交互式询问（与原脚本的提示一致）"""
+    print(f"  Tool Call ID: {tool_call.id}")
+    print(f"  Tool Name: {tool_call.name}")
+    print(f"  Server Label: {tool_call.server_label}")
+    print(f"  Arguments: {tool_call.arguments}")
+    user_approval = input(f"Do you approve the tool call '{tool_call.name}'? (y/n): ").strip().lower()
+    return user_approval in ['y', 'yes', '1', 'true']
+
+
+class EscalationQueue:
+    """无人值守模式：先拒绝，并把调用写入 JSONL 队列等待人工处理"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def __call__(self, tool_call: RequiredMcpToolCall, arguments: Dict[str, Any]) -> bool:
+        record = {
+            "key": call_cache_key(tool_call.server_label, tool_call.name, arguments),
+            "server_label": tool_call.server_label,
+            "tool": tool_call.name,
+            "arguments": arguments,
+            "queued_at": time.time(),
+        }
+        with self._lock, self.path.open("a", encoding="utf-8") as fp:
+            fp.write(json.dumps(record, ensure_ascii=False) + "\n")
+        print(f"  ⏸️ Escalated '{tool_call.name}' to {self.path}, denied for this run")
+        return False
+
+    def pending(self) -> List[Dict[str, Any]]:
+        if not self.path.exists():
+            return []
+        with self.path.open("r", encoding="utf-8") as fp:
+            return [json.loads(line) for line in fp if line.strip()]
+
+
+class ApprovalPolicy:
+    """声明式审批策略，可直接作为 RunDriver 的 on_requires_action"""
+
+    def __init__(
+        self,
+        rules: List[ApprovalRule],
+        default: str = ASK,
+        escalation: Optional[EscalationHandler] = prompt_escalation,
+        cache_path: Optional[Path] = None,
+    ):
+        """
+        Args:
+            rules: 按顺序匹配的规则
+            default: 没有规则命中时的动作
+            escalation: ask 时的处理器；None 表示 ask 一律拒绝
+            cache_path: 人工决策缓存文件，设置后跨进程复用
+        """
+        if default not in (ALLOW, DENY, ASK):
+            raise ValueError(f"Invalid default action '{default}'")
+        self.rules = rules
+        self.default = default
+        self.escalation = escalation
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.decision_cache: Dict[str, bool] = {}
+        self.history: List[ApprovalDecision] = []
+        self._lock = threading.Lock()
+        if self.cache_path and self.cache_path.exists():
+            self.decision_cache.update(json.loads(self.cache_path.read_text(encoding="utf-8")))
+
+    @classmethod
+    def from_file(cls, path: Path, **kwargs: Any) -> "ApprovalPolicy":
+        """从 JSON 策略文件加载"""
+        config = json.loads(Path(path).read_text(encoding="utf-8"))
+        rules = [ApprovalRule(**rule) for rule in config.get("rules", [])]
+        return cls(rules, default=config.get("default", ASK), **kwargs)
+
+    def evaluate(self, server_label: str, tool: str, arguments: Dict[str, Any]) -> Tuple[str, str]:
+        """返回 (action, source)，不访问缓存、不触发升级"""
+        for index, rule in enumerate(self.rules):
+            if rule.matches(server_label, tool, arguments):
+                return rule.action, f"rule:{index}"
+        return self.default, "default"
+
+    def decide(self, tool_call: RequiredMcpToolCall) -> ApprovalDecision:
+        """对单个工具调用给出审批结论"""
+        start = time.time()
+        arguments = parse_arguments(tool_call.arguments)
+        key = call_cache_key(tool_call.server_label, tool_call.name, arguments)
+
+        # 规则优先于缓存：策略文件新增的 deny 规则对已经见过的调用同样生效
+        action, source = self.evaluate(tool_call.server_label, tool_call.name, arguments)
+        if action != ASK:
+            approve = action == ALLOW
+        else:
+            with self._lock:
+                cached = self.decision_cache.get(key)
+            if cached is not None:
+                approve, source = cached, "cache"
+            else:
+                approve = bool(self.escalation and self.escalation(tool_call, arguments))
+                source = "escalation"
+                # 只缓存人工结论；无人值守队列的临时拒绝不缓存，人工处理后再通过 remember 写入
+                if self.escalation is not None and not isinstance(self.escalation, EscalationQueue):
+                    self.remember(key, approve)
+
+        return self._record(ApprovalDecision(tool_call.id, tool_call.server_label, tool_call.name,
+                                             approve, source, time.time() - start))
+
+    def _record(self, decision: ApprovalDecision) -> ApprovalDecision:
+        with self._lock:
+            self.history.append(decision)
+        print(f"  {'✅ Approved' if decision.approve else '⛔ Denied'} '{decision.tool}' "
+              f"({decision.server_label}) by {decision.source}")
+        return decision
+
+    def remember(self, key: str, approve: bool) -> None:
+        """写入决策缓存（也用于人工处理升级队列后回填结论）"""
+        with self._lock:
+            self.decision_cache[key] = approve
+            if self.cache_path:
+                self.cache_path.write_text(json.dumps(self.decision_cache, indent=2), encoding="utf-8")
+
+    def __call__(self, run: ThreadRun) -> List[ToolApproval]:
+        """处理一次 requires_action，返回其中所有 MCP 调用的审批结果"""
+        tool_calls = run.required_action.submit_tool_approval.tool_calls
+        print(f"Tool approval required for {len(tool_calls)} call(s), applying policy...")
+        return [
+            ToolApproval(tool_call_id=tool_call.id, approve=self.decide(tool_call).approve)
+            for tool_call in tool_calls
+            if isinstance(tool_call, RequiredMcpToolCall)
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            history = list(self.history)
+        by_source: Dict[str, int] = {}
+        for decision in history:
+            by_source[decision.source.split(":")[0]] = by_source.get(decision.source.split(":")[0], 0) + 1
+        return {
+            "decisions": len(history),
+            "approved": sum(d.approve for d in history),
+            "by_source": by_source,
+            "decision_latency_s": round(sum(d.latency_s for d in history), 3),
+        }
@@ -2,69 +2,88 @@
 # Source: https://learn.microsoft.com/en-us/azure/ai-foundry/agents/how-to/tools/model-context-protocol-samples?pivots=python
 
 # Import necessary libraries
-import os, time
+import os
+import sys
+from pathlib import Path
 from azure.ai.projects import AIProjectClient
 from azure.identity import DefaultAzureCredential
 from azure.ai.agents import AgentsClient
-from azure.ai.agents.models import McpTool, RequiredMcpToolCall, SubmitToolApprovalAction, ToolApproval, MessageRole, ThreadMessage
-from dotenv import load_dotenv
-from datetime import datetime
-from typing import Optional
+from azure.ai.agents.models import McpTool, MessageRole
 
+from agent_pool import AgentPool
+from approval_policy import ApprovalPolicy, EscalationQueue, prompt_escalation
+from run_driver import RunDriver
+from thread_sync import SyncState, ThreadSync
 
-# Load environment variables from .env file
-load_dotenv()
-# Get the MCP server configuration from environment variables
-mcp_server_url = os.environ.get("MCP_SERVER_URL", "https://learn.microsoft.com/api/mcp")
-mcp_server_label = os.environ.get("MCP_SERVER_LABEL", "mslearn")
+# 引用仓库根目录下的 lazy_config.py
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from lazy_config import LazyConfig, once
 
-agent_name = "MSLearn MCP Agent"
+
+# import 本模块不读取 .env、不创建客户端；首次取配置时才从 .env / 环境变量加载
+settings = LazyConfig(search_from=Path(__file__).resolve().parent)
+
+AGENT_NAME = "MSLearn MCP Agent"
+AGENT_INSTRUCTIONS = "You are a helpful agent that can use MCP tools to assist users. Use the available MCP tools to answer questions and perform tasks."
 first_message = "AI Foundray这个产品，最近一周有哪些文档的更新？"
 
-project_client = AIProjectClient(
-    endpoint=os.environ["PROJECT_ENDPOINT"],
-    credential=DefaultAzureCredential(),
-)
-
-# Set up the MCP tool
-mcp_tool = McpTool(
-    server_label=mcp_server_label,
-    server_url=mcp_server_url,
-    allowed_tools=[],  # Optional: specify allowed tools
-)
-# mcp_tool.set_approval_mode("never")  # Set approval mode to never for this demo
-
-# You can also add or remove allowed tools dynamically
-# search_api_code = "search_azure_rest_api_code"
-# mcp_tool.allow_tool(search_api_code)
-# print(f"Allowed tools: {mcp_tool.allowed_tools}")
-
-# Handle tool approvals
-# mcp_tool.update_headers("SuperSecret", "123456")
-
-
-def fetch_and_print_new_agent_response(
-    thread_id: str,
-    agents_client: AgentsClient,
-    last_message_id: Optional[str] = None,
-) -> Optional[str]:
-    lastest_agent_message = agents_client.messages.get_last_message_by_role(
-        thread_id=thread_id,
-        role=MessageRole.AGENT,
+
+@once
+def get_project_client() -> AIProjectClient:
+    """首次调用时创建 AIProjectClient，之后复用"""
+    return AIProjectClient(
+        endpoint=settings.get("PROJECT_ENDPOINT", required=True),
+        credential=DefaultAzureCredential(),
     )
-    if not lastest_agent_message or lastest_agent_message.id == last_message_id:
-        print(f"😶 No new content. last_message_id: {last_message_id}")
-        return last_message_id  # No new content
 
-    print(f"\n===================== 🤖 Agent response with lastest_agent_message id: {lastest_agent_message.id} ===========================")
-    print("\n".join(t.text.value for t in lastest_agent_message.text_messages))
 
-    for ann in lastest_agent_message.url_citation_annotations:
-        print(f"****** 🛜 URL Citation ******:\n   [{ann.url_citation.title}]({ann.url_citation.url})")
+def build_mcp_tool() -> McpTool:
+    """
+    按环境变量创建 MCP 工具
+
+    MCP_SERVER_URL 指向 mcp_cache_proxy.py 的公网地址时，重复的文档检索由本地缓存直接返回
+    """
+    mcp_tool = McpTool(
+        server_label=settings.get("MCP_SERVER_LABEL", "mslearn"),
+        server_url=settings.get("MCP_SERVER_URL", "https://learn.microsoft.com/api/mcp"),
+        allowed_tools=[],  # Optional: specify allowed tools
+    )
+    # mcp_tool.set_approval_mode("never")  # Set approval mode to never for this demo
+
+    # You can also add or remove allowed tools dynamically
+    # search_api_code = "search_azure_rest_api_code"
+    # mcp_tool.allow_tool(search_api_code)
+    # print(f"Allowed tools: {mcp_tool.allowed_tools}")
+
+    # Handle tool approvals
+    # mcp_tool.update_headers("SuperSecret", "123456")
+    return mcp_tool
+
 
-    return lastest_agent_message.id
+def build_approval_policy() -> ApprovalPolicy:
+    """
+    加载工具审批策略
 
-def process_agent_run(agents_client: AgentsClient, thread_id: str, agent_id: str, user_message: str, tool_resources) -> None:
+    策略文件命中 allow / deny 的调用直接审批，其余交互式询问；
+    设置 MCP_APPROVAL_UNATTENDED=1 时改为拒绝并写入升级队列，run 不会阻塞在 input() 上
+    """
+    # 工具调用审批策略（规则见 approval_policy.py）
+    approval_policy_path = settings.get(
+        "MCP_APPROVAL_POLICY", os.path.join(os.path.dirname(os.path.abspath(__file__)), "mcp_approval_policy.json")
+    )
+    escalation = prompt_escalation
+    if settings.get("MCP_APPROVAL_UNATTENDED", "").lower() in ("1", "true", "yes"):
+        escalation = EscalationQueue(settings.get("MCP_APPROVAL_QUEUE", "mcp_approval_queue.jsonl"))
+    cache_path = settings.get("MCP_APPROVAL_CACHE")  # 可选：跨进程复用审批决策
+    if os.path.exists(approval_policy_path):
+        print(f"Loaded approval policy: {approval_policy_path}")
+        return ApprovalPolicy.from_file(approval_policy_path, escalation=escalation, cache_path=cache_path)
+    # 没有策略文件时与原来的行为一致：每个调用都询问
+    return ApprovalPolicy([], default="ask", escalation=escalation, cache_path=cache_path)
+
+
+def process_agent_run(agents_client: AgentsClient, thread_id: str, agent_id: str, user_message: str, tool_resources,
+                      approval_policy: ApprovalPolicy, thread_sync: ThreadSync) -> None:
     """Process a single agent run with the given user message"""
     # Create message to thread
     message = agents_client.messages.create(
@@ -76,66 +95,13 @@ def process_agent_run(agents_client: AgentsClient, thread_id: str, agent_id: str
     print(f"👤 User message: {user_message}")
 
     print(f"Start processing the message... this may take a few minutes to finish. Be patient!")
-    # Poll the run as long as run status is queued or in progress
-    run = agents_client.runs.create(thread_id=thread_id, agent_id=agent_id,
-                                    tool_resources=tool_resources)
-    last_message_id = None
-    while run.status in ("queued", "in_progress", "requires_action"):
-        time.sleep(2)
-        run = agents_client.runs.get(thread_id=thread_id, run_id=run.id)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        print(f"\n\n🔄🔄🔄 Run status: {run.status} at {timestamp}")
-        if run.status == "requires_action":
-            print("Run requires action, checking for tool calls...")
-            
-            # 检查是否需要工具审批
-            if isinstance(run.required_action, SubmitToolApprovalAction):
-                print("Tool approval required!")
-                tool_calls = run.required_action.submit_tool_approval.tool_calls
-                
-                # 创建审批列表
-                tool_approvals = []
-                for tool_call in tool_calls:
-                    if isinstance(tool_call, RequiredMcpToolCall):
-                        print(f"  Tool Call ID: {tool_call.id}")
-                        print(f"  Tool Name: {tool_call.name}")
-                        print(f"  Server Label: {tool_call.server_label}")
-                        print(f"  Arguments: {tool_call.arguments}")
-                        
-                        # 询问用户是否批准此工具调用
-                        user_approval = input(f"Do you approve the tool call '{tool_call.name}'? (y/n): ").strip().lower()
-                        approve = user_approval in ['y', 'yes', '1', 'true']
-                        
-                        # 创建 ToolApproval 对象
-                        approval = ToolApproval(
-                            tool_call_id=tool_call.id,
-                            approve=approve
-                        )
-                        tool_approvals.append(approval)
-                        
-                        print(f"  Approval: {'Approved' if approve else 'Denied'}")
-                
-                # 提交工具审批
-                if tool_approvals:
-                    print("Submitting tool approvals...")
-                    agents_client.runs.submit_tool_outputs(
-                        thread_id=thread_id,
-                        run_id=run.id,
-                        tool_approvals=tool_approvals
-                    )
-                    print("Tool approvals submitted!")
-                   
-            else:
-                print(f"Required action type: {run.required_action.type if run.required_action else 'None'}")
-           
-
-        last_message_id = fetch_and_print_new_agent_response(
-            thread_id=thread_id,
-            agents_client=agents_client,
-            last_message_id=last_message_id,
-        )
+    # 优先使用流式事件驱动 run，不支持时自动退回自适应轮询
+    driver = RunDriver(agents_client, on_requires_action=approval_policy, thread_sync=thread_sync)
+    run, metrics = driver.drive(thread_id=thread_id, agent_id=agent_id, tool_resources=tool_resources)
 
     print(f"\n\n🎉🎉🎉 Run finished with status: {run.status}, ID: {run.id}")
+    print(f"📊 {metrics.summary()}")
+    print(f"📊 Approval policy: {approval_policy.stats()}")
 
     if run.status == "failed":
         print(f"Run failed: {run.last_error}")
@@ -152,8 +118,8 @@ def process_agent_run(agents_client: AgentsClient, thread_id: str, agent_id: str
         print("\n".join(t.text.value for t in final_message.text_messages))
     
     
-    # Retrieve the steps taken during the run for analysis
-    run_steps = agents_client.run_steps.list(thread_id=thread.id, run_id=run.id)
+    # Retrieve the steps taken during the run for analysis（按游标增量拉取）
+    run_steps = thread_sync.iter_new_run_steps(thread_id, run.id)
 
     # Loop through each step to display information
     for step in run_steps:
@@ -175,63 +141,76 @@ def process_agent_run(agents_client: AgentsClient, thread_id: str, agent_id: str
 
 
 
-# Create an agent
-# NOTE: To reuse an existing agent, fetch it with get_agent(agent_id)
-with project_client:
-    agents_client = project_client.agents
-
-    # Create a new agent.
+def main() -> None:
+    # Create an agent
     # NOTE: To reuse an existing agent, fetch it with get_agent(agent_id)
-    agent = agents_client.create_agent(
-        model=os.environ["MODEL_DEPLOYMENT_NAME"],
-        name=agent_name,
-        instructions="You are a helpful agent that can use MCP tools to assist users. Use the available MCP tools to answer questions and perform tasks.",
-        tools=mcp_tool.definitions,
-    )
-    print(f"Created agent, ID: {agent.id}")
-
-    # Create a thread for communication
-    thread = agents_client.threads.create()
-    print(f"Created thread, ID: {thread.id}")
-
-    # Multi-turn conversation loop
-    # first_message = "AI Foundray这个产品，最近一周有哪些文档的更新？"
-    current_message = first_message
-    
-    while True:
-        # Process the current message
-        process_agent_run(agents_client, thread.id, agent.id, current_message, tool_resources=mcp_tool.resources)
-        
-        # Ask user if they want to continue
-        print("\n" + "="*60)
-        user_input = input("Do you want to continue the conversation? Enter 'n' to quit, or type your next question: ")
-        print(f"********* 💬 User input: {user_input} *********")
-        
-        # Check if user wants to quit
-        if user_input.strip().lower() == 'n':
-            print("Ending conversation...")
-            break
-        
-        # Use user input as the next message
-        current_message = user_input.strip()
-        if not current_message:
-            print("Empty message, ending conversation...")
-            break
-
-    # # Create and automatically process the run, handling tool calls internally
-    # run = project_client.agents.runs.create_and_process(thread_id=thread.id, agent_id=agent.id)
-    # print(f"Run finished with status: {run.status}")
-
-    # if run.status == "failed":
-    #     print(f"Run failed: {run.last_error}")
-
-
-    # Perform cleanup
-    # Delete the agent resource to clean up
-    # project_client.agents.delete_agent(agent.id)
-    # print("Deleted agent")
-
-    # Fetch and log all messages exchanged during the conversation thread
-    messages = agents_client.messages.list(thread_id=thread.id)
-    for msg in messages:
-        print(f"Message ID: {msg.id}, \nRole: {msg.role}, \nContent: {msg.content}\n\n")
+    project_client = get_project_client()
+    mcp_tool = build_mcp_tool()
+    with project_client:
+        agents_client = project_client.agents
+
+        # 相同 model / instructions / tools 的 agent 直接复用，线程从预热池中取用
+        agent_pool = AgentPool(agents_client)
+        agent_pool.gc()
+        session = agent_pool.acquire(
+            model=settings.get("MODEL_DEPLOYMENT_NAME", required=True),
+            name=AGENT_NAME,
+            instructions=AGENT_INSTRUCTIONS,
+            tools=mcp_tool.definitions,
+        )
+        agent_id, thread_id = session.agent_id, session.thread_id
+
+        # Multi-turn conversation loop
+        # first_message = "AI Foundray这个产品，最近一周有哪些文档的更新？"
+        current_message = first_message
+        approval_policy = build_approval_policy()
+        # 消息 / run step 游标，设置 MCP_SYNC_STATE 时持久化到文件
+        thread_sync = ThreadSync(agents_client, SyncState(settings.get("MCP_SYNC_STATE")))
+
+        while True:
+            # Process the current message
+            process_agent_run(agents_client, thread_id, agent_id, current_message, tool_resources=mcp_tool.resources,
+                              approval_policy=approval_policy, thread_sync=thread_sync)
+            agent_pool.touch(session)
+
+            # Ask user if they want to continue
+            print("\n" + "="*60)
+            user_input = input("Do you want to continue the conversation? Enter 'n' to quit, or type your next question: ")
+            print(f"********* 💬 User input: {user_input} *********")
+
+            # Check if user wants to quit
+            if user_input.strip().lower() == 'n':
+                print("Ending conversation...")
+                break
+
+            # Use user input as the next message
+            current_message = user_input.strip()
+            if not current_message:
+                print("Empty message, ending conversation...")
+                break
+
+        print(f"⏱️ Start timing: {agent_pool.timing_report()}")
+        agent_pool.wait_for_refill(timeout=30)
+
+        # # Create and automatically process the run, handling tool calls internally
+        # run = project_client.agents.runs.create_and_process(thread_id=thread.id, agent_id=agent.id)
+        # print(f"Run finished with status: {run.status}")
+
+        # if run.status == "failed":
+        #     print(f"Run failed: {run.last_error}")
+
+
+        # Perform cleanup
+        # Delete the agent resource to clean up
+        # project_client.agents.delete_agent(agent.id)
+        # print("Deleted agent")
+
+        # Fetch and log all messages exchanged during the conversation thread
+        # （完整记录，不走 ThreadSync 游标；游标只用于 run 过程中的增量消费）
+        messages = agents_client.messages.list(thread_id=thread_id)
+        for msg in messages:
+            print(f"Message ID: {msg.id}, \nRole: {msg.role}, \nContent: {msg.content}\n\n")
+
+
+if __name__ == "__main__":
+    main()
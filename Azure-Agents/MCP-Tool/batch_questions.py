@@ -0,0 +1,251 @@
+# 并发处理一批问题
+#
+# 原脚本在 while True 循环里一次只处理一个问题，一个 run 往往要几分钟，一队问题只能排队等待。
+# 这里每个问题使用共享 agent 上的独立线程，并发驱动多个 run：
+#   - ThreadPoolExecutor 限制并发数，问题按需从列表 / 文件 / stdin 读取，不会一次性全部提交
+#   - RateLimiter 限制每分钟启动的 run 数，遇到 429 按 Retry-After（或指数退避）重试
+#   - 工具审批使用 approval_policy.py 的策略，无法自动决定的调用写入升级队列，不会阻塞在 input() 上
+#   - 每个问题的最终回复、URL 引用、run step 中的工具调用和 run 统计写入同一个 JSONL 输出文件
+#
+# 用法:
+#   python batch_questions.py questions.txt --concurrency 4 --runs-per-minute 20 --output answers.jsonl
+#   cat questions.txt | python batch_questions.py - --concurrency 4
+#
+# 问题文件每行一个问题；也支持 JSONL（每行 {"id": ..., "question": ...}）。
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from azure.ai.agents import AgentsClient
+from azure.ai.agents.models import MessageRole, ThreadMessage
+
+from agent_pool import AgentPool
+from approval_policy import ApprovalPolicy, EscalationQueue
+from run_driver import RunDriver, call_with_retry
+from thread_sync import ThreadSync
+# 与交互式脚本共用 agent 定义，使两边复用同一个 agent（该模块 import 时不做任何 I/O）
+from azure_ai_foundry_agent_with_mcp_mslearn_require_approval import (
+    AGENT_INSTRUCTIONS, AGENT_NAME, build_mcp_tool, get_project_client, settings,
+)
+
+
+@dataclass
+class Question:
+    id: str
+    question: str
+
+
+@dataclass
+class QuestionResult:
+    """一个问题的结构化结果（对应输出文件中的一行）"""
+    id: str
+    question: str
+    thread_id: Optional[str] = None
+    run_id: Optional[str] = None
+    status: Optional[str] = None
+    answer: Optional[str] = None
+    citations: List[Dict[str, str]] = field(default_factory=list)
+    tool_calls: List[Dict[str, Any]] = field(default_factory=list)
+    metrics: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    started_at: Optional[str] = None
+    duration_s: float = 0.0
+
+
+class RateLimiter:
+    """令牌桶：限制单位时间内启动的 run 数"""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def read_questions(source: Iterable[str]) -> Iterator[Question]:
+    """逐行读取问题，支持纯文本和 JSONL"""
+    for index, line in enumerate(source, start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("{"):
+            record = json.loads(line)
+            yield Question(id=str(record.get("id", index)), question=record["question"])
+        else:
+            yield Question(id=str(index), question=line)
+
+
+def _tool_calls_from_steps(steps: Iterable[Any]) -> List[Dict[str, Any]]:
+    calls = []
+    for step in steps:
+        for call in step.get("step_details", {}).get("tool_calls", []):
+            calls.append({
+                "step_id": step["id"],
+                "id": call.get("id"),
+                "type": call.get("type"),
+                "name": call.get("name"),
+                "server_label": call.get("server_label"),
+                "arguments": call.get("arguments"),
+                "output": call.get("output"),
+            })
+    return calls
+
+
+class BatchQuestionRunner:
+    """在共享 agent 上并发回答一批问题"""
+
+    def __init__(
+        self,
+        agents_client: AgentsClient,
+        agent_id: str,
+        approval_policy: ApprovalPolicy,
+        tool_resources: Any = None,
+        concurrency: int = 4,
+        runs_per_minute: float = 30,
+        max_retries: int = 5,
+    ):
+        """
+        Args:
+            agents_client: AgentsClient
+            agent_id: 共享的 agent
+            approval_policy: 工具审批策略（需可无人值守）
+            tool_resources: 透传给 run（McpTool.resources）
+            concurrency: 同时进行的 run 数
+            runs_per_minute: 每分钟最多启动的 run 数
+            max_retries: 遇到 429 时的最大重试次数
+        """
+        self.agents_client = agents_client
+        self.agent_id = agent_id
+        self.approval_policy = approval_policy
+        self.tool_resources = tool_resources
+        self.concurrency = concurrency
+        self.rate_limiter = RateLimiter(runs_per_minute)
+        self.max_retries = max_retries
+
+    def _with_retry(self, fn, *args, **kwargs):
+        return call_with_retry(fn, *args, max_retries=self.max_retries, **kwargs)
+
+    def answer(self, question: Question) -> QuestionResult:
+        """为一个问题创建线程、驱动 run 并收集结果"""
+        result = QuestionResult(id=question.id, question=question.question,
+                                started_at=datetime.now().isoformat(timespec="seconds"))
+        start = time.time()
+        try:
+            self.rate_limiter.acquire()
+            thread = self._with_retry(self.agents_client.threads.create)
+            result.thread_id = thread.id
+            self._with_retry(self.agents_client.messages.create,
+                             thread_id=thread.id, role="user", content=question.question)
+
+            def on_message(message: ThreadMessage) -> None:
+                print(f"🤖 [{question.id}] agent message {message.id}")
+
+            # 每个问题独立的同步器：游标与 api_calls 计数不会与其它 worker 混在一起
+            thread_sync = ThreadSync(self.agents_client)
+            # 429 只重试 run 内部的单个 API 调用（runs.get / submit_tool_outputs 等），不会对同一线程重复创建 run
+            driver = RunDriver(self.agents_client, on_requires_action=self.approval_policy, on_message=on_message,
+                               thread_sync=thread_sync, max_retries=self.max_retries)
+            run, metrics = driver.drive(thread_id=thread.id, agent_id=self.agent_id,
+                                        tool_resources=self.tool_resources)
+            result.run_id, result.status = run.id, run.status
+            result.metrics = {"api_calls": metrics.api_calls, "mode": metrics.mode,
+                              "approval_latencies_s": [round(s, 3) for s in metrics.approval_latencies_s]}
+            if run.status == "failed":
+                result.error = str(run.last_error)
+
+            final_message = self._with_retry(self.agents_client.messages.get_last_message_by_role,
+                                             thread_id=thread.id, role=MessageRole.AGENT)
+            if final_message:
+                result.answer = "\n".join(t.text.value for t in final_message.text_messages)
+                result.citations = [{"title": ann.url_citation.title, "url": ann.url_citation.url}
+                                    for ann in final_message.url_citation_annotations]
+            result.tool_calls = _tool_calls_from_steps(thread_sync.iter_new_run_steps(thread.id, run.id))
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+        result.duration_s = round(time.time() - start, 2)
+        print(f"{'✅' if result.status == 'completed' else '❌'} [{question.id}] {result.status or 'error'} "
+              f"in {result.duration_s}s")
+        return result
+
+    def run(self, questions: Iterable[Question], output_path: str) -> List[QuestionResult]:
+        """
+        并发处理问题，每完成一个立即追加写入输出文件
+
+        Args:
+            questions: 问题列表或流（按需读取）
+            output_path: JSONL 输出文件
+
+        Returns:
+            全部结果（按完成顺序）
+        """
+        results: List[QuestionResult] = []
+        questions = iter(questions)
+        with open(output_path, "a", encoding="utf-8") as fp, ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pending = set()
+            exhausted = False
+            while pending or not exhausted:
+                # 只保持 concurrency 个任务在途，流式输入不会被提前读完
+                while not exhausted and len(pending) < self.concurrency:
+                    question = next(questions, None)
+                    if question is None:
+                        exhausted = True
+                    else:
+                        pending.add(executor.submit(self.answer, question))
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    results.append(result)
+                    fp.write(json.dumps(asdict(result), ensure_ascii=False) + "\n")
+                    fp.flush()
+        return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer a batch of questions concurrently with the MCP agent")
+    parser.add_argument("questions", help="Questions file (text or JSONL), or '-' for stdin")
+    parser.add_argument("--output", default=f"answers_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--runs-per-minute", type=float, default=30)
+    parser.add_argument("--policy", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "mcp_approval_policy.json"))
+    parser.add_argument("--queue", default="mcp_approval_queue.jsonl", help="Escalation queue for calls the policy cannot decide")
+    args = parser.parse_args()
+
+    mcp_tool = build_mcp_tool()
+    policy = ApprovalPolicy.from_file(args.policy, escalation=EscalationQueue(args.queue))
+
+    with get_project_client() as project_client:
+        agents_client = project_client.agents
+        agent_id, _, _ = AgentPool(agents_client, warm_threads=0).get_agent_id(
+            model=settings.get("MODEL_DEPLOYMENT_NAME", required=True), name=AGENT_NAME,
+            instructions=AGENT_INSTRUCTIONS, tools=mcp_tool.definitions,
+        )
+        runner = BatchQuestionRunner(agents_client, agent_id, policy, tool_resources=mcp_tool.resources,
+                                     concurrency=args.concurrency, runs_per_minute=args.runs_per_minute)
+
+        source = sys.stdin if args.questions == "-" else open(args.questions, "r", encoding="utf-8")
+        batch_start = time.time()
+        with source:
+            results = runner.run(read_questions(source), args.output)
+
+    completed = sum(r.status == "completed" for r in results)
+    print(f"\n🎉 {completed}/{len(results)} completed in {time.time() - batch_start:.1f}s -> {args.output}")
+    print(f"📊 Approval policy: {policy.stats()}")
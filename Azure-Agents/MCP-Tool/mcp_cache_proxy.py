@@ -0,0 +1,431 @@
+# 本地缓存 MCP 代理
+#
+# agent 的 McpTool 直接指向 https://learn.microsoft.com/api/mcp，每次文档搜索都要走一次网络，
+# 多个对话问到相同问题时也会重复请求。这个代理实现 MCP Streamable HTTP 传输（JSON-RPC over POST）：
+#   - tools/call 按 (工具名, 规范化参数) 缓存结果，支持 TTL 和总大小上限（LRU 淘汰）；tools/list 同样缓存
+#   - 相同的并发调用合并为一次上游请求（single-flight），其余请求等待同一个结果
+#   - 带 Authorization 的请求按凭据哈希隔离缓存与合并，不同调用方之间不会共享结果
+#   - 其他方法（initialize、notifications 等）原样转发，Mcp-Session-Id 双向透传
+#   - 上游返回 text/event-stream 时解析 SSE，取出对应 id 的 JSON-RPC 响应
+#   - GET /stats 查看命中率 / 合并次数 / 上游调用次数
+#
+# 用法:
+#   python mcp_cache_proxy.py serve --port 8765                       # 代理 learn.microsoft.com
+#   python mcp_cache_proxy.py fake-upstream --port 8766 --delay 0.5   # 本地假上游，便于离线测试
+#   python mcp_cache_proxy.py serve --upstream http://127.0.0.1:8766/mcp
+#   python mcp_cache_proxy.py selftest                                # 假上游 + 代理 + 并发请求，打印统计
+#
+# 注意：agent 的工具调用由 Azure 服务端发起，MCP_SERVER_URL 需要指向服务端可访问的地址
+# （例如通过 dev tunnel 暴露本地端口）。
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+DEFAULT_UPSTREAM = "https://learn.microsoft.com/api/mcp"
+SESSION_HEADER = "Mcp-Session-Id"
+CACHEABLE_METHODS = ("tools/call", "tools/list")
+
+
+def _normalize(value: Any) -> Any:
+    """参数规范化：字符串只去首尾空白（内部空白可能有语义，如代码 / 正则），None 字段去掉，dict 按 key 排序"""
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in sorted(value.items()) if v is not None}
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def make_call_key(method: str, params: Optional[Dict[str, Any]], authorization: Optional[str] = None) -> str:
+    """
+    tools/call -> (工具名, 规范化参数)；tools/list -> 分页游标
+
+    Args:
+        authorization: 调用方的 Authorization header；设置时按其哈希区分 key，需要鉴权的上游结果不跨调用方共享
+    """
+    params = params or {}
+    if method == "tools/call":
+        basis = {"tool": params.get("name"), "args": _normalize(params.get("arguments") or {})}
+    else:
+        basis = {"cursor": params.get("cursor")}
+    if authorization:
+        basis["principal"] = hashlib.sha256(authorization.encode("utf-8")).hexdigest()
+    canonical = json.dumps({"method": method, **basis}, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def parse_sse_response(text: str, request_id: Any) -> Optional[Dict[str, Any]]:
+    """从 SSE 响应中取出与 request_id 对应的 JSON-RPC 消息"""
+    data_lines = []
+    for line in text.splitlines() + [""]:
+        if line.startswith("data:"):
+            data_lines.append(line[5:].lstrip())
+        elif not line and data_lines:
+            try:
+                message = json.loads("\n".join(data_lines))
+            except ValueError:
+                message = None
+            data_lines = []
+            if isinstance(message, dict) and message.get("id") == request_id:
+                return message
+    return None
+
+
+@dataclass
+class ProxyStats:
+    requests: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    deduplicated: int = 0
+    upstream_calls: int = 0
+    upstream_errors: int = 0
+    evictions: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        lookups = self.cache_hits + self.cache_misses + self.deduplicated
+        return {**self.__dict__, "hit_ratio": round((self.cache_hits + self.deduplicated) / lookups, 3) if lookups else 0.0}
+
+
+class TTLCache:
+    """带 TTL 和总字节数上限的 LRU 缓存"""
+
+    def __init__(self, ttl_s: float = 3600, max_bytes: int = 64 * 1024 * 1024, max_entries: int = 10000):
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.total_bytes = 0
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, payload = entry
+            if time.time() - stored_at > self.ttl_s:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def put(self, key: str, payload: bytes) -> int:
+        """写入并返回被淘汰的条目数；单条超过上限时不缓存"""
+        if len(payload) > self.max_bytes:
+            return 0
+        evicted = 0
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time(), payload)
+            self.total_bytes += len(payload)
+            while self.total_bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                evicted += 1
+        return evicted
+
+    def _remove(self, key: str) -> None:
+        _, payload = self._entries.pop(key)
+        self.total_bytes -= len(payload)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class _InFlight:
+    """一次正在进行的上游调用，重复请求等待它的结果"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[Exception] = None
+
+
+class CachingMcpProxy:
+    """转发 JSON-RPC 到上游 MCP server，并缓存 / 合并工具调用"""
+
+    def __init__(self, upstream_url: str = DEFAULT_UPSTREAM, cache: Optional[TTLCache] = None, timeout: float = 60):
+        """
+        Args:
+            upstream_url: 上游 MCP endpoint
+            cache: 结果缓存，默认 1 小时 TTL / 64MB
+            timeout: 上游请求超时（秒）
+        """
+        self.upstream_url = upstream_url
+        self.cache = cache or TTLCache()
+        self.timeout = timeout
+        self.stats = ProxyStats()
+        self._inflight: Dict[str, _InFlight] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def forward(self, body: bytes, headers: Dict[str, str], method: str = "POST") -> requests.Response:
+        """原样转发到上游"""
+        with self._lock:
+            self.stats.upstream_calls += 1
+        forward_headers = {
+            "Content-Type": headers.get("Content-Type", "application/json"),
+            "Accept": headers.get("Accept", "application/json, text/event-stream"),
+        }
+        for name in (SESSION_HEADER, "Mcp-Protocol-Version", "Authorization"):
+            if headers.get(name):
+                forward_headers[name] = headers[name]
+        return self._session().request(method, self.upstream_url, data=body, headers=forward_headers, timeout=self.timeout)
+
+    def _call_upstream(self, message: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+        response = self.forward(json.dumps(message).encode("utf-8"), headers)
+        response.raise_for_status()
+        if "text/event-stream" in response.headers.get("Content-Type", ""):
+            result = parse_sse_response(response.text, message.get("id"))
+            if result is None:
+                raise ValueError("Upstream SSE stream ended without a response")
+            return result
+        return response.json()
+
+    def handle_cacheable(self, message: Dict[str, Any], headers: Dict[str, str]) -> Tuple[Dict[str, Any], str]:
+        """
+        处理 tools/call / tools/list
+
+        Returns:
+            (JSON-RPC 响应，id 已替换为调用方的 id, 来源 hit / miss / dedup)
+        """
+        key = make_call_key(message["method"], message.get("params"), headers.get("Authorization"))
+        cached = self.cache.get(key)
+        if cached is not None:
+            with self._lock:
+                self.stats.cache_hits += 1
+            return {**json.loads(cached), "id": message.get("id")}, "hit"
+
+        with self._lock:
+            inflight = self._inflight.get(key)
+            leader = inflight is None
+            if leader:
+                inflight = self._inflight[key] = _InFlight()
+                self.stats.cache_misses += 1
+            else:
+                self.stats.deduplicated += 1
+
+        if leader:
+            try:
+                inflight.result = self._call_upstream(message, headers)
+                result = inflight.result.get("result") or {}
+                # 错误结果不缓存，下次重新请求
+                if "error" not in inflight.result and not result.get("isError"):
+                    evicted = self.cache.put(key, json.dumps(inflight.result).encode("utf-8"))
+                    with self._lock:
+                        self.stats.evictions += evicted
+            except Exception as e:
+                inflight.error = e
+                with self._lock:
+                    self.stats.upstream_errors += 1
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                inflight.done.set()
+        else:
+            inflight.done.wait(self.timeout)
+
+        if inflight.result is None:
+            error = inflight.error or TimeoutError("Timed out waiting for in-flight upstream call")
+            return {"jsonrpc": "2.0", "id": message.get("id"),
+                    "error": {"code": -32603, "message": f"Upstream call failed: {error}"}}, "error"
+        return {**inflight.result, "id": message.get("id")}, "miss" if leader else "dedup"
+
+
+def make_handler(proxy: CachingMcpProxy):
+    class ProxyHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):  # 只打印自定义日志
+            pass
+
+        def _send(self, status: int, body: bytes, content_type: str = "application/json",
+                  extra_headers: Optional[Dict[str, str]] = None) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (extra_headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/stats":
+                payload = {**proxy.stats.to_dict(), "entries": len(proxy.cache), "cache_bytes": proxy.cache.total_bytes}
+                self._send(200, json.dumps(payload).encode("utf-8"))
+            else:
+                # 不提供服务端主动推送的 SSE 流（规范允许返回 405）
+                self._send(405, b"", extra_headers={"Allow": "POST, DELETE"})
+
+        def do_DELETE(self):
+            response = proxy.forward(b"", CaseInsensitiveDict(self.headers), method="DELETE")
+            self._send(response.status_code, response.content, response.headers.get("Content-Type", "application/json"))
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            with proxy._lock:
+                proxy.stats.requests += 1
+            try:
+                message = json.loads(body or b"null")
+            except ValueError:
+                message = None
+
+            if isinstance(message, dict) and message.get("method") in CACHEABLE_METHODS and "id" in message:
+                start = time.time()
+                result, source = proxy.handle_cacheable(message, CaseInsensitiveDict(self.headers))
+                name = (message.get("params") or {}).get("name") or message["method"]
+                print(f"🔁 {source:<5} {name} ({time.time() - start:.3f}s)")
+                extra = {SESSION_HEADER: self.headers[SESSION_HEADER]} if self.headers.get(SESSION_HEADER) else None
+                self._send(200, json.dumps(result).encode("utf-8"), extra_headers=extra)
+                return
+
+            # initialize / notifications / 批量请求等原样转发
+            try:
+                response = proxy.forward(body, CaseInsensitiveDict(self.headers))
+            except requests.RequestException as e:
+                self._send(502, json.dumps({"error": str(e)}).encode("utf-8"))
+                return
+            extra = {SESSION_HEADER: response.headers[SESSION_HEADER]} if response.headers.get(SESSION_HEADER) else None
+            self._send(response.status_code, response.content,
+                       response.headers.get("Content-Type", "application/json"), extra_headers=extra)
+
+    return ProxyHandler
+
+
+def make_fake_upstream_handler(delay_s: float = 0.5):
+    """本地假上游：回显工具名和参数，用固定延迟模拟网络与检索耗时"""
+    counter = {"tools/call": 0}
+    lock = threading.Lock()
+
+    class FakeUpstreamHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            message = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"null")
+            method = message.get("method") if isinstance(message, dict) else None
+            if method == "initialize":
+                result = {"protocolVersion": "2025-03-26", "capabilities": {"tools": {}},
+                          "serverInfo": {"name": "fake-mslearn", "version": "0.1"}}
+            elif method == "tools/list":
+                result = {"tools": [{"name": "microsoft_docs_search", "inputSchema": {"type": "object"}}]}
+            elif method == "tools/call":
+                with lock:
+                    counter["tools/call"] += 1
+                time.sleep(delay_s)
+                result = {"content": [{"type": "text", "text": json.dumps(message["params"], ensure_ascii=False)}]}
+            else:  # notification
+                self.send_response(202)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = json.dumps({"jsonrpc": "2.0", "id": message.get("id"), "result": result}).encode("utf-8")
+            # 以 SSE 返回，与真实 endpoint 一致
+            sse = b"event: message\ndata: " + body + b"\n\n"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header(SESSION_HEADER, "fake-session")
+            self.send_header("Content-Length", str(len(sse)))
+            self.end_headers()
+            self.wfile.write(sse)
+
+    FakeUpstreamHandler.counter = counter
+    return FakeUpstreamHandler
+
+
+def start_server(handler, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """在后台线程启动 HTTP server，port=0 时自动分配端口"""
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_selftest(concurrency: int = 8, delay_s: float = 0.5) -> Dict[str, Any]:
+    """假上游 + 代理：并发发送相同 / 不同的 tools/call，验证缓存与合并"""
+    fake_handler = make_fake_upstream_handler(delay_s)
+    upstream = start_server(fake_handler)
+    proxy = CachingMcpProxy(f"http://127.0.0.1:{upstream.server_address[1]}/mcp")
+    proxy_server = start_server(make_handler(proxy))
+    proxy_url = f"http://127.0.0.1:{proxy_server.server_address[1]}/mcp"
+
+    def call(i: int, query: str) -> float:
+        start = time.time()
+        payload = {"jsonrpc": "2.0", "id": i, "method": "tools/call",
+                   "params": {"name": "microsoft_docs_search", "arguments": {"query": query}}}
+        response = requests.post(proxy_url, json=payload, timeout=30)
+        assert response.json()["id"] == i
+        return time.time() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # 首尾空白不同的同一问题规范化后命中同一个 key
+        first_wave = list(executor.map(call, range(concurrency), ["AI Foundry updates"] * (concurrency - 1) + [" AI Foundry updates "]))
+    second_wave = [call(100 + i, q) for i, q in enumerate(["AI Foundry updates", "Azure OpenAI quotas"])]
+
+    report = {
+        **proxy.stats.to_dict(),
+        "upstream_tool_calls": fake_handler.counter["tools/call"],
+        "first_wave_max_s": round(max(first_wave), 3),
+        "cached_call_s": round(second_wave[0], 3),
+        "new_query_s": round(second_wave[1], 3),
+    }
+    proxy_server.shutdown()
+    upstream.shutdown()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Caching proxy for MCP tool calls")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Run the caching proxy")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--upstream", default=DEFAULT_UPSTREAM)
+    serve_parser.add_argument("--ttl", type=float, default=3600, help="Cache TTL in seconds")
+    serve_parser.add_argument("--max-mb", type=float, default=64, help="Cache size limit in MB")
+
+    fake_parser = subparsers.add_parser("fake-upstream", help="Run a local fake MCP server")
+    fake_parser.add_argument("--host", default="127.0.0.1")
+    fake_parser.add_argument("--port", type=int, default=8766)
+    fake_parser.add_argument("--delay", type=float, default=0.5)
+
+    selftest_parser = subparsers.add_parser("selftest", help="Exercise the proxy against a fake upstream")
+    selftest_parser.add_argument("--concurrency", type=int, default=8)
+    selftest_parser.add_argument("--delay", type=float, default=0.5)
+
+    args = parser.parse_args()
+    if args.command == "selftest":
+        print(json.dumps(run_selftest(args.concurrency, args.delay), indent=2))
+    else:
+        if args.command == "serve":
+            cache = TTLCache(ttl_s=args.ttl, max_bytes=int(args.max_mb * 1024 * 1024))
+            handler = make_handler(CachingMcpProxy(args.upstream, cache))
+            print(f"🚀 MCP cache proxy on http://{args.host}:{args.port}/mcp -> {args.upstream}")
+        else:
+            handler = make_fake_upstream_handler(args.delay)
+            print(f"🧪 Fake MCP upstream on http://{args.host}:{args.port}/mcp")
+        server = ThreadingHTTPServer((args.host, args.port), handler)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.shutdown()
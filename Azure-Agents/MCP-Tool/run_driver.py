@@ -0,0 +1,283 @@
+# Agent run 驱动器：优先使用流式事件，不可用时退回自适应指数轮询
+#
+# 原来的 process_agent_run 固定 time.sleep(2) + runs.get，并且每轮都调用一次
+# fetch_and_print_new_agent_response，每次轮询就是两次 API 调用，状态变化最多延迟 2 秒才被看到。
+# RunDriver:
+#   - 流式模式：runs.stream 推送 thread.message.completed / thread.run.requires_action 等事件，
+#     审批结果通过 submit_tool_outputs_stream 提交后继续在同一个事件流上消费
+#   - 轮询模式：间隔从 min_interval 开始，状态不变时按 backoff 倍数增长到 max_interval，
+#     状态变化或提交审批后重置；只在状态变化时才拉取最新的 agent 消息
+#   - 统计每个 run 的 API 调用次数，以及每次 requires_action 从出现到审批提交完成的耗时
+#   - 传入 ThreadSync 时，轮询模式按游标只拉取新消息（不会漏掉两次轮询之间产生的多条回复）；
+#     流式模式结束（或退回轮询）时也推进一次游标，已通过事件输出的消息不会在之后的轮询中重复输出
+#   - max_retries > 0 时，单个 API 调用遇到 429 按 Retry-After 重试；只重试该调用本身，不会重新创建 run
+
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Collection, List, Optional, Set
+
+from azure.ai.agents import AgentsClient
+from azure.ai.agents.models import (
+    AgentStreamEvent,
+    MessageRole,
+    SubmitToolApprovalAction,
+    ThreadMessage,
+    ThreadRun,
+    ToolApproval,
+)
+from azure.core.exceptions import HttpResponseError
+
+from thread_sync import ThreadSync
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled", "expired", "incomplete")
+
+# requires_action 时调用，返回需要提交的审批列表（为空表示不提交）
+ApprovalHandler = Callable[[ThreadRun], List[ToolApproval]]
+# 收到新的 agent 消息时调用
+MessageHandler = Callable[[ThreadMessage], None]
+
+
+def retry_after_seconds(error: HttpResponseError, attempt: int) -> float:
+    """429 响应的等待时间：优先使用 Retry-After，否则指数退避"""
+    headers = getattr(error.response, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After") or headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return min(2 ** attempt, 60)
+
+
+def call_with_retry(fn: Callable[..., Any], *args: Any, max_retries: int = 0,
+                    on_attempt: Optional[Callable[[], None]] = None, **kwargs: Any) -> Any:
+    """
+    调用一次 API，遇到 429 时等待后重试同一个调用
+
+    Args:
+        fn: SDK 方法
+        max_retries: 最大重试次数（0 表示不重试）
+        on_attempt: 每次实际发起调用前的回调（用于统计 API 调用次数）
+    """
+    for attempt in range(max_retries + 1):
+        if on_attempt:
+            on_attempt()
+        try:
+            return fn(*args, **kwargs)
+        except HttpResponseError as e:
+            if e.status_code != 429 or attempt == max_retries:
+                raise
+            delay = retry_after_seconds(e, attempt)
+            print(f"⏳ Rate limited (429) on {getattr(fn, '__name__', 'call')}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+@dataclass
+class RunMetrics:
+    """单个 run 的统计"""
+    run_id: Optional[str] = None
+    mode: str = "stream"
+    status: Optional[str] = None
+    api_calls: int = 0
+    polls: int = 0
+    events: int = 0
+    approval_latencies_s: List[float] = field(default_factory=list)
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    @property
+    def duration_s(self) -> float:
+        return (self.finished_at or time.time()) - self.started_at
+
+    def summary(self) -> str:
+        approvals = ", ".join(f"{s:.2f}s" for s in self.approval_latencies_s) or "-"
+        return (f"run={self.run_id} mode={self.mode} status={self.status} duration={self.duration_s:.1f}s "
+                f"api_calls={self.api_calls} polls={self.polls} events={self.events} "
+                f"requires_action->approval_submitted=[{approvals}]")
+
+
+def print_agent_message(message: ThreadMessage) -> None:
+    """与 fetch_and_print_new_agent_response 相同的输出格式"""
+    print(f"\n===================== 🤖 Agent response with lastest_agent_message id: {message.id} ===========================")
+    print("\n".join(t.text.value for t in message.text_messages))
+    for ann in message.url_citation_annotations:
+        print(f"****** 🛜 URL Citation ******:\n   [{ann.url_citation.title}]({ann.url_citation.url})")
+
+
+class RunDriver:
+    """驱动一个 agent run 直到结束，处理工具审批"""
+
+    def __init__(
+        self,
+        agents_client: AgentsClient,
+        on_requires_action: ApprovalHandler,
+        on_message: MessageHandler = print_agent_message,
+        use_streaming: bool = True,
+        min_interval: float = 0.25,
+        max_interval: float = 5.0,
+        backoff: float = 1.6,
+        thread_sync: Optional[ThreadSync] = None,
+        max_retries: int = 0,
+    ):
+        """
+        Args:
+            agents_client: AgentsClient
+            on_requires_action: 处理 SubmitToolApprovalAction，返回 ToolApproval 列表
+            on_message: 新 agent 消息回调
+            use_streaming: 是否优先使用流式事件
+            min_interval / max_interval / backoff: 轮询模式下的自适应间隔参数（秒）
+            thread_sync: 可选的增量同步器，轮询模式下用它拉取新的 agent 消息
+            max_retries: 单个 API 调用遇到 429 时的最大重试次数
+        """
+        self.agents_client = agents_client
+        self.on_requires_action = on_requires_action
+        self.on_message = on_message
+        self.use_streaming = use_streaming
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.thread_sync = thread_sync
+        self.max_retries = max_retries
+
+    def _call(self, metrics: RunMetrics, fn: Callable[..., Any], **kwargs: Any) -> Any:
+        def count() -> None:
+            metrics.api_calls += 1
+        return call_with_retry(fn, max_retries=self.max_retries, on_attempt=count, **kwargs)
+
+    def drive(self, thread_id: str, agent_id: str, **run_kwargs: Any) -> tuple:
+        """
+        创建 run 并驱动到终态
+
+        Args:
+            thread_id: 线程 ID（用户消息需已创建）
+            agent_id: agent ID
+            run_kwargs: 透传给 runs.create / runs.stream（例如 tool_resources）
+
+        Returns:
+            (最终的 ThreadRun, RunMetrics)
+        """
+        metrics = RunMetrics()
+        run = None
+        if self.use_streaming:
+            streamed: Set[str] = set()
+            try:
+                run = self._drive_stream(thread_id, agent_id, metrics, streamed, **run_kwargs)
+            except (AttributeError, NotImplementedError, TypeError, ValueError) as e:
+                # SDK 版本不支持流式 / 流式审批提交时退回轮询
+                print(f"⚠️ Streaming unavailable ({type(e).__name__}: {e}), falling back to polling")
+                run = None if metrics.run_id is None else self._get_run(thread_id, metrics.run_id, metrics)
+            if self.thread_sync is not None:
+                # 流式事件不经过游标：推进一次，只补发事件流中没有输出过的消息
+                self._sync_messages(thread_id, metrics, skip_ids=streamed)
+
+        if run is None or run.status not in TERMINAL_STATUSES:
+            metrics.mode = "poll" if metrics.run_id is None else "stream+poll"
+            run = self._drive_poll(thread_id, agent_id, metrics, run, **run_kwargs)
+
+        metrics.status = run.status
+        metrics.finished_at = time.time()
+        return run, metrics
+
+    def _get_run(self, thread_id: str, run_id: str, metrics: RunMetrics) -> ThreadRun:
+        return self._call(metrics, self.agents_client.runs.get, thread_id=thread_id, run_id=run_id)
+
+    def _approvals_for(self, run: ThreadRun) -> List[ToolApproval]:
+        if isinstance(run.required_action, SubmitToolApprovalAction):
+            return self.on_requires_action(run)
+        print(f"Required action type: {run.required_action.type if run.required_action else 'None'}")
+        return []
+
+    def _drive_stream(self, thread_id: str, agent_id: str, metrics: RunMetrics, streamed: Set[str],
+                      **run_kwargs: Any) -> Optional[ThreadRun]:
+        final_run = None
+        with self._call(metrics, self.agents_client.runs.stream, thread_id=thread_id, agent_id=agent_id,
+                        **run_kwargs) as stream:
+            for event_type, event_data, _ in stream:
+                metrics.events += 1
+                if isinstance(event_data, ThreadRun):
+                    metrics.run_id = event_data.id
+                    final_run = event_data
+
+                if event_type == AgentStreamEvent.THREAD_RUN_REQUIRES_ACTION:
+                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                    print(f"\n\n🔄🔄🔄 Run status: {event_data.status} at {timestamp}")
+                    requires_action_at = time.time()
+                    approvals = self._approvals_for(event_data)
+                    if approvals:
+                        self._call(
+                            metrics, self.agents_client.runs.submit_tool_outputs_stream,
+                            thread_id=thread_id,
+                            run_id=event_data.id,
+                            tool_approvals=approvals,
+                            event_handler=stream,
+                        )
+                        metrics.approval_latencies_s.append(time.time() - requires_action_at)
+                        print("Tool approvals submitted!")
+                elif event_type == AgentStreamEvent.THREAD_MESSAGE_COMPLETED and event_data.role == MessageRole.AGENT:
+                    self.on_message(event_data)
+                    streamed.add(event_data.id)
+                elif event_type == AgentStreamEvent.ERROR:
+                    print(f"Stream error: {event_data}")
+                elif event_type == AgentStreamEvent.DONE:
+                    break
+        return final_run
+
+    def _drive_poll(self, thread_id: str, agent_id: str, metrics: RunMetrics,
+                    run: Optional[ThreadRun] = None, **run_kwargs: Any) -> ThreadRun:
+        if run is None:
+            run = self._call(metrics, self.agents_client.runs.create, thread_id=thread_id, agent_id=agent_id,
+                             **run_kwargs)
+            metrics.run_id = run.id
+
+        interval = self.min_interval
+        last_status = None
+        last_message_id = None
+        requires_action_at = None
+        while run.status not in TERMINAL_STATUSES:
+            if run.status == "requires_action":
+                requires_action_at = requires_action_at or time.time()
+                approvals = self._approvals_for(run)
+                if approvals:
+                    print("Submitting tool approvals...")
+                    self._call(
+                        metrics, self.agents_client.runs.submit_tool_outputs,
+                        thread_id=thread_id, run_id=run.id, tool_approvals=approvals,
+                    )
+                    metrics.approval_latencies_s.append(time.time() - requires_action_at)
+                    requires_action_at = None
+                    print("Tool approvals submitted!")
+                    interval = self.min_interval
+
+            time.sleep(interval)
+            run = self._get_run(thread_id, run.id, metrics)
+            metrics.polls += 1
+
+            if run.status != last_status:
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                print(f"\n\n🔄🔄🔄 Run status: {run.status} at {timestamp}")
+                last_status = run.status
+                interval = self.min_interval
+                last_message_id = self._fetch_new_message(thread_id, last_message_id, metrics)
+            else:
+                interval = min(interval * self.backoff, self.max_interval)
+        return run
+
+    def _sync_messages(self, thread_id: str, metrics: RunMetrics, skip_ids: Collection[str] = ()) -> Optional[str]:
+        """按游标拉取新消息并推进游标，返回最后一条输出的 agent 消息 ID"""
+        last_message_id = None
+        calls_before = self.thread_sync.api_calls
+        for message in self.thread_sync.iter_new_messages(thread_id, consumer="run_driver"):
+            if message.role == MessageRole.AGENT and message.id not in skip_ids:
+                self.on_message(message)
+                last_message_id = message.id
+        metrics.api_calls += self.thread_sync.api_calls - calls_before
+        return last_message_id
+
+    def _fetch_new_message(self, thread_id: str, last_message_id: Optional[str], metrics: RunMetrics) -> Optional[str]:
+        if self.thread_sync is not None:
+            return self._sync_messages(thread_id, metrics) or last_message_id
+
+        message = self._call(metrics, self.agents_client.messages.get_last_message_by_role,
+                             thread_id=thread_id, role=MessageRole.AGENT)
+        if not message or message.id == last_message_id:
+            return last_message_id
+        self.on_message(message)
+        return message.id
@@ -0,0 +1,106 @@
+# 线程消息 / run step 的增量同步
+#
+# 原脚本结束时用 messages.list 列出线程的全部消息，每个 run 结束后遍历全部 run_steps，
+# 线程越长每次拉取的量越大。ThreadSync 为每个线程（以及每个 run 的 step）记录游标：
+#   - 以 order="asc" 从游标之后开始分页（游标作为 after 传给服务端），只拉取比游标新的对象
+#   - 生成器惰性翻页，调用方停止迭代时不会请求后续页面
+#   - 仍处于 in_progress 的消息 / step 不推进游标，下次同步时会重新拿到其最终内容
+#   - 游标保存在内存中，可选落盘到 JSON 文件，重启后继续增量同步
+#
+# 同一线程可以有多个互不影响的消费者（consumer），例如 RunDriver 取新的 agent 回复与 run 结束后打印 run step。
+# 游标只适合增量消费；需要完整对话记录时仍直接用 messages.list。
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+from azure.ai.agents import AgentsClient
+from azure.ai.agents.models import RunStep, ThreadMessage
+
+PENDING_STATUSES = ("in_progress",)
+
+
+class SyncState:
+    """游标存储：consumer/thread[/run] -> 最后一个已消费对象的 ID"""
+
+    def __init__(self, path: Optional[Path] = None):
+        """
+        Args:
+            path: 可选的 JSON 持久化文件，None 表示只保存在内存中
+        """
+        self.path = Path(path) if path else None
+        self._lock = threading.Lock()
+        self.cursors: Dict[str, str] = {}
+        if self.path and self.path.exists():
+            self.cursors.update(json.loads(self.path.read_text(encoding="utf-8")))
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self.cursors.get(key)
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self.cursors[key] = value
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            payload = json.dumps(self.cursors, indent=2)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(payload, encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+
+class ThreadSync:
+    """按游标增量拉取线程消息和 run step"""
+
+    def __init__(self, agents_client: AgentsClient, state: Optional[SyncState] = None, page_size: int = 100):
+        """
+        Args:
+            agents_client: AgentsClient
+            state: 游标存储，默认仅内存
+            page_size: 每页数量（服务端上限 100）
+        """
+        self.agents_client = agents_client
+        self.state = state or SyncState()
+        self.page_size = page_size
+        self.api_calls = 0
+
+    def _iter_after(self, paged: Any, key: str) -> Iterator[Any]:
+        """从游标之后惰性翻页，逐个产出已完成的对象并推进游标"""
+        try:
+            for page in paged.by_page(continuation_token=self.state.get(key)):
+                self.api_calls += 1
+                for item in page:
+                    if getattr(item, "status", None) in PENDING_STATUSES:
+                        # 之后的对象要等这个对象完成后再一起同步，保持游标单调
+                        return
+                    self.state.set(key, item.id)
+                    yield item
+        finally:
+            self.state.save()
+
+    def iter_new_messages(self, thread_id: str, consumer: str = "default") -> Iterator[ThreadMessage]:
+        """
+        产出游标之后的新消息（按创建时间升序）
+
+        Args:
+            thread_id: 线程 ID
+            consumer: 游标命名空间，不同用途各自维护进度
+        """
+        paged = self.agents_client.messages.list(thread_id=thread_id, order="asc", limit=self.page_size)
+        return self._iter_after(paged, f"{consumer}:{thread_id}")
+
+    def iter_new_run_steps(self, thread_id: str, run_id: str, consumer: str = "default") -> Iterator[RunStep]:
+        """产出某个 run 中游标之后的新 step（按创建时间升序）"""
+        paged = self.agents_client.run_steps.list(thread_id=thread_id, run_id=run_id, order="asc", limit=self.page_size)
+        return self._iter_after(paged, f"{consumer}:{thread_id}:{run_id}")
+
+    def reset(self, thread_id: str, consumer: str = "default") -> None:
+        """清除某个线程的消息游标（下次从头同步）"""
+        with self.state._lock:
+            self.state.cursors.pop(f"{consumer}:{thread_id}", None)
+        self.state.save()
@@ -0,0 +1,340 @@
+# Deep Research 线程的本地归档（SQLite + 全文检索）
+#
+# notebook 里回看报告要用硬编码的 thread_id / message_id 调用 print_agent_message_by_id，
+# 每条消息一次网络往返；create_research_summary 也只能导出单个文件。
+# ResearchArchive 把线程、消息和 url_citation_annotations 增量同步到本地 SQLite：
+#   - 每个线程记录最后一条已同步消息的 ID 作为游标，再次同步时只拉取游标之后的消息
+#     （仍在生成中的消息不推进游标，下次同步时拿到最终内容）
+#   - 消息正文建 FTS5 索引（trigram 分词，中英文都可以子串检索），搜索结果按 bm25 排序并带摘要片段
+#   - 回看 / 导出报告直接读本地库，不再访问服务端
+#
+# 用法:
+#   python research_archive.py sync thread_Dv168AXLirnEa3nDftDz5GvB   # 同步指定线程
+#   python research_archive.py sync --all                             # 同步项目中的全部线程
+#   python research_archive.py search "Azure AI Foundry 更新"
+#   python research_archive.py show thread_xxx [--message msg_xxx]
+#   python research_archive.py export msg_xxx                          # 生成与 create_research_summary 相同格式的 markdown
+
+import argparse
+import itertools
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+DEFAULT_DB_PATH = Path(__file__).resolve().parent / "research_archive.sqlite"
+
+
+@dataclass
+class SearchHit:
+    thread_id: str
+    message_id: str
+    role: str
+    created_at: float
+    snippet: str
+    score: float
+
+
+@dataclass
+class SyncResult:
+    threads: int = 0
+    new_messages: int = 0
+    new_citations: int = 0
+    api_pages: int = 0
+    seconds: float = 0.0
+
+
+def _timestamp(value: Any) -> float:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value or 0)
+
+
+def _message_text(message: Any) -> str:
+    return "\n\n".join(t.text.value.strip() for t in message.text_messages)
+
+
+class ResearchArchive:
+    """线程 / 消息 / 引用的本地镜像"""
+
+    def __init__(self, db_path: Path = DEFAULT_DB_PATH):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._init_schema()
+
+    def _init_schema(self) -> None:
+        with self._lock, self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS threads (
+                    thread_id TEXT PRIMARY KEY,
+                    created_at REAL,
+                    metadata TEXT,
+                    cursor_message_id TEXT,
+                    synced_at REAL
+                );
+                CREATE TABLE IF NOT EXISTS messages (
+                    message_id TEXT PRIMARY KEY,
+                    thread_id TEXT NOT NULL,
+                    run_id TEXT,
+                    role TEXT,
+                    status TEXT,
+                    created_at REAL,
+                    text TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_messages_thread ON messages(thread_id, created_at);
+                CREATE TABLE IF NOT EXISTS citations (
+                    message_id TEXT NOT NULL,
+                    thread_id TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    title TEXT,
+                    start_index INTEGER,
+                    end_index INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS idx_citations_message ON citations(message_id);
+                CREATE INDEX IF NOT EXISTS idx_citations_url ON citations(url);
+            """)
+            try:
+                self.conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+                                  "text, content='messages', content_rowid='rowid', tokenize='trigram')")
+            except sqlite3.OperationalError:
+                # 旧版 SQLite 没有 trigram 分词器
+                self.conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+                                  "text, content='messages', content_rowid='rowid')")
+
+    # ---------- 同步 ----------
+
+    def _iter_messages_after(self, agents_client: Any, thread_id: str, cursor: Optional[str],
+                             result: SyncResult) -> Iterator[Any]:
+        paged = agents_client.messages.list(thread_id=thread_id, order="asc", limit=100)
+        for page in paged.by_page(continuation_token=cursor):
+            result.api_pages += 1
+            for message in page:
+                if message.status == "in_progress":
+                    return
+                yield message
+
+    def sync_thread(self, agents_client: Any, thread_id: str, result: Optional[SyncResult] = None) -> SyncResult:
+        """
+        增量同步一个线程
+
+        Args:
+            agents_client: AgentsClient
+            thread_id: 线程 ID
+            result: 累加统计用（sync_all 共享）
+        """
+        result = result or SyncResult()
+        start = time.time()
+        row = self.conn.execute("SELECT cursor_message_id FROM threads WHERE thread_id = ?", (thread_id,)).fetchone()
+        cursor = row["cursor_message_id"] if row else None
+        if row is None:
+            thread = agents_client.threads.get(thread_id)
+            with self._lock, self.conn:
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO threads (thread_id, created_at, metadata) VALUES (?, ?, ?)",
+                    (thread_id, _timestamp(thread.created_at), json.dumps(thread.metadata or {}, ensure_ascii=False)),
+                )
+
+        for message in self._iter_messages_after(agents_client, thread_id, cursor, result):
+            result.new_citations += self._store_message(thread_id, message)
+            result.new_messages += 1
+            cursor = message.id
+            with self._lock, self.conn:
+                self.conn.execute("UPDATE threads SET cursor_message_id = ? WHERE thread_id = ?", (cursor, thread_id))
+
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE threads SET synced_at = ? WHERE thread_id = ?", (time.time(), thread_id))
+        result.threads += 1
+        result.seconds += time.time() - start
+        return result
+
+    def _store_message(self, thread_id: str, message: Any) -> int:
+        text = _message_text(message)
+        citations = [
+            (message.id, thread_id, ann.url_citation.url, ann.url_citation.title, ann.start_index, ann.end_index)
+            for ann in message.url_citation_annotations
+        ]
+        with self._lock, self.conn:
+            old = self.conn.execute("SELECT rowid, text FROM messages WHERE message_id = ?", (message.id,)).fetchone()
+            if old:
+                self.conn.execute("INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', ?, ?)",
+                                  (old["rowid"], old["text"]))
+                self.conn.execute("DELETE FROM messages WHERE message_id = ?", (message.id,))
+                self.conn.execute("DELETE FROM citations WHERE message_id = ?", (message.id,))
+            role = message.role.value if hasattr(message.role, "value") else str(message.role)
+            rowid = self.conn.execute(
+                "INSERT INTO messages (message_id, thread_id, run_id, role, status, created_at, text) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (message.id, thread_id, message.run_id, role, message.status, _timestamp(message.created_at), text),
+            ).lastrowid
+            self.conn.execute("INSERT INTO messages_fts (rowid, text) VALUES (?, ?)", (rowid, text))
+            self.conn.executemany(
+                "INSERT INTO citations (message_id, thread_id, url, title, start_index, end_index) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                citations,
+            )
+        return len(citations)
+
+    def sync_all(self, agents_client: Any, limit: int = 100) -> SyncResult:
+        """同步服务端最近的 limit 个线程，以及本地已归档的全部线程"""
+        result = SyncResult()
+        # threads.list 返回自动翻页的 ItemPaged，用 islice 在取满 limit 个后停止，不再遍历项目中的全部线程
+        recent = itertools.islice(agents_client.threads.list(limit=min(limit, 100), order="desc"), limit)
+        thread_ids = [t.id for t in recent]
+        known = [row["thread_id"] for row in self.conn.execute("SELECT thread_id FROM threads")]
+        for thread_id in dict.fromkeys(thread_ids + known):
+            self.sync_thread(agents_client, thread_id, result)
+        return result
+
+    # ---------- 本地查询 ----------
+
+    def search(self, query: str, thread_id: Optional[str] = None, limit: int = 20) -> List[SearchHit]:
+        """
+        全文检索消息
+
+        Args:
+            query: 检索词（trigram 分词下至少 3 个字符，更短时退回 LIKE）
+            thread_id: 只在某个线程中检索
+            limit: 返回条数
+        """
+        thread_filter = "AND m.thread_id = ?" if thread_id else ""
+        thread_args = [thread_id] if thread_id else []
+        if len(query) >= 3:
+            fts_query = '"' + query.replace('"', '""') + '"'
+            sql = f"""
+                SELECT m.thread_id, m.message_id, m.role, m.created_at,
+                       snippet(messages_fts, 0, '[', ']', '…', 16) AS snippet,
+                       bm25(messages_fts) AS score
+                FROM messages_fts JOIN messages m ON m.rowid = messages_fts.rowid
+                WHERE messages_fts MATCH ? {thread_filter}
+                ORDER BY score LIMIT ?
+            """
+            rows = self.conn.execute(sql, [fts_query] + thread_args + [limit]).fetchall()
+        else:
+            sql = f"""
+                SELECT m.thread_id, m.message_id, m.role, m.created_at,
+                       substr(m.text, max(instr(m.text, ?) - 30, 1), 80) AS snippet, 0.0 AS score
+                FROM messages m WHERE m.text LIKE ? {thread_filter}
+                ORDER BY m.created_at DESC LIMIT ?
+            """
+            rows = self.conn.execute(sql, [query, f"%{query}%"] + thread_args + [limit]).fetchall()
+        return [SearchHit(**dict(row)) for row in rows]
+
+    def get_message(self, message_id: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute("SELECT * FROM messages WHERE message_id = ?", (message_id,)).fetchone()
+        if row is None:
+            return None
+        message = dict(row)
+        message["citations"] = [dict(c) for c in self.conn.execute(
+            "SELECT url, title, start_index, end_index FROM citations WHERE message_id = ? ORDER BY rowid", (message_id,)
+        )]
+        return message
+
+    def thread_messages(self, thread_id: str, role: Optional[str] = None) -> List[Dict[str, Any]]:
+        sql = "SELECT message_id FROM messages WHERE thread_id = ?" + (" AND role = ?" if role else "") + " ORDER BY created_at"
+        args = (thread_id, role) if role else (thread_id,)
+        return [self.get_message(row["message_id"]) for row in self.conn.execute(sql, args).fetchall()]
+
+    def print_message(self, message: Dict[str, Any]) -> None:
+        """与 print_agent_message_by_id 相同的输出格式，但读取本地库"""
+        print(f"\n===================== 🤖 Agent message info, id: {message['message_id']} ===========================")
+        print(message["text"])
+        for citation in message["citations"]:
+            print(f"****** 🛜 URL Citation ******:\n   [{citation['title']}]({citation['url']})")
+
+    def export_summary(self, message_id: str, base_filename: str = "research_summary") -> Optional[str]:
+        """与 create_research_summary 相同格式的 markdown（去重后的引用列表）"""
+        message = self.get_message(message_id)
+        if message is None:
+            print(f"😶 未找到消息，message_id: {message_id}")
+            return None
+        filepath = f"{base_filename}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md"
+        with open(filepath, "w", encoding="utf-8") as fp:
+            fp.write(message["text"])
+            if message["citations"]:
+                fp.write("\n\n## References\n")
+                seen_urls = set()
+                for citation in message["citations"]:
+                    if citation["url"] not in seen_urls:
+                        fp.write(f"- [{citation['title'] or citation['url']}]({citation['url']})\n")
+                        seen_urls.add(citation["url"])
+        print(f"Research summary written to '{filepath}'.")
+        return filepath
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            table: self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("threads", "messages", "citations")
+        }
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local full-text archive of deep research threads")
+    parser.add_argument("--db", default=str(DEFAULT_DB_PATH))
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    sync_parser = subparsers.add_parser("sync", help="Incrementally mirror threads from the service")
+    sync_parser.add_argument("thread_ids", nargs="*")
+    sync_parser.add_argument("--all", action="store_true", help="Also discover recent threads in the project")
+    sync_parser.add_argument("--limit", type=int, default=100)
+
+    search_parser = subparsers.add_parser("search", help="Full-text search archived messages")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--thread")
+    search_parser.add_argument("--limit", type=int, default=20)
+
+    show_parser = subparsers.add_parser("show", help="Print archived messages of a thread")
+    show_parser.add_argument("thread_id")
+    show_parser.add_argument("--message")
+    show_parser.add_argument("--role", default="assistant")
+
+    export_parser = subparsers.add_parser("export", help="Write a research summary markdown from the archive")
+    export_parser.add_argument("message_id")
+
+    subparsers.add_parser("stats")
+
+    args = parser.parse_args()
+    archive = ResearchArchive(Path(args.db))
+
+    if args.command == "sync":
+        import os
+        from azure.ai.projects import AIProjectClient
+        from azure.identity import DefaultAzureCredential
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        project_client = AIProjectClient(endpoint=os.environ["PROJECT_ENDPOINT"], credential=DefaultAzureCredential())
+        with project_client:
+            agents_client = project_client.agents
+            if args.all:
+                result = archive.sync_all(agents_client, limit=args.limit)
+            else:
+                result = SyncResult()
+                for thread_id in args.thread_ids:
+                    archive.sync_thread(agents_client, thread_id, result)
+        print(f"✅ Synced {result.threads} thread(s): {result.new_messages} new message(s), "
+              f"{result.new_citations} citation(s), {result.api_pages} page request(s) in {result.seconds:.1f}s")
+    elif args.command == "search":
+        start = time.time()
+        hits = archive.search(args.query, thread_id=args.thread, limit=args.limit)
+        for hit in hits:
+            print(f"[{hit.thread_id} / {hit.message_id} / {hit.role}] {hit.snippet.replace(chr(10), ' ')}")
+        print(f"🔍 {len(hits)} hit(s) in {(time.time() - start) * 1000:.1f}ms")
+    elif args.command == "show":
+        messages = [archive.get_message(args.message)] if args.message else archive.thread_messages(args.thread_id, args.role)
+        for message in filter(None, messages):
+            archive.print_message(message)
+    elif args.command == "export":
+        archive.export_summary(args.message_id)
+    else:
+        print(json.dumps(archive.stats(), indent=2))
+    archive.close()
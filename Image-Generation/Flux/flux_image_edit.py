@@ -1,65 +1,48 @@
 # Install required packages: `pip install requests pillow azure-identity`
 import os
+import sys
 import requests
 import base64
 from PIL import Image
 from io import BytesIO
-from datetime import datetime
+from pathlib import Path
 
-# load environment variables or set them directly
-import dotenv
+# 共享的生成结果缓存位于上一级 Image-Generation/ 目录
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from image_result_cache import get_default_cache
+from output_store import get_default_store
 
-# load .env from specific file path
-dotenv.load_dotenv(override=True)
+# 连接配置与同目录的 flux_image_gen.py 共享，首次调用 get_settings() 时才加载 .env
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from flux_image_gen import estimate_cost, get_settings
 
-# You will need to set these environment variables or edit the following values.
-endpoint = os.getenv(
-    "AZURE_OPENAI_ENDPOINT",
-    "https://jz-fdpo-proj-v2-swn-resource.cognitiveservices.azure.com/",
-)
-deployment = os.getenv("DEPLOYMENT_NAME", "FLUX.1-Kontext-pro-globalstandard")
-api_version = os.getenv("OPENAI_API_VERSION", "2025-04-01-preview")
-subscription_key = os.getenv("AZURE_OPENAI_API_KEY")
-# print(f"Using endpoint: {endpoint}, deployment: {deployment}, api_version: {api_version}, key: {subscription_key}")
 
-def decode_and_save_image(b64_data, output_filename):
-    """解码base64图像数据并保存到文件"""
-    image = Image.open(BytesIO(base64.b64decode(b64_data)))
-    image.show()
-    image.save(output_filename)
-
-def save_response(response_data, prompt_text):
+def save_response(response_data, prompt_text, params=None):
     """保存API响应中的图像数据"""
-    # 创建 edited_images 文件夹（如果不存在）
-    os.makedirs("edited_images", exist_ok=True)
-    
+    # 按内容 hash 存入共享的输出存储（Image-Generation/output_store/），重复结果只保存一份
     data = response_data["data"]
-    b64_img = data[0]["b64_json"]
-    
-    # 获取 prompt 的前10个字符
-    prompt_prefix = prompt_text[:10].replace(" ", "_").replace("/", "_").replace("\\", "_")
-    
-    # 获取当前时间戳（精确到秒）
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    
-    # 生成文件名
-    filename = f"edited_images/{prompt_prefix}_{timestamp}.png"
-    
-    decode_and_save_image(b64_img, filename)
-    print(f"Edited image saved to: '{filename}'")
+    image_bytes = base64.b64decode(data[0]["b64_json"])
+    asset = get_default_store().put(
+        image_bytes,
+        prompt=prompt_text,
+        params=params,
+        usage=response_data.get("usage"),
+        cost_usd=estimate_cost(response_data),
+        source="flux.edits",
+    )
+    Image.open(BytesIO(image_bytes)).show()
+    print(f"Edited image saved to: '{asset.path}'" + (" (duplicate of an existing image)" if asset.deduplicated else ""))
 
-def edit_image(image_path, prompt, size="1024x1024"):
-    """编辑指定的图像"""
+def edit_image(image_path, prompt, size="1024x1024", use_cache=True):
+    """编辑指定的图像；相同输入图 + prompt + 参数的结果直接从缓存返回"""
     # 检查图像文件是否存在
     if not os.path.exists(image_path):
         print(f"Error: Image file '{image_path}' not found!")
         return None
     
-    base_path = f"openai/deployments/{deployment}/images"
-    params = f"?api-version={api_version}"
-    
     # 构建编辑API的URL
-    edit_url = f"{endpoint}{base_path}/edits{params}"
+    settings = get_settings()
+    edit_url = settings.edit_url
     
     # 准备请求体
     edit_body = {
@@ -68,7 +51,7 @@ def edit_image(image_path, prompt, size="1024x1024"):
         "size": size
     }
     
-    try:
+    def call():
         # 使用 with 语句确保文件正确关闭
         with open(image_path, "rb") as image_file:
             # 准备文件 - 按照官方示例的格式
@@ -82,7 +65,7 @@ def edit_image(image_path, prompt, size="1024x1024"):
             # 发送编辑请求 - 使用files参数而不是data参数
             edit_response = requests.post(
                 edit_url, 
-                headers={"api-key": subscription_key}, 
+                headers={"api-key": settings.subscription_key}, 
                 files=files
             )
             
@@ -93,13 +76,20 @@ def edit_image(image_path, prompt, size="1024x1024"):
         print(f"Response Status Code: {edit_response.status_code}")
         
         if edit_response.status_code == 200:
-            response_json = edit_response.json()
-            save_response(response_json, edit_body["prompt"])
-            return response_json
-        else:
-            print(f"Error: {edit_response.status_code}")
-            print(edit_response.text)
-            return None
+            return edit_response.json()
+        print(f"Error: {edit_response.status_code}")
+        print(edit_response.text)
+        return None
+    
+    try:
+        edit_params = {"n": edit_body["n"], "size": size}
+        result = get_default_cache().cached_call(
+            f"flux.edits/{settings.deployment}", prompt, edit_params, call,
+            image=image_path, accept_cached=use_cache, cost_fn=estimate_cost,
+        )
+        if result.response:
+            save_response(result.response, edit_body["prompt"], edit_params)
+        return result.response
             
     except Exception as e:
         print(f"Error during image editing: {e}")
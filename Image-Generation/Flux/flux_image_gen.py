@@ -1,73 +1,122 @@
 # Install required packages: `pip install requests pillow azure-identity`
-import os
+import sys
 import requests
 import base64
 from PIL import Image
 from io import BytesIO
-from datetime import datetime
-
-# load environment variables or set them directly
-import dotenv
-
-# load .env from specific file path
-dotenv.load_dotenv(override=True)
-
-# You will need to set these environment variables or edit the following values.
-endpoint = os.getenv(
-    "AZURE_OPENAI_ENDPOINT",
-    "https://jz-fdpo-proj-v2-swn-resource.cognitiveservices.azure.com/",
-)
-deployment = os.getenv("DEPLOYMENT_NAME", "FLUX.1-Kontext-pro-globalstandard")
-api_version = os.getenv("OPENAI_API_VERSION", "2025-04-01-preview")
-subscription_key = os.getenv("AZURE_OPENAI_API_KEY")
-# print(f"Using endpoint: {endpoint}, deployment: {deployment}, api_version: {api_version}, key: {subscription_key}")
-
-def decode_and_save_image(b64_data, output_filename):
-    image = Image.open(BytesIO(base64.b64decode(b64_data)))
-    image.show()
-    image.save(output_filename)
-
-
-def save_response(response_data, prompt_text):
-    # 创建 generated_images 文件夹（如果不存在）
-    os.makedirs("generated_images", exist_ok=True)
-    
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+# 共享的生成结果缓存位于上一级 Image-Generation/ 目录，惰性配置位于仓库根目录
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(1, str(Path(__file__).resolve().parents[2]))
+from image_result_cache import get_default_cache
+from output_store import get_default_store
+from lazy_config import LazyConfig, once
+
+# FLUX.1-Kontext-pro 在 Azure AI Foundry 上按张计费（美元 / 张），换用其它部署时请调整
+FLUX_PRICE_PER_IMAGE_USD = 0.04
+
+
+@dataclass
+class FluxSettings:
+    endpoint: str
+    deployment: str
+    api_version: str
+    subscription_key: Optional[str]
+
+    @property
+    def images_url(self) -> str:
+        return f"{self.endpoint.rstrip('/')}/openai/deployments/{self.deployment}/images"
+
+    @property
+    def generation_url(self) -> str:
+        return f"{self.images_url}/generations?api-version={self.api_version}"
+
+    @property
+    def edit_url(self) -> str:
+        return f"{self.images_url}/edits?api-version={self.api_version}"
+
+
+@once
+def get_settings() -> FluxSettings:
+    """首次使用时才加载 .env（override=True，与原来相同）并读取环境变量；import 本模块不做任何 I/O"""
+    # You will need to set these environment variables or edit the following values.
+    config = LazyConfig(search_from=Path(__file__).resolve().parent, dotenv_override=True)
+    return FluxSettings(
+        endpoint=config.get("AZURE_OPENAI_ENDPOINT", "https://jz-fdpo-proj-v2-swn-resource.cognitiveservices.azure.com/"),
+        deployment=config.get("DEPLOYMENT_NAME", "FLUX.1-Kontext-pro-globalstandard"),
+        api_version=config.get("OPENAI_API_VERSION", "2025-04-01-preview"),
+        subscription_key=config.get("AZURE_OPENAI_API_KEY"),
+    )
+
+
+def estimate_cost(response_data) -> float:
+    """按返回的图片张数估算成本（Flux 不返回 token usage）"""
+    return FLUX_PRICE_PER_IMAGE_USD * len(response_data.get("data") or [])
+
+
+def save_response(response_data, prompt_text, params=None):
+    # 按内容 hash 存入共享的输出存储（Image-Generation/output_store/），重复结果只保存一份
     data = response_data["data"]
-    b64_img = data[0]["b64_json"]
-    
-    # 获取 prompt 的前10个字符
-    prompt_prefix = prompt_text[:10].replace(" ", "_").replace("/", "_").replace("\\", "_")
-    
-    # 获取当前时间戳（精确到秒）
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    
-    # 生成文件名
-    filename = f"generated_images/{prompt_prefix}_{timestamp}.png"
-    
-    decode_and_save_image(b64_img, filename)
-    print(f"Image saved to: '{filename}'")
-
-
-base_path = f"openai/deployments/{deployment}/images"
-params = f"?api-version={api_version}"
-
-generation_url = f"https://jz-fdpo-proj-v2-swn-resource.cognitiveservices.azure.com/{base_path}/generations{params}"
+    image_bytes = base64.b64decode(data[0]["b64_json"])
+    asset = get_default_store().put(
+        image_bytes,
+        prompt=prompt_text,
+        params=params,
+        usage=response_data.get("usage"),
+        cost_usd=estimate_cost(response_data),
+        source="flux.generations",
+    )
+    Image.open(BytesIO(image_bytes)).show()
+    print(f"Image saved to: '{asset.path}'" + (" (duplicate of an existing image)" if asset.deduplicated else ""))
+
+
 generation_body = {
     "prompt": "Transparent diagram of a mech-style West Highland White Terrier, with visible transformation hinges, compact energy cells, and detailed mechanical annotations. --quality 2 --sref 2007748773 --sw 400 --stylize 500 --v 7 --sv 6",
     "n": 1,
     "size": "1024x1024",
     "output_format": "png",
 }
-generation_response = requests.post(
-    generation_url,
-    headers={
-        "api-key": subscription_key,
-        "Content-Type": "application/json",
-    },
-    json=generation_body,
-).json()
-# print(generation_response)
-save_response(generation_response, generation_body["prompt"])
+
+
+def generate_image(body, use_cache=True):
+    """调用 generations 接口；相同 prompt + 参数的结果直接从缓存返回"""
+    settings = get_settings()
+
+    def call():
+        response = requests.post(
+            settings.generation_url,
+            headers={
+                "api-key": settings.subscription_key,
+                "Content-Type": "application/json",
+            },
+            json=body,
+        )
+        if response.status_code != 200:
+            print(f"Error: {response.status_code}")
+            print(response.text)
+            return None
+        return response.json()
+
+    cache_params = {k: v for k, v in body.items() if k != "prompt"}
+    result = get_default_cache().cached_call(
+        f"flux.generations/{settings.deployment}", body["prompt"], cache_params, call,
+        accept_cached=use_cache, cost_fn=estimate_cost,
+    )
+    return result.response
+
+
+if __name__ == "__main__":
+    generation_response = generate_image(generation_body)
+    # print(generation_response)
+    if generation_response:
+        save_response(
+            generation_response,
+            generation_body["prompt"],
+            {k: v for k, v in generation_body.items() if k != "prompt"},
+        )
 
 
 
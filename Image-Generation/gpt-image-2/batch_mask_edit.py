@@ -0,0 +1,328 @@
+# gpt-image-2 批量蒙版编辑
+#
+# notebook 中的 call_masked_edit 每次只发一个编辑请求，且每次都重新打开原图文件。
+# 这里对同一张输入图并发提交多组 (mask, prompt)：
+#   - 原图只读取一次，所有请求复用同一份 bytes
+#   - mask 由 mask_builder 按 (尺寸, 区域) 构建并缓存，相同区域的多个 prompt 不会重复计算
+#   - 每个线程复用自己的 requests.Session（连接池 / TLS 复用）
+#   - 可选的结果缓存（image_result_cache）：相同原图 + mask + prompt + 参数的重跑直接复用，并报告节省的耗时 / 成本
+#   - 结果与 JSON 报告保存在 outputs/mask_edit/，报告格式可直接被 report_index.py 索引
+#
+# 用法:
+#   python batch_mask_edit.py
+
+import base64
+import configparser
+import datetime
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import requests
+from PIL import Image
+
+# 共享的生成结果缓存位于上一级 Image-Generation/ 目录
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from image_result_cache import ImageResultCache, get_default_cache
+from mask_builder import Box, Ellipse, Polygon, Region, build_mask_png, mask_cache_info
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+OUT_DIR = SCRIPT_DIR / "outputs" / "mask_edit"
+
+DEFAULT_ENDPOINT_NAME = "jzdm-foundry-swn"
+DEFAULT_DEPLOYMENT = "gpt-image-2-globalstandard"
+DEFAULT_API_VERSION = "2025-04-01-preview"
+
+# 与 notebook 中 estimate_cost 相同的价格（美元 / 1M tokens）
+PRICING = {
+    "input_text": 5.00,
+    "input_image": 8.00,
+    "output_image": 30.00,
+}
+
+
+@dataclass
+class EditEndpoint:
+    """images/edits 端点配置"""
+    api_key: str
+    endpoint: str
+    deployment: str = DEFAULT_DEPLOYMENT
+    api_version: str = DEFAULT_API_VERSION
+
+    @property
+    def url(self) -> str:
+        return f"{self.endpoint}/openai/deployments/{self.deployment}/images/edits?api-version={self.api_version}"
+
+
+@dataclass
+class MaskEditJob:
+    """一组 (mask 区域, prompt)"""
+    name: str
+    prompt: str
+    regions: Sequence[Region]
+    size: str = "1024x1024"
+    quality: str = "low"
+    input_fidelity: str = "high"
+
+
+@dataclass
+class MaskEditResult:
+    """单个编辑请求的结果"""
+    name: str
+    status: int
+    latency_s: float
+    apim_request_id: str = "N/A"
+    usage: Dict[str, Any] = field(default_factory=dict)
+    cost_usd: float = 0.0
+    image_bytes: Optional[bytes] = None
+    error: Optional[str] = None
+    from_cache: bool = False
+    saved_latency_s: float = 0.0
+    saved_cost_usd: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 200 and self.image_bytes is not None
+
+
+def load_endpoint_from_config(endpoint_name: str = DEFAULT_ENDPOINT_NAME) -> EditEndpoint:
+    """与 notebook 相同：从当前目录向上查找仓库根目录的 .config"""
+    repo_root = Path.cwd().resolve()
+    while not (repo_root / ".config").exists() and repo_root != repo_root.parent:
+        repo_root = repo_root.parent
+    config_path = repo_root / ".config"
+    if not config_path.exists():
+        raise FileNotFoundError(f"Cannot find .config from {Path.cwd()}")
+
+    cfg = configparser.ConfigParser()
+    cfg.read(config_path)
+    return EditEndpoint(
+        api_key=cfg.get("AOAIEndpoints", endpoint_name),
+        endpoint=f"https://{endpoint_name}.openai.azure.com",
+    )
+
+
+def estimate_cost(usage: dict) -> float:
+    if not usage:
+        return 0.0
+    input_tokens = usage.get("input_tokens", 0) or 0
+    output_tokens = usage.get("output_tokens", 0) or 0
+    details = usage.get("input_tokens_details", {}) or {}
+    input_text_tokens = details.get("text_tokens", input_tokens) or 0
+    input_image_tokens = details.get("image_tokens", 0) or 0
+    return (
+        input_text_tokens * PRICING["input_text"] / 1e6
+        + input_image_tokens * PRICING["input_image"] / 1e6
+        + output_tokens * PRICING["output_image"] / 1e6
+    )
+
+
+def _fill_from_json(result: MaskEditResult, result_json: Dict[str, Any]) -> None:
+    result.usage = result_json.get("usage", {}) or {}
+    result.cost_usd = estimate_cost(result.usage)
+    result.image_bytes = base64.b64decode(result_json["data"][0]["b64_json"])
+
+
+@dataclass
+class PreparedImage:
+    """读取一次、所有请求共享的输入图"""
+    name: str
+    data: bytes
+    size: Tuple[int, int]
+
+    @classmethod
+    def load(cls, image_path: Path) -> "PreparedImage":
+        data = image_path.read_bytes()
+        with Image.open(BytesIO(data)) as img:
+            size = img.size
+        return cls(name=image_path.name, data=data, size=size)
+
+
+class BatchMaskEditor:
+    """对同一张输入图并发执行多组蒙版编辑"""
+
+    def __init__(self, endpoint: EditEndpoint, max_workers: int = 4, timeout: int = 600,
+                 cache: Optional[ImageResultCache] = None, accept_cached: bool = True):
+        """
+        Args:
+            endpoint: images/edits 端点配置
+            max_workers: 最大并发请求数
+            timeout: 单个请求超时时间（秒）
+            cache: 结果缓存，None 表示每次都实际请求
+            accept_cached: 是否接受缓存中已有的结果
+        """
+        self.endpoint = endpoint
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.cache = cache
+        self.accept_cached = accept_cached
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers["api-key"] = self.endpoint.api_key
+            self._local.session = session
+        return session
+
+    def _post_edit(self, image: PreparedImage, job: MaskEditJob,
+                   mask_png: bytes) -> Tuple[MaskEditResult, Optional[Dict[str, Any]]]:
+        data = {
+            "prompt": job.prompt,
+            "size": job.size,
+            "quality": job.quality,
+            "n": "1",
+            "input_fidelity": job.input_fidelity,
+        }
+        files = [
+            ("image[]", (image.name, image.data, "image/png")),
+            ("mask", (f"{job.name}_mask.png", mask_png, "image/png")),
+        ]
+        start = time.time()
+        try:
+            response = self._session().post(self.endpoint.url, data=data, files=files, timeout=self.timeout)
+        except requests.RequestException as e:
+            return MaskEditResult(name=job.name, status=0, latency_s=time.time() - start, error=str(e)), None
+        latency_s = time.time() - start
+
+        result = MaskEditResult(
+            name=job.name,
+            status=response.status_code,
+            latency_s=latency_s,
+            apim_request_id=response.headers.get("apim-request-id", "N/A"),
+        )
+        if response.status_code != 200:
+            result.error = response.text[:1000]
+            return result, None
+
+        result_json = response.json()
+        _fill_from_json(result, result_json)
+        return result, result_json
+
+    def edit_one(self, image: PreparedImage, job: MaskEditJob) -> MaskEditResult:
+        """提交单个蒙版编辑请求；配置了缓存时相同 (原图, mask, prompt, 参数) 直接返回缓存结果"""
+        mask_png = build_mask_png(image.size, job.regions)
+        if self.cache is None:
+            return self._post_edit(image, job, mask_png)[0]
+
+        posted = {}
+
+        def call() -> Optional[Dict[str, Any]]:
+            posted["result"], result_json = self._post_edit(image, job, mask_png)
+            return result_json
+
+        params = {"size": job.size, "quality": job.quality, "n": "1", "input_fidelity": job.input_fidelity}
+        cached = self.cache.cached_call(
+            f"gpt-image-2.mask_edit/{self.endpoint.deployment}", job.prompt, params, call,
+            image=image.data, mask=mask_png, accept_cached=self.accept_cached,
+            cost_fn=lambda response: estimate_cost(response.get("usage", {})),
+        )
+        if not cached.from_cache:
+            return posted["result"]
+
+        result = MaskEditResult(
+            name=job.name,
+            status=200,
+            latency_s=cached.latency_s,
+            apim_request_id="cache",
+            from_cache=True,
+            saved_latency_s=cached.saved_latency_s,
+            saved_cost_usd=cached.saved_cost_usd,
+        )
+        _fill_from_json(result, cached.response)
+        # 命中缓存时没有实际产生费用
+        result.cost_usd = 0.0
+        return result
+
+    def run(self, image_path: Path, jobs: Sequence[MaskEditJob]) -> List[MaskEditResult]:
+        """
+        并发执行所有编辑任务
+
+        Args:
+            image_path: 输入图路径
+            jobs: 编辑任务列表
+
+        Returns:
+            与 jobs 顺序一致的结果列表
+        """
+        image = PreparedImage.load(image_path)
+        # 先在主线程构建所有 mask，避免多个线程同时构建同一个 mask
+        for job in jobs:
+            build_mask_png(image.size, job.regions)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(lambda job: self.edit_one(image, job), jobs))
+
+
+def save_results(results: Sequence[MaskEditResult], jobs: Sequence[MaskEditJob], stamp: str,
+                 out_dir: Path = OUT_DIR) -> Path:
+    """保存编辑结果图片与 JSON 报告，返回报告路径"""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    report = []
+    for job, result in zip(jobs, results):
+        record = {
+            "test": result.name,
+            "prompt": job.prompt,
+            "quality": job.quality,
+            "status": result.status,
+            "apim_request_id": result.apim_request_id,
+            "latency_s": round(result.latency_s, 2),
+            "usage": result.usage,
+            "cost_usd": round(result.cost_usd, 6),
+        }
+        if result.from_cache:
+            record["from_cache"] = True
+            record["saved_latency_s"] = round(result.saved_latency_s, 2)
+            record["saved_cost_usd"] = round(result.saved_cost_usd, 6)
+        if result.image_bytes:
+            image_path = out_dir / f"{result.name}_{stamp}.png"
+            image_path.write_bytes(result.image_bytes)
+            record["edited_image"] = str(image_path.relative_to(SCRIPT_DIR))
+        if result.error:
+            record["error"] = result.error
+        report.append(record)
+
+    report_path = out_dir / f"batch_mask_edit_report_{stamp}.json"
+    report_path.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    return report_path
+
+
+if __name__ == "__main__":
+    input_image = SCRIPT_DIR / "input_images" / "westie_lemon.png"
+    stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    notebook_box = Box(0.08, 0.18, 0.46, 0.58)
+
+    jobs = [
+        MaskEditJob("ball_blue", "Replace only the transparent masked area with a small blue toy ball. "
+                    "Keep everything outside the mask unchanged.", [notebook_box]),
+        MaskEditJob("ball_red", "Replace only the transparent masked area with a small red toy ball. "
+                    "Keep everything outside the mask unchanged.", [notebook_box]),
+        MaskEditJob("flower_soft", "Place a small yellow flower inside the transparent area, blending softly "
+                    "into the surroundings.", [Ellipse(0.6, 0.62, 0.88, 0.9, feather=0.04)]),
+        MaskEditJob("sky_triangle", "Fill the transparent area with a light blue sky.",
+                    [Polygon([(0.0, 0.0), (1.0, 0.0), (1.0, 0.12), (0.0, 0.25)], feather=0.02)]),
+    ]
+
+    editor = BatchMaskEditor(load_endpoint_from_config(), max_workers=4, cache=get_default_cache())
+    print(f"Input image : {input_image.relative_to(SCRIPT_DIR)}")
+    print(f"Jobs        : {len(jobs)}  (max_workers={editor.max_workers})")
+
+    batch_start = time.time()
+    results = editor.run(input_image, jobs)
+    wall_s = time.time() - batch_start
+
+    for r in results:
+        print(f"{r.name:<14} HTTP {r.status}  latency={r.latency_s:6.2f}s  cost=${r.cost_usd:.6f}  "
+              f"apim-request-id={r.apim_request_id}"
+              + (f"  (cached, saved {r.saved_latency_s:.2f}s / ${r.saved_cost_usd:.6f})" if r.from_cache else ""))
+    serial_s = sum(r.latency_s for r in results)
+    print(f"\nWall time {wall_s:.2f}s vs serial {serial_s:.2f}s  (mask cache: {mask_cache_info()})")
+    editor.cache.print_stats()
+    print(f"Report saved: {save_results(results, jobs, stamp).relative_to(SCRIPT_DIR)}")
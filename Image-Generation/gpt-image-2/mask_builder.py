@@ -0,0 +1,166 @@
+# gpt-image-2 蒙版（mask）构建工具
+#
+# test_gpt_image_2_mask_edit.ipynb 中每次只用 PIL.ImageDraw 画一个矩形。这里用 NumPy 数组运算
+# 一次性合成任意多个矩形 / 多边形 / 椭圆区域，并支持羽化边缘。
+#
+# mask 规则与 notebook 一致：同尺寸 RGBA PNG，透明区域 (alpha=0) 为允许模型重绘的区域，
+# 不透明区域 (alpha=255) 尽量保持原图不变。区域坐标使用相对坐标 (0~1)，与 notebook 中
+# edit_box = (width * 0.08, height * 0.18, ...) 的写法对应。
+#
+# 相同 (尺寸, 区域描述) 的 mask 会被缓存，批量编辑时重复使用不会重新计算。
+
+from dataclasses import dataclass
+from functools import lru_cache
+from io import BytesIO
+from typing import Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+
+@dataclass(frozen=True)
+class Box:
+    """矩形编辑区域，(x0, y0) 左上角，(x1, y1) 右下角，相对坐标"""
+    x0: float
+    y0: float
+    x1: float
+    y1: float
+    feather: float = 0.0  # 羽化宽度（相对于短边的比例），0 表示硬边
+
+
+@dataclass(frozen=True)
+class Ellipse:
+    """椭圆编辑区域，由外接矩形给出，相对坐标"""
+    x0: float
+    y0: float
+    x1: float
+    y1: float
+    feather: float = 0.0
+
+
+@dataclass(frozen=True)
+class Polygon:
+    """多边形编辑区域，points 为相对坐标 ((x, y), ...)"""
+    points: Tuple[Tuple[float, float], ...]
+    feather: float = 0.0
+
+    def __post_init__(self):
+        # 允许传入 list，统一转成 tuple 以便作为缓存 key
+        object.__setattr__(self, "points", tuple((float(x), float(y)) for x, y in self.points))
+
+
+Region = Union[Box, Ellipse, Polygon]
+
+
+def _pixel_grid(width: int, height: int) -> Tuple[np.ndarray, np.ndarray]:
+    # 像素中心坐标，转成相对坐标
+    xs = (np.arange(width, dtype=np.float32) + 0.5) / width
+    ys = (np.arange(height, dtype=np.float32) + 0.5) / height
+    return xs[np.newaxis, :], ys[:, np.newaxis]
+
+
+def _box_coverage(region: Box, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    inside_x = (xs >= region.x0) & (xs <= region.x1)
+    inside_y = (ys >= region.y0) & (ys <= region.y1)
+    return (inside_x & inside_y).astype(np.float32)
+
+
+def _ellipse_coverage(region: Ellipse, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    cx, cy = (region.x0 + region.x1) / 2, (region.y0 + region.y1) / 2
+    rx, ry = max((region.x1 - region.x0) / 2, 1e-6), max((region.y1 - region.y0) / 2, 1e-6)
+    return ((((xs - cx) / rx) ** 2 + ((ys - cy) / ry) ** 2) <= 1.0).astype(np.float32)
+
+
+def _polygon_coverage(region: Polygon, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    # 射线法（even-odd），每条边对整张网格做一次向量化运算
+    inside = np.zeros((ys.shape[0], xs.shape[1]), dtype=bool)
+    points = region.points
+    for (xa, ya), (xb, yb) in zip(points, points[1:] + points[:1]):
+        if ya == yb:
+            continue
+        crosses = (ys > min(ya, yb)) & (ys <= max(ya, yb))
+        x_at_y = xa + (ys - ya) * (xb - xa) / (yb - ya)
+        inside ^= crosses & (xs < x_at_y)
+    return inside.astype(np.float32)
+
+
+def _box_blur(coverage: np.ndarray, radius: int) -> np.ndarray:
+    # 基于累加和的可分离均值滤波，连续做三次近似高斯羽化
+    if radius <= 0:
+        return coverage
+    size = 2 * radius + 1
+    for _ in range(3):
+        for axis in (0, 1):
+            padded = np.pad(coverage, [(radius + 1, radius) if a == axis else (0, 0) for a in (0, 1)], mode="edge")
+            summed = np.cumsum(padded, axis=axis, dtype=np.float64)
+            if axis == 0:
+                coverage = (summed[size:] - summed[:-size]) / size
+            else:
+                coverage = (summed[:, size:] - summed[:, :-size]) / size
+    return coverage.astype(np.float32)
+
+
+_COVERAGE_BUILDERS = {
+    Box: _box_coverage,
+    Ellipse: _ellipse_coverage,
+    Polygon: _polygon_coverage,
+}
+
+
+def build_mask_array(size: Tuple[int, int], regions: Sequence[Region]) -> np.ndarray:
+    """
+    构建 RGBA mask 数组
+
+    Args:
+        size: (width, height)，必须与输入图一致
+        regions: 编辑区域列表，多个区域取并集
+
+    Returns:
+        shape 为 (height, width, 4) 的 uint8 数组，编辑区域 alpha=0
+    """
+    width, height = size
+    xs, ys = _pixel_grid(width, height)
+    editable = np.zeros((height, width), dtype=np.float32)
+    for region in regions:
+        coverage = _COVERAGE_BUILDERS[type(region)](region, xs, ys)
+        radius = int(round(region.feather * min(width, height) / 2))
+        editable = np.maximum(editable, _box_blur(coverage, radius))
+
+    mask = np.full((height, width, 4), 255, dtype=np.uint8)
+    mask[..., 3] = np.clip(np.rint((1.0 - editable) * 255), 0, 255).astype(np.uint8)
+    return mask
+
+
+@lru_cache(maxsize=64)
+def _cached_mask_png(size: Tuple[int, int], regions: Tuple[Region, ...]) -> bytes:
+    buffer = BytesIO()
+    Image.fromarray(build_mask_array(size, regions)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def build_mask_png(size: Tuple[int, int], regions: Sequence[Region]) -> bytes:
+    """构建 mask 并编码为 PNG bytes，按 (size, regions) 缓存"""
+    return _cached_mask_png(tuple(size), tuple(regions))
+
+
+def mask_cache_info():
+    """返回 mask 缓存命中统计（functools.lru_cache 的 CacheInfo）"""
+    return _cached_mask_png.cache_info()
+
+
+if __name__ == "__main__":
+    import time
+
+    demo_regions = [
+        Box(0.08, 0.18, 0.46, 0.58),  # notebook 中的 edit_box
+        Ellipse(0.6, 0.6, 0.9, 0.9, feather=0.04),
+        Polygon([(0.5, 0.05), (0.7, 0.35), (0.3, 0.35)], feather=0.02),
+    ]
+    start = time.perf_counter()
+    png = build_mask_png((1024, 1024), demo_regions)
+    first_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    build_mask_png((1024, 1024), demo_regions)
+    cached_ms = (time.perf_counter() - start) * 1000
+    print(f"Mask PNG: {len(png) / 1024:.1f} KB, 首次构建 {first_ms:.1f} ms, 缓存命中 {cached_ms:.3f} ms")
+    print(mask_cache_info())
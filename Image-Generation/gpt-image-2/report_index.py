@@ -0,0 +1,461 @@
+# gpt-image-2 测试报告索引与查询工具
+#
+# outputs/** 下的报告 JSON 格式各不相同（列表形式、按测试名分组的字典、单次调用的扁平报告等），
+# 每次做趋势分析都要手动加载全部文件。本工具把所有报告增量导入一个 SQLite 库：
+#   - 只重新解析 mtime / size 发生变化的文件，已删除的文件会同步移除
+#   - 查询时直接在 SQLite 中按测试名 / quality / 日期聚合，数万份报告也能毫秒级返回
+#
+# 用法:
+#   python report_index.py index
+#   python report_index.py query --group-by test --quality high
+#   python report_index.py query --group-by date --test "t2i_%" --since 2026-04-01 --until 2026-04-30
+#   python report_index.py query --group-by quality --json
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+DEFAULT_ROOTS = [SCRIPT_DIR / "outputs", SCRIPT_DIR / "outputs_web_knowledge"]
+DEFAULT_DB_PATH = SCRIPT_DIR / "outputs" / "report_index.sqlite"
+# 解析规则变化时递增，旧版本建立的索引会在 connect() 时清空并全量重建
+INDEX_VERSION = 2
+
+# 报告文件名里的时间戳，例如 report_20260422_095641.json
+STAMP_PATTERN = re.compile(r"(\d{8})_(\d{6})")
+QUALITY_PATTERN = re.compile(r"quality_(low|medium|high|auto)")
+
+# 单次调用的扁平报告（例如 mask_edit_report_*.json）会在顶层出现这些字段
+FLAT_REPORT_KEYS = {"latency_s", "http_status", "usage", "estimated_cost_usd"}
+# 至少带其中一个字段的条目才是一次 API 调用；其余条目（例如 format_png_vs_jpeg 只有 png_kb / jpeg_kb）不计入
+CALL_KEYS = {"usage", "latency_s", "latency", "status", "http_status", "ok", "error",
+             "input_text", "input_image", "output_tokens"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS report_files (
+    path        TEXT PRIMARY KEY,
+    mtime_ns    INTEGER NOT NULL,
+    size        INTEGER NOT NULL,
+    run_stamp   TEXT,
+    indexed_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS report_records (
+    path           TEXT NOT NULL REFERENCES report_files(path) ON DELETE CASCADE,
+    test           TEXT NOT NULL,
+    quality        TEXT,
+    status         TEXT,
+    ok             INTEGER,
+    latency_s      REAL,
+    input_text     INTEGER,
+    input_image    INTEGER,
+    output_tokens  INTEGER,
+    cost_usd       REAL,
+    report_date    TEXT,
+    run_stamp      TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_records_path ON report_records(path);
+CREATE INDEX IF NOT EXISTS idx_records_test ON report_records(test, report_date);
+CREATE INDEX IF NOT EXISTS idx_records_quality ON report_records(quality, report_date);
+CREATE INDEX IF NOT EXISTS idx_records_date ON report_records(report_date);
+"""
+
+GROUP_COLUMNS = {
+    "test": "test",
+    "quality": "COALESCE(quality, '-')",
+    "date": "report_date",
+    "file": "path",
+}
+
+
+@dataclass
+class ReportRecord:
+    """单条测试结果（已归一化）"""
+    test: str
+    quality: Optional[str] = None
+    status: Optional[str] = None
+    ok: Optional[bool] = None
+    latency_s: Optional[float] = None
+    input_text: Optional[int] = None
+    input_image: Optional[int] = None
+    output_tokens: Optional[int] = None
+    cost_usd: Optional[float] = None
+
+
+@dataclass
+class IndexStats:
+    """一次增量索引的统计"""
+    scanned: int = 0
+    indexed: int = 0
+    unchanged: int = 0
+    removed: int = 0
+    failed: int = 0
+    records: int = 0
+    elapsed_s: float = 0.0
+
+
+def connect(db_path: Path = DEFAULT_DB_PATH) -> sqlite3.Connection:
+    """打开（必要时创建）索引库"""
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(SCHEMA)
+    if conn.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+        with conn:
+            conn.execute("DELETE FROM report_records")
+            conn.execute("DELETE FROM report_files")
+        conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+    return conn
+
+
+def iter_report_files(roots: List[Path]) -> Iterator[os.DirEntry]:
+    """递归遍历目录下所有 .json 文件（os.scandir 比 glob 少一次 stat）"""
+    stack = [str(root) for root in roots if root.exists()]
+    while stack:
+        current = stack.pop()
+        with os.scandir(current) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(".json"):
+                    yield entry
+
+
+def _first(record: Dict[str, Any], *keys: str) -> Any:
+    for key in keys:
+        value = record.get(key)
+        if value is not None:
+            return value
+    return None
+
+
+def _first_number(record: Dict[str, Any], *keys: str) -> Any:
+    # 同名字段在部分报告里是路径等非数值（例如 mask_edit 报告的 input_image 是输入图片路径）
+    for key in keys:
+        value = record.get(key)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return value
+    return None
+
+
+def _to_int(value: Any) -> Optional[int]:
+    return int(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def _to_float(value: Any) -> Optional[float]:
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def normalize_record(test: str, raw: Dict[str, Any]) -> ReportRecord:
+    """把不同脚本写出的字段名统一成一条 ReportRecord"""
+    usage = raw.get("usage") or {}
+    input_details = usage.get("input_tokens_details") or raw.get("details") or {}
+
+    input_text = _first_number(raw, "input_text")
+    if input_text is None:
+        input_text = input_details.get("text_tokens")
+    input_image = _first_number(raw, "input_image")
+    if input_image is None:
+        input_image = input_details.get("image_tokens")
+    output_tokens = _first_number(raw, "output_tokens")
+    if output_tokens is None:
+        output_tokens = usage.get("output_tokens")
+
+    quality = _first(raw, "quality", "returned_quality")
+    if quality is None:
+        match = QUALITY_PATTERN.search(test)
+        quality = match.group(1) if match else None
+
+    status = _first(raw, "status", "http_status")
+    ok = raw.get("ok")
+    if ok is None:
+        # 没有 status 的记录（例如 cached_token_report 的 *_runs）以是否带 error 判断成功与否
+        ok = status in (200, "200", "completed") if status is not None else not raw.get("error")
+
+    return ReportRecord(
+        test=test,
+        quality=quality,
+        status=None if status is None else str(status),
+        ok=None if ok is None else bool(ok),
+        latency_s=_to_float(_first(raw, "latency_s", "latency")),
+        input_text=_to_int(input_text),
+        input_image=_to_int(input_image),
+        output_tokens=_to_int(output_tokens),
+        cost_usd=_to_float(_first(raw, "cost_usd", "estimated_cost_usd", "cost")),
+    )
+
+
+def _is_call(item: Any) -> bool:
+    return isinstance(item, dict) and bool(CALL_KEYS & item.keys())
+
+
+def extract_records(data: Any, default_test: str) -> List[ReportRecord]:
+    """
+    从一份报告 JSON 中提取所有测试记录
+
+    支持的格式:
+        - [{"test": ..., ...}, ...]                  (report_*.json)
+        - {"name": {...}, ...}                       (verify / retest / web_knowledge 报告)
+        - {"runs": [{...}, ...], ...}                (cached_token_report 中的 *_runs)
+        - {"latency_s": ..., "usage": {...}, ...}    (mask_edit 这类单次调用报告)
+    """
+    if isinstance(data, list):
+        return [
+            normalize_record(str(item.get("test", f"{default_test}#{i}")), item)
+            for i, item in enumerate(data, 1)
+            if _is_call(item)
+        ]
+    if not isinstance(data, dict):
+        return []
+    if FLAT_REPORT_KEYS & data.keys():
+        return [normalize_record(default_test, data)]
+
+    records = []
+    for key, value in data.items():
+        if _is_call(value):
+            records.append(normalize_record(key, value))
+        elif isinstance(value, list):
+            for i, item in enumerate(value, 1):
+                if _is_call(item):
+                    records.append(normalize_record(f"{key}#{item.get('i', i)}", item))
+    return records
+
+
+def parse_run_stamp(path: str, data: Any, mtime_ns: int) -> Tuple[str, str]:
+    """返回 (report_date, run_stamp)，优先使用文件名中的时间戳"""
+    match = STAMP_PATTERN.search(os.path.basename(path))
+    if not match and isinstance(data, dict) and isinstance(data.get("timestamp"), str):
+        match = STAMP_PATTERN.search(data["timestamp"])
+    if match:
+        stamp = f"{match.group(1)}_{match.group(2)}"
+        try:
+            return datetime.strptime(stamp, "%Y%m%d_%H%M%S").strftime("%Y-%m-%d"), stamp
+        except ValueError:
+            pass
+    run_at = datetime.fromtimestamp(mtime_ns / 1e9)
+    return run_at.strftime("%Y-%m-%d"), run_at.strftime("%Y%m%d_%H%M%S")
+
+
+def _default_test_name(path: str) -> str:
+    name = os.path.splitext(os.path.basename(path))[0]
+    name = STAMP_PATTERN.sub("", name).strip("_")
+    return name[:-len("_report")] if name.endswith("_report") else name
+
+
+def _under_roots(path: str, root_prefixes: List[str]) -> bool:
+    return any(prefix == os.curdir or path == prefix or path.startswith(prefix + os.sep) for prefix in root_prefixes)
+
+
+def index_reports(conn: sqlite3.Connection, roots: Optional[List[Path]] = None) -> IndexStats:
+    """
+    增量索引报告文件
+
+    Args:
+        conn: connect() 返回的连接
+        roots: 需要扫描的目录，默认为 outputs/ 与 outputs_web_knowledge/
+
+    Returns:
+        本次索引的统计信息
+    """
+    start = time.perf_counter()
+    stats = IndexStats()
+    roots = roots or DEFAULT_ROOTS
+    # 只同步本次扫描范围内的删除，其它目录下已索引的报告保持不变
+    root_prefixes = [os.path.relpath(root, SCRIPT_DIR) for root in roots]
+    known = {
+        path: (mtime_ns, size)
+        for path, mtime_ns, size in conn.execute("SELECT path, mtime_ns, size FROM report_files")
+    }
+    seen = set()
+
+    with conn:
+        for entry in iter_report_files(roots):
+            stats.scanned += 1
+            path = os.path.relpath(entry.path, SCRIPT_DIR)
+            seen.add(path)
+            st = entry.stat()
+            if known.get(path) == (st.st_mtime_ns, st.st_size):
+                stats.unchanged += 1
+                continue
+
+            try:
+                with open(entry.path, "r", encoding="utf-8") as fp:
+                    data = json.load(fp)
+            except (OSError, ValueError) as e:
+                print(f"跳过无法解析的报告 {path}: {e}")
+                stats.failed += 1
+                continue
+
+            report_date, run_stamp = parse_run_stamp(path, data, st.st_mtime_ns)
+            records = extract_records(data, _default_test_name(path))
+
+            conn.execute("DELETE FROM report_records WHERE path = ?", (path,))
+            conn.execute(
+                "INSERT OR REPLACE INTO report_files (path, mtime_ns, size, run_stamp, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (path, st.st_mtime_ns, st.st_size, run_stamp, time.time()),
+            )
+            conn.executemany(
+                "INSERT INTO report_records (path, test, quality, status, ok, latency_s, input_text, "
+                "input_image, output_tokens, cost_usd, report_date, run_stamp) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (path, r.test, r.quality, r.status, r.ok, r.latency_s, r.input_text,
+                     r.input_image, r.output_tokens, r.cost_usd, report_date, run_stamp)
+                    for r in records
+                ],
+            )
+            stats.indexed += 1
+            stats.records += len(records)
+
+        removed = [path for path in known if path not in seen and _under_roots(path, root_prefixes)]
+        conn.executemany("DELETE FROM report_records WHERE path = ?", [(p,) for p in removed])
+        conn.executemany("DELETE FROM report_files WHERE path = ?", [(p,) for p in removed])
+        stats.removed = len(removed)
+
+    stats.elapsed_s = time.perf_counter() - start
+    return stats
+
+
+def query_reports(
+    conn: sqlite3.Connection,
+    group_by: str = "test",
+    test: Optional[str] = None,
+    quality: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    only_ok: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    按维度聚合延迟 / 成本 / token
+
+    Args:
+        group_by: test / quality / date / file
+        test: 测试名，支持 SQL LIKE 通配符（例如 t2i_%）
+        quality: low / medium / high / auto
+        since / until: 日期范围（YYYY-MM-DD，包含两端）
+        only_ok: 只统计成功的调用
+
+    Returns:
+        每个分组一行的聚合结果
+    """
+    if group_by not in GROUP_COLUMNS:
+        raise ValueError(f"不支持的 group_by: {group_by}，可选: {', '.join(GROUP_COLUMNS)}")
+
+    where, params = [], []
+    if test:
+        where.append("test LIKE ?")
+        params.append(test)
+    if quality:
+        where.append("quality = ?")
+        params.append(quality)
+    if since:
+        where.append("report_date >= ?")
+        params.append(since)
+    if until:
+        where.append("report_date <= ?")
+        params.append(until)
+    if only_ok:
+        where.append("ok = 1")
+
+    sql = f"""
+        SELECT {GROUP_COLUMNS[group_by]} AS grp,
+               COUNT(*) AS calls,
+               SUM(CASE WHEN ok = 1 THEN 1 ELSE 0 END) AS ok_calls,
+               AVG(latency_s) AS avg_latency_s,
+               MIN(latency_s) AS min_latency_s,
+               MAX(latency_s) AS max_latency_s,
+               AVG(output_tokens) AS avg_output_tokens,
+               SUM(CASE WHEN input_text IS NULL AND input_image IS NULL THEN NULL
+                        ELSE COALESCE(input_text, 0) + COALESCE(input_image, 0) END) AS input_tokens,
+               SUM(output_tokens) AS output_tokens,
+               SUM(cost_usd) AS total_cost_usd,
+               AVG(cost_usd) AS avg_cost_usd
+        FROM report_records
+        {"WHERE " + " AND ".join(where) if where else ""}
+        GROUP BY grp
+        ORDER BY grp
+    """
+    cursor = conn.execute(sql, params)
+    columns = [c[0] for c in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def _fmt(value: Any, digits: int = 2) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.{digits}f}"
+    return str(value)
+
+
+def print_query_result(rows: List[Dict[str, Any]], group_by: str) -> None:
+    """以表格形式打印聚合结果"""
+    if not rows:
+        print("没有匹配的记录")
+        return
+    width = max(len(group_by), *(len(str(r["grp"])) for r in rows)) + 2
+    print(f"{group_by:<{width}} {'Calls':>6} {'OK':>5} {'Avg(s)':>8} {'Min(s)':>8} {'Max(s)':>8} "
+          f"{'AvgOut':>8} {'InTok':>9} {'OutTok':>9} {'Cost($)':>10} {'Avg($)':>9}")
+    print("-" * (width + 92))
+    for r in rows:
+        print(f"{str(r['grp']):<{width}} {r['calls']:>6} {r['ok_calls']:>5} {_fmt(r['avg_latency_s']):>8} "
+              f"{_fmt(r['min_latency_s']):>8} {_fmt(r['max_latency_s']):>8} {_fmt(r['avg_output_tokens'], 0):>8} "
+              f"{_fmt(r['input_tokens']):>9} {_fmt(r['output_tokens']):>9} {_fmt(r['total_cost_usd'], 4):>10} "
+              f"{_fmt(r['avg_cost_usd'], 4):>9}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="gpt-image-2 测试报告索引与查询")
+    parser.add_argument("--db", type=Path, default=DEFAULT_DB_PATH, help="SQLite 索引库路径")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    index_parser = sub.add_parser("index", help="增量索引报告 JSON")
+    index_parser.add_argument("roots", nargs="*", type=Path, help="扫描目录（默认 outputs/ 与 outputs_web_knowledge/）")
+
+    query_parser = sub.add_parser("query", help="聚合查询延迟 / 成本 / token")
+    query_parser.add_argument("--group-by", choices=sorted(GROUP_COLUMNS), default="test")
+    query_parser.add_argument("--test", help="测试名，支持 SQL LIKE 通配符，例如 t2i_%%")
+    query_parser.add_argument("--quality", choices=["low", "medium", "high", "auto"])
+    query_parser.add_argument("--since", help="起始日期 YYYY-MM-DD（包含）")
+    query_parser.add_argument("--until", help="结束日期 YYYY-MM-DD（包含）")
+    query_parser.add_argument("--ok", action="store_true", help="只统计成功的调用")
+    query_parser.add_argument("--no-refresh", action="store_true", help="查询前不做增量索引")
+    query_parser.add_argument("--json", action="store_true", help="以 JSON 输出")
+
+    args = parser.parse_args(argv)
+    conn = connect(args.db)
+    try:
+        if args.command == "index":
+            stats = index_reports(conn, args.roots or None)
+            print(f"扫描 {stats.scanned} 个文件: 新增/更新 {stats.indexed}，未变化 {stats.unchanged}，"
+                  f"移除 {stats.removed}，失败 {stats.failed}，写入 {stats.records} 条记录，"
+                  f"耗时 {stats.elapsed_s * 1000:.1f} ms")
+            return 0
+
+        if not args.no_refresh:
+            index_reports(conn)
+        start = time.perf_counter()
+        rows = query_reports(conn, args.group_by, args.test, args.quality, args.since, args.until, args.ok)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if args.json:
+            print(json.dumps(rows, indent=2, ensure_ascii=False))
+        else:
+            print_query_result(rows, args.group_by)
+            print(f"\n查询耗时 {elapsed_ms:.1f} ms")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
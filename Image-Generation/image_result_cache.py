@@ -0,0 +1,277 @@
+# 图片生成 / 编辑结果缓存
+#
+# 一次高质量 gpt-image-2 生成最高约 $0.48、245 秒（见 report_20260422_095641.json 中的 t2i_4k），
+# workshop 反复重跑时大量 prompt + 参数组合完全相同。本模块在 Flux generations / edits 和
+# gpt-image-2 蒙版编辑前加一层内容寻址缓存：
+#   - key = sha256(调用类型, prompt, 参数, 输入图 hash, mask hash)
+#   - 响应 JSON 落盘，索引（大小 / 最近访问时间 / 原始耗时与成本）存 SQLite
+#   - 总大小超过上限时按最近访问时间（LRU）淘汰
+#   - 调用方可以选择是否接受缓存结果；每次命中都会报告节省的耗时与成本
+#
+# 用法:
+#   cache = ImageResultCache()
+#   result = cache.cached_call("flux.generations", prompt, params, call=lambda: requests.post(...).json())
+#   print(result.from_cache, result.saved_latency_s)
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Union
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent / ".image_cache"
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3  # 2 GB
+
+BytesOrPath = Union[bytes, str, Path]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key          TEXT PRIMARY KEY,
+    kind         TEXT NOT NULL,
+    prompt       TEXT,
+    size_bytes   INTEGER NOT NULL,
+    latency_s    REAL,
+    cost_usd     REAL,
+    created_at   REAL NOT NULL,
+    last_access  REAL NOT NULL,
+    hits         INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_entries_access ON entries(last_access);
+"""
+
+
+@dataclass
+class CacheEntry:
+    """缓存条目的元数据"""
+    key: str
+    kind: str
+    prompt: Optional[str]
+    size_bytes: int
+    latency_s: Optional[float]
+    cost_usd: Optional[float]
+    created_at: float
+    last_access: float
+    hits: int
+
+
+@dataclass
+class CachedResult:
+    """cached_call 的返回值"""
+    response: Optional[Dict[str, Any]]
+    key: str
+    from_cache: bool
+    latency_s: float                        # 本次实际耗时
+    saved_latency_s: float = 0.0            # 命中时节省的耗时（原始请求耗时 - 本次耗时）
+    saved_cost_usd: float = 0.0             # 命中时节省的成本
+    entry: Optional[CacheEntry] = None
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    declined: int = 0                       # 有缓存但调用方选择不使用
+    saved_latency_s: float = 0.0
+    saved_cost_usd: float = 0.0
+
+
+def hash_bytes(data: Optional[BytesOrPath]) -> Optional[str]:
+    """计算输入图 / mask 的 sha256，支持 bytes 或文件路径"""
+    if data is None:
+        return None
+    digest = hashlib.sha256()
+    if isinstance(data, (bytes, bytearray)):
+        digest.update(data)
+    else:
+        with open(data, "rb") as fp:
+            for chunk in iter(lambda: fp.read(1024 * 1024), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_cache_key(kind: str, prompt: str, params: Dict[str, Any],
+                   image: Optional[BytesOrPath] = None, mask: Optional[BytesOrPath] = None) -> str:
+    """
+    生成缓存 key
+
+    Args:
+        kind: 调用类型，例如 flux.generations / flux.edits / gpt-image-2.mask_edit（包含部署名可避免跨模型命中）
+        prompt: 提示词
+        params: 其余影响结果的参数（size / quality / n ...），按 key 排序后参与 hash
+        image: 输入图 bytes 或路径
+        mask: mask bytes 或路径
+    """
+    payload = {
+        "kind": kind,
+        "prompt": prompt,
+        "params": params,
+        "image": hash_bytes(image),
+        "mask": hash_bytes(mask),
+    }
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ImageResultCache:
+    """内容寻址的图片结果缓存（线程安全）"""
+
+    def __init__(self, cache_dir: Path = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Args:
+            cache_dir: 缓存目录
+            max_bytes: 缓存总大小上限，超过后按 LRU 淘汰
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.cache_dir / "index.sqlite"), check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _row_to_entry(self, row) -> CacheEntry:
+        return CacheEntry(*row)
+
+    def lookup(self, key: str) -> Optional[CacheEntry]:
+        """只查询元数据，不读取响应内容"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT key, kind, prompt, size_bytes, latency_s, cost_usd, created_at, last_access, hits "
+                "FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+        return self._row_to_entry(row) if row else None
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存的响应 JSON 并更新访问时间；文件丢失时自动清理索引"""
+        path = self._path(key)
+        try:
+            response = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            with self._lock, self._conn:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            return None
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE entries SET last_access = ?, hits = hits + 1 WHERE key = ?", (time.time(), key)
+            )
+        return response
+
+    def put(self, key: str, kind: str, prompt: str, response: Dict[str, Any],
+            latency_s: Optional[float] = None, cost_usd: Optional[float] = None) -> None:
+        """写入一条缓存，必要时触发淘汰"""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps(response, ensure_ascii=False).encode("utf-8")
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, kind, prompt, size_bytes, latency_s, cost_usd, "
+                "created_at, last_access, hits) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                (key, kind, prompt, len(data), latency_s, cost_usd, now, now),
+            )
+            self._evict_locked()
+
+    def _evict_locked(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size_bytes in self._conn.execute(
+            "SELECT key, size_bytes FROM entries ORDER BY last_access"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._path(key).unlink(missing_ok=True)
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size_bytes
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM entries").fetchone()[0]
+
+    def cached_call(
+        self,
+        kind: str,
+        prompt: str,
+        params: Dict[str, Any],
+        call: Callable[[], Optional[Dict[str, Any]]],
+        image: Optional[BytesOrPath] = None,
+        mask: Optional[BytesOrPath] = None,
+        accept_cached: Union[bool, Callable[[CacheEntry], bool]] = True,
+        cost_fn: Optional[Callable[[Dict[str, Any]], float]] = None,
+    ) -> CachedResult:
+        """
+        带缓存地执行一次生成 / 编辑调用
+
+        Args:
+            kind / prompt / params / image / mask: 参与缓存 key 计算，见 make_cache_key
+            call: 未命中时执行的实际请求，返回响应 JSON；返回 None 表示失败（不会缓存）
+            accept_cached: 是否接受缓存结果；也可以传入函数，根据 CacheEntry（创建时间、原始成本等）决定
+            cost_fn: 根据响应 JSON 估算成本（例如 gpt-image-2 的 estimate_cost(usage)）
+
+        Returns:
+            CachedResult，命中时包含节省的耗时与成本
+        """
+        start = time.time()
+        key = make_cache_key(kind, prompt, params, image, mask)
+        entry = self.lookup(key)
+
+        if entry is not None:
+            accepted = accept_cached(entry) if callable(accept_cached) else accept_cached
+            if accepted:
+                response = self.get(key)
+                if response is not None:
+                    latency_s = time.time() - start
+                    saved_latency_s = max((entry.latency_s or 0.0) - latency_s, 0.0)
+                    saved_cost_usd = entry.cost_usd or 0.0
+                    with self._lock:
+                        self.stats.hits += 1
+                        self.stats.saved_latency_s += saved_latency_s
+                        self.stats.saved_cost_usd += saved_cost_usd
+                    print(f"♻️ Cache hit {key[:12]}: saved {saved_latency_s:.2f}s, ${saved_cost_usd:.6f}")
+                    return CachedResult(response, key, True, latency_s, saved_latency_s, saved_cost_usd, entry)
+            else:
+                with self._lock:
+                    self.stats.declined += 1
+
+        response = call()
+        latency_s = time.time() - start
+        with self._lock:
+            self.stats.misses += 1
+        if response is not None:
+            cost_usd = cost_fn(response) if cost_fn else None
+            self.put(key, kind, prompt, response, latency_s, cost_usd)
+        return CachedResult(response, key, False, latency_s)
+
+    def print_stats(self) -> None:
+        s = self.stats
+        print(f"Cache hits: {s.hits}, misses: {s.misses}, declined: {s.declined}, "
+              f"saved {s.saved_latency_s:.2f}s / ${s.saved_cost_usd:.6f}, "
+              f"size {self.total_bytes() / 1024 / 1024:.1f} MB / {self.max_bytes / 1024 / 1024:.0f} MB")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache: Optional[ImageResultCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> ImageResultCache:
+    """进程内共享的默认缓存（首次使用时才创建目录和索引库）"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ImageResultCache()
+        return _default_cache
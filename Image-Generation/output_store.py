@@ -0,0 +1,330 @@
+# 生成图片的内容寻址存储
+#
+# workshop 的 outputs/ 目录里堆积了大量 prefix_timestamp.png 形式的多 MB PNG，重跑产生的重复图片
+# 越来越多，浏览时还必须加载原图。本模块提供一个输出存储：
+#   - 按内容 sha256 去重：objects/<hash[:2]>/<hash>.<ext>，同一张图只保存一份
+#   - SQLite 元数据索引：每次生成记录 prompt / 参数 / usage / 成本，多次生成可指向同一张图
+#   - dHash 感知哈希，用于找出“几乎相同”的重跑结果
+#   - 缩略图按需生成并缓存在 thumbs/<size>/ 下，画廊只加载缩略图
+#
+# 用法:
+#   python output_store.py import gpt-image-2/outputs      # 导入已有图片
+#   python output_store.py gallery                          # 生成 gallery.html（仅引用缩略图）
+#   python output_store.py similar <hash>                   # 查找近似重复
+#   python output_store.py stats
+
+import argparse
+import hashlib
+import html
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+DEFAULT_STORE_DIR = Path(__file__).resolve().parent / "output_store"
+DEFAULT_THUMB_SIZE = 256
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assets (
+    hash        TEXT PRIMARY KEY,
+    ext         TEXT NOT NULL,
+    size_bytes  INTEGER NOT NULL,
+    width       INTEGER,
+    height      INTEGER,
+    dhash       TEXT,
+    created_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS generations (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    hash        TEXT NOT NULL REFERENCES assets(hash),
+    prompt      TEXT,
+    params      TEXT,
+    usage       TEXT,
+    cost_usd    REAL,
+    source      TEXT,
+    created_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_generations_hash ON generations(hash);
+CREATE INDEX IF NOT EXISTS idx_generations_created ON generations(created_at);
+CREATE INDEX IF NOT EXISTS idx_generations_source ON generations(source);
+"""
+
+
+@dataclass
+class StoredAsset:
+    """put() 的返回值"""
+    hash: str
+    path: Path
+    deduplicated: bool      # True 表示内容已存在，本次没有写入新文件
+    generation_id: int
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> str:
+    """差值感知哈希（64 bit，十六进制），用于判断近似重复"""
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+def hamming_distance(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+class OutputStore:
+    """按内容去重的生成图片存储（线程安全）"""
+
+    def __init__(self, root: Path = DEFAULT_STORE_DIR):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.root / "index.sqlite"), check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+
+    def object_path(self, content_hash: str, ext: str) -> Path:
+        return self.root / "objects" / content_hash[:2] / f"{content_hash}{ext}"
+
+    def put(self, image_bytes: bytes, prompt: Optional[str] = None, params: Optional[Dict[str, Any]] = None,
+            usage: Optional[Dict[str, Any]] = None, cost_usd: Optional[float] = None,
+            source: Optional[str] = None) -> StoredAsset:
+        """
+        保存一张生成图片并记录本次生成的元数据
+
+        Args:
+            image_bytes: 图片内容（PNG / JPEG / WEBP）
+            prompt: 提示词
+            params: 生成参数（size / quality / n ...）
+            usage: API 返回的 usage
+            cost_usd: 估算成本
+            source: 来源说明，例如 flux.generations 或导入时的原始文件路径
+
+        Returns:
+            StoredAsset，内容已存在时 deduplicated=True
+        """
+        content_hash = hashlib.sha256(image_bytes).hexdigest()
+        with self._lock:
+            row = self._conn.execute("SELECT ext FROM assets WHERE hash = ?", (content_hash,)).fetchone()
+
+        deduplicated = row is not None
+        if deduplicated:
+            ext = row[0]
+        else:
+            with Image.open(BytesIO(image_bytes)) as img:
+                ext = "." + (img.format or "png").lower().replace("jpeg", "jpg")
+                width, height = img.size
+                perceptual = dhash(img)
+            path = self.object_path(content_hash, ext)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+            tmp_path.write_bytes(image_bytes)
+            os.replace(tmp_path, path)
+
+        now = time.time()
+        with self._lock, self._conn:
+            if not deduplicated:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO assets (hash, ext, size_bytes, width, height, dhash, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (content_hash, ext, len(image_bytes), width, height, perceptual, now),
+                )
+            cursor = self._conn.execute(
+                "INSERT INTO generations (hash, prompt, params, usage, cost_usd, source, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (content_hash, prompt, _dumps(params), _dumps(usage), cost_usd, source, now),
+            )
+        return StoredAsset(content_hash, self.object_path(content_hash, ext), deduplicated, cursor.lastrowid)
+
+    def has_source(self, *sources: str) -> bool:
+        """是否已经记录过来自这些 source 的生成（用于跳过重复导入）"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT 1 FROM generations WHERE source IN ({','.join('?' * len(sources))}) LIMIT 1", sources
+            ).fetchone()
+        return row is not None
+
+    def thumbnail(self, content_hash: str, size: int = DEFAULT_THUMB_SIZE) -> Path:
+        """返回缩略图路径；不存在时才读取原图生成（JPEG）"""
+        thumb_path = self.root / "thumbs" / str(size) / content_hash[:2] / f"{content_hash}.jpg"
+        if thumb_path.exists():
+            return thumb_path
+
+        with self._lock:
+            row = self._conn.execute("SELECT ext FROM assets WHERE hash = ?", (content_hash,)).fetchone()
+        if row is None:
+            raise KeyError(f"Unknown asset: {content_hash}")
+
+        thumb_path.parent.mkdir(parents=True, exist_ok=True)
+        with Image.open(self.object_path(content_hash, row[0])) as img:
+            img.draft("RGB", (size, size))  # JPEG 可以直接按缩小比例解码
+            img = img.convert("RGB")
+            img.thumbnail((size, size))
+            tmp_path = thumb_path.with_suffix(f".{threading.get_ident()}.tmp")
+            img.save(tmp_path, format="JPEG", quality=80)
+        os.replace(tmp_path, thumb_path)
+        return thumb_path
+
+    def find_similar(self, content_hash: str, max_distance: int = 6) -> List[Tuple[str, int]]:
+        """按 dHash 汉明距离查找近似重复的图片，返回 [(hash, distance), ...]"""
+        with self._lock:
+            row = self._conn.execute("SELECT dhash FROM assets WHERE hash = ?", (content_hash,)).fetchone()
+            if row is None:
+                raise KeyError(f"Unknown asset: {content_hash}")
+            candidates = self._conn.execute(
+                "SELECT hash, dhash FROM assets WHERE hash != ? AND dhash IS NOT NULL", (content_hash,)
+            ).fetchall()
+        matches = [(h, hamming_distance(row[0], d)) for h, d in candidates]
+        return sorted([m for m in matches if m[1] <= max_distance], key=lambda m: m[1])
+
+    def list_assets(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """按最近一次生成时间倒序列出图片及其最近一次生成的元数据"""
+        sql = """
+            SELECT a.hash, a.ext, a.size_bytes, a.width, a.height, g.prompt, g.params, g.usage,
+                   g.cost_usd, g.source, g.created_at, counts.n
+            FROM assets a
+            JOIN (SELECT hash, MAX(id) AS last_id, COUNT(*) AS n FROM generations GROUP BY hash) counts
+              ON counts.hash = a.hash
+            JOIN generations g ON g.id = counts.last_id
+            ORDER BY g.created_at DESC
+        """
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            cursor = self._conn.execute(sql)
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            assets, stored_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM assets"
+            ).fetchone()
+            generations, logical_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(a.size_bytes), 0) FROM generations g JOIN assets a ON a.hash = g.hash"
+            ).fetchone()
+        return {
+            "assets": assets,
+            "generations": generations,
+            "stored_mb": round(stored_bytes / 1024 / 1024, 2),
+            "deduplicated_mb": round((logical_bytes - stored_bytes) / 1024 / 1024, 2),
+        }
+
+    def write_gallery(self, out_path: Optional[Path] = None, thumb_size: int = DEFAULT_THUMB_SIZE,
+                      limit: Optional[int] = None) -> Path:
+        """生成只引用缩略图的 HTML 画廊，点击缩略图才打开原图"""
+        out_path = Path(out_path or self.root / "gallery.html")
+        cards = []
+        for asset in self.list_assets(limit):
+            thumb = self.thumbnail(asset["hash"], thumb_size)
+            original = self.object_path(asset["hash"], asset["ext"])
+            cost = f"${asset['cost_usd']:.4f}" if asset["cost_usd"] is not None else "-"
+            cards.append(
+                f'<figure><a href="{html.escape(os.path.relpath(original, out_path.parent))}">'
+                f'<img loading="lazy" src="{html.escape(os.path.relpath(thumb, out_path.parent))}"></a>'
+                f'<figcaption>{html.escape((asset["prompt"] or "")[:120])}<br>'
+                f'{asset["width"]}x{asset["height"]} · {asset["size_bytes"] / 1024:.0f} KB · {cost} · ×{asset["n"]}'
+                f'</figcaption></figure>'
+            )
+        out_path.write_text(
+            "<!doctype html><meta charset='utf-8'><title>Generated images</title>"
+            "<style>body{font-family:sans-serif;display:flex;flex-wrap:wrap;gap:12px}"
+            f"figure{{width:{thumb_size}px;margin:0}}figcaption{{font-size:12px}}</style>"
+            + "".join(cards),
+            encoding="utf-8",
+        )
+        return out_path
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _dumps(value: Optional[Dict[str, Any]]) -> Optional[str]:
+    return None if value is None else json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+
+def import_directory(store: OutputStore, directory: Path) -> Tuple[int, int, int]:
+    """
+    把已有目录中的图片导入存储；已经导入过的文件（按原始路径判断）直接跳过，重复导入不会新增记录
+
+    Returns:
+        (导入数量, 其中内容重复的数量, 跳过的已导入文件数量)
+    """
+    imported = duplicated = skipped = 0
+    for path in sorted(directory.rglob("*")):
+        if path.suffix.lower() not in IMAGE_EXTENSIONS or store.root in path.parents:
+            continue
+        source = str(path.resolve())
+        # 兼容早期按命令行相对路径记录的 source
+        if store.has_source(source, str(path)):
+            skipped += 1
+            continue
+        asset = store.put(path.read_bytes(), prompt=path.stem, source=source)
+        imported += 1
+        duplicated += asset.deduplicated
+    return imported, duplicated, skipped
+
+
+_default_store: Optional[OutputStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store() -> OutputStore:
+    """进程内共享的默认存储（首次使用时才创建目录和索引库）"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = OutputStore()
+        return _default_store
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="生成图片的内容寻址存储")
+    parser.add_argument("--root", type=Path, default=DEFAULT_STORE_DIR, help="存储目录")
+    sub = parser.add_subparsers(dest="command", required=True)
+    import_parser = sub.add_parser("import", help="导入已有目录中的图片")
+    import_parser.add_argument("directories", nargs="+", type=Path)
+    gallery_parser = sub.add_parser("gallery", help="生成缩略图画廊")
+    gallery_parser.add_argument("--size", type=int, default=DEFAULT_THUMB_SIZE)
+    gallery_parser.add_argument("--limit", type=int)
+    similar_parser = sub.add_parser("similar", help="查找近似重复的图片")
+    similar_parser.add_argument("hash")
+    similar_parser.add_argument("--max-distance", type=int, default=6)
+    sub.add_parser("stats", help="显示存储统计")
+
+    args = parser.parse_args(argv)
+    store = OutputStore(args.root)
+    try:
+        if args.command == "import":
+            for directory in args.directories:
+                imported, duplicated, skipped = import_directory(store, directory)
+                print(f"{directory}: 导入 {imported} 张，其中 {duplicated} 张与已有内容重复，跳过已导入的 {skipped} 张")
+        elif args.command == "gallery":
+            start = time.perf_counter()
+            path = store.write_gallery(thumb_size=args.size, limit=args.limit)
+            print(f"Gallery written to '{path}' in {(time.perf_counter() - start) * 1000:.0f} ms")
+        elif args.command == "similar":
+            for content_hash, distance in store.find_similar(args.hash, args.max_distance):
+                print(f"{content_hash}  distance={distance}")
+        elif args.command == "stats":
+            print(json.dumps(store.stats(), indent=2))
+        return 0
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
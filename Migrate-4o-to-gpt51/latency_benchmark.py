@@ -0,0 +1,275 @@
+# GPT-4o vs GPT-5.1 延迟 / 吞吐对比
+#
+# notebook 中的 call_chat_completions_gpt4o / call_chat_completions_gpt51_* 只打印一次响应，没有计时。
+# 这里沿用相同的请求结构（4o: max_tokens + temperature；5.1: max_completion_tokens + reasoning_effort），
+# 以流式方式调用 Chat Completions，对每个 (部署, reasoning_effort) 组合记录：
+#   - TTFT：从发送请求到收到第一个内容 token 的时间（推理模型包含思考时间）
+#   - 总延迟、输出 tokens/s（首 token 之后的生成速度）、reasoning tokens
+# 提示词集合 × 重复次数在受控并发下运行，最后输出并排对比表（p50 / p95），并保存 JSON 明细。
+#
+# 用法:
+#   python latency_benchmark.py --repeats 3 --concurrency 4
+#   python latency_benchmark.py --efforts none low medium --prompts prompts.txt --output latency_report.json
+
+import argparse
+import configparser
+import json
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import requests
+
+# 与 notebook 相同的默认配置
+DEFAULT_ENDPOINT_NAME = "jzdm-foundry-swn"
+DEPLOYMENT_GPT4O = "gpt-4o-08-06-globalstandard"
+DEPLOYMENT_GPT51 = "gpt-5.1-globalstandard"
+API_VERSION = "2025-04-01-preview"
+REASONING_EFFORTS = ["none", "minimal", "low", "medium", "high"]
+
+DEFAULT_PROMPTS = [
+    "什么是量子计算？请用一句话简要说明。",
+    "一个农夫有鸡和兔子。他数了数，一共有35个头，94只脚。请问农夫有多少只鸡，多少只兔子？",
+    "用 Python 写一个函数，判断一个字符串是否是回文，并简要说明时间复杂度。",
+]
+
+
+@dataclass
+class BenchmarkCase:
+    """一个被测组合"""
+    label: str
+    deployment: str
+    reasoning_effort: Optional[str]  # None 表示 GPT-4o（不支持该参数）
+
+
+@dataclass
+class CallResult:
+    label: str
+    prompt_index: int
+    repeat: int
+    ok: bool
+    status_code: Optional[int] = None
+    ttft_s: Optional[float] = None
+    total_s: Optional[float] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    reasoning_tokens: int = 0
+    cached_tokens: int = 0
+    tokens_per_s: Optional[float] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class AzureOpenAIEndpoint:
+    api_key: str
+    base_url: str
+
+    @classmethod
+    def load(cls, endpoint_name: str = DEFAULT_ENDPOINT_NAME) -> "AzureOpenAIEndpoint":
+        """优先读取环境变量 AZURE_OPENAI_API_KEY，否则与 notebook 一样从 .config 的 AOAIEndpoints 段读取"""
+        api_key = os.environ.get("AZURE_OPENAI_API_KEY")
+        if not api_key:
+            repo_root = Path.cwd().resolve()
+            while not (repo_root / ".config").exists() and repo_root != repo_root.parent:
+                repo_root = repo_root.parent
+            config = configparser.ConfigParser()
+            config.read(repo_root / ".config")
+            api_key = config.get("AOAIEndpoints", endpoint_name)
+        return cls(api_key=api_key, base_url=f"https://{endpoint_name}.openai.azure.com")
+
+
+def build_payload(case: BenchmarkCase, prompt: str, max_output_tokens: int) -> Dict[str, Any]:
+    """与 notebook 中对应函数相同的请求体，额外打开流式和 usage 统计"""
+    payload: Dict[str, Any] = {
+        "messages": [
+            {"role": "system", "content": "你是一个有帮助的助手。"},
+            {"role": "user", "content": prompt},
+        ],
+        "stream": True,
+        "stream_options": {"include_usage": True},
+    }
+    if case.reasoning_effort is None:
+        # call_chat_completions_gpt4o
+        payload.update({"max_tokens": max_output_tokens, "temperature": 0.7, "top_p": 0.95,
+                        "frequency_penalty": 0, "presence_penalty": 0})
+    elif case.reasoning_effort == "none":
+        # call_chat_completions_gpt51_no_reasoning
+        payload.update({"max_completion_tokens": max_output_tokens, "temperature": 0.7, "reasoning_effort": "none"})
+    else:
+        # call_chat_completions_gpt51_with_reasoning：推理 token 也计入上限，给足空间
+        payload.update({"max_completion_tokens": max_output_tokens * 4, "reasoning_effort": case.reasoning_effort})
+    return payload
+
+
+class LatencyBenchmark:
+    """在受控并发下对多个组合做流式调用并统计"""
+
+    def __init__(self, endpoint: AzureOpenAIEndpoint, concurrency: int = 4, timeout: float = 300,
+                 max_output_tokens: int = 1000):
+        self.endpoint = endpoint
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_output_tokens = max_output_tokens
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def call(self, case: BenchmarkCase, prompt_index: int, prompt: str, repeat: int) -> CallResult:
+        """一次流式调用"""
+        result = CallResult(label=case.label, prompt_index=prompt_index, repeat=repeat, ok=False)
+        url = f"{self.endpoint.base_url}/openai/deployments/{case.deployment}/chat/completions?api-version={API_VERSION}"
+        headers = {"Content-Type": "application/json", "api-key": self.endpoint.api_key}
+        start = time.perf_counter()
+        try:
+            with self._session().post(url, headers=headers, json=build_payload(case, prompt, self.max_output_tokens),
+                                      stream=True, timeout=self.timeout) as response:
+                result.status_code = response.status_code
+                if response.status_code != 200:
+                    result.error = response.text[:500]
+                    return result
+                usage = {}
+                # chunk_size=None：按服务端发送的分块立即产出，默认的 512 字节缓冲会推迟首 token
+                for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    if chunk.get("usage"):
+                        usage = chunk["usage"]
+                    for choice in chunk.get("choices") or []:
+                        if result.ttft_s is None and (choice.get("delta") or {}).get("content"):
+                            result.ttft_s = time.perf_counter() - start
+            result.total_s = time.perf_counter() - start
+        except (requests.RequestException, ValueError) as e:
+            result.error = f"{type(e).__name__}: {e}"
+            return result
+
+        result.ok = True
+        result.prompt_tokens = usage.get("prompt_tokens", 0)
+        result.completion_tokens = usage.get("completion_tokens", 0)
+        result.reasoning_tokens = (usage.get("completion_tokens_details") or {}).get("reasoning_tokens", 0) or 0
+        result.cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
+        if result.ttft_s is None:
+            result.ttft_s = result.total_s
+        # 可见输出的生成速度：首 token 之后的时间内生成的非推理 token
+        generation_s = result.total_s - result.ttft_s
+        visible_tokens = result.completion_tokens - result.reasoning_tokens
+        if generation_s > 0 and visible_tokens > 0:
+            result.tokens_per_s = visible_tokens / generation_s
+        return result
+
+    def run(self, cases: List[BenchmarkCase], prompts: List[str], repeats: int = 3) -> List[CallResult]:
+        """
+        运行所有组合
+
+        不同组合的请求交错提交，避免某个组合总是在服务端负载较高的时段运行
+        """
+        jobs = [(case, i, prompt, r) for r in range(repeats) for i, prompt in enumerate(prompts) for case in cases]
+        results: List[CallResult] = []
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for result in executor.map(lambda job: self.call(*job), jobs):
+                mark = "✅" if result.ok else "❌"
+                ttft = f"{result.ttft_s:.2f}s" if result.ttft_s is not None else "-"
+                total = f"{result.total_s:.2f}s" if result.total_s is not None else "-"
+                print(f"{mark} {result.label:<20} prompt={result.prompt_index} repeat={result.repeat} "
+                      f"ttft={ttft} total={total} reasoning={result.reasoning_tokens}")
+                results.append(result)
+        return results
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(int(round(pct / 100 * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+def summarize(results: List[CallResult], cases: List[BenchmarkCase]) -> List[Dict[str, Any]]:
+    """按组合汇总 p50 / p95"""
+    rows = []
+    for case in cases:
+        items = [r for r in results if r.label == case.label]
+        ok = [r for r in items if r.ok]
+        ttft = [r.ttft_s for r in ok]
+        total = [r.total_s for r in ok]
+        tps = [r.tokens_per_s for r in ok if r.tokens_per_s]
+        rows.append({
+            "label": case.label,
+            "deployment": case.deployment,
+            "reasoning_effort": case.reasoning_effort,
+            "calls": len(items),
+            "errors": len(items) - len(ok),
+            "ttft_p50_s": _percentile(ttft, 50),
+            "ttft_p95_s": _percentile(ttft, 95),
+            "total_p50_s": _percentile(total, 50),
+            "total_p95_s": _percentile(total, 95),
+            "tokens_per_s_avg": statistics.mean(tps) if tps else None,
+            "reasoning_tokens_avg": statistics.mean(r.reasoning_tokens for r in ok) if ok else None,
+            "completion_tokens_avg": statistics.mean(r.completion_tokens for r in ok) if ok else None,
+        })
+    return rows
+
+
+def print_report(rows: List[Dict[str, Any]]) -> None:
+    """并排对比表"""
+    def fmt(value, digits=2):
+        return "-" if value is None else f"{value:.{digits}f}"
+
+    header = (f"{'组合':<20} {'调用':>4} {'失败':>4} {'TTFT p50':>9} {'TTFT p95':>9} "
+              f"{'总延迟 p50':>10} {'总延迟 p95':>10} {'tok/s':>7} {'推理 tok':>8} {'输出 tok':>8}")
+    print("\n" + "=" * len(header))
+    print(header)
+    print("=" * len(header))
+    for row in rows:
+        print(f"{row['label']:<20} {row['calls']:>4} {row['errors']:>4} {fmt(row['ttft_p50_s']):>9} "
+              f"{fmt(row['ttft_p95_s']):>9} {fmt(row['total_p50_s']):>10} {fmt(row['total_p95_s']):>10} "
+              f"{fmt(row['tokens_per_s_avg'], 1):>7} {fmt(row['reasoning_tokens_avg'], 0):>8} "
+              f"{fmt(row['completion_tokens_avg'], 0):>8}")
+
+
+def build_cases(efforts: List[str], include_gpt4o: bool = True) -> List[BenchmarkCase]:
+    cases = [BenchmarkCase("gpt-4o", DEPLOYMENT_GPT4O, None)] if include_gpt4o else []
+    cases += [BenchmarkCase(f"gpt-5.1/{effort}", DEPLOYMENT_GPT51, effort) for effort in efforts]
+    return cases
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare GPT-4o and GPT-5.1 latency across reasoning_effort levels")
+    parser.add_argument("--endpoint", default=DEFAULT_ENDPOINT_NAME)
+    parser.add_argument("--efforts", nargs="+", default=REASONING_EFFORTS, choices=REASONING_EFFORTS)
+    parser.add_argument("--no-gpt4o", action="store_true")
+    parser.add_argument("--prompts", help="Prompt file, one prompt per line")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--max-output-tokens", type=int, default=1000)
+    parser.add_argument("--output", default=f"latency_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    args = parser.parse_args()
+
+    prompts = DEFAULT_PROMPTS
+    if args.prompts:
+        with open(args.prompts, "r", encoding="utf-8") as fp:
+            prompts = [line.strip() for line in fp if line.strip()]
+
+    cases = build_cases(args.efforts, include_gpt4o=not args.no_gpt4o)
+    benchmark = LatencyBenchmark(AzureOpenAIEndpoint.load(args.endpoint), concurrency=args.concurrency,
+                                 max_output_tokens=args.max_output_tokens)
+    results = benchmark.run(cases, prompts, repeats=args.repeats)
+    rows = summarize(results, cases)
+    print_report(rows)
+
+    with open(args.output, "w", encoding="utf-8") as fp:
+        json.dump({"summary": rows, "calls": [asdict(r) for r in results], "prompts": prompts,
+                   "concurrency": args.concurrency, "repeats": args.repeats}, fp, indent=2, ensure_ascii=False)
+    print(f"\n📄 Report saved to {args.output}")
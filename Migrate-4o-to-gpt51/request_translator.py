@@ -0,0 +1,369 @@
+# 请求转换与本地预校验
+#
+# notebook 中的 wrong_way_a（max_tokens）和 wrong_way_b（reasoning_effort + temperature）都要完整走一次网络
+# 才拿到 400，生产环境里这意味着白白浪费的延迟以及重试风暴。RequestTranslator 在发送前：
+#   - 按目标部署的模型家族改写请求：max_tokens -> max_completion_tokens（Responses API 为 max_output_tokens），
+#     reasoning_effort 与 reasoning.effort 互转，不支持推理的模型去掉 reasoning 参数，超出上限的输出长度截断
+#   - 推理模式下的 temperature / top_p 等采样参数：默认移除并记录，strict 模式下直接在本地拒绝
+#   - 不合法的取值（例如未知的 reasoning_effort）在本地拒绝，不发送请求
+#   - 部署 -> 能力画像的映射缓存在内存和 JSON 文件中：显式配置 > 缓存（含从响应 model 字段学到的） > 名称推断
+#   - 统计被改写 / 被拒绝的请求数及各规则命中次数
+#
+# 用法:
+#   translator = RequestTranslator()
+#   payload = translator.prepare(DEPLOYMENT_GPT51, payload)          # 不合法时抛出 LocalValidationError
+#   result = translator.translate(DEPLOYMENT_GPT51, payload, api="responses")
+
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_PROFILE_CACHE = Path(__file__).resolve().parent / "capability_profiles.json"
+SAMPLING_PARAMS = ("temperature", "top_p", "presence_penalty", "frequency_penalty", "logprobs", "top_logprobs", "logit_bias")
+
+
+@dataclass(frozen=True)
+class ModelProfile:
+    """一个模型家族的参数能力"""
+    family: str
+    token_limit_param: str                     # Chat Completions 首选的输出上限参数
+    accepted_token_params: Tuple[str, ...] = ("max_completion_tokens",)
+    reasoning_efforts: Tuple[str, ...] = ()    # 为空表示不支持推理参数
+    default_effort: Optional[str] = None
+    sampling_requires_no_reasoning: bool = False  # 采样参数只能在 effort=none 时使用
+    supports_sampling: bool = True
+    max_output_tokens: int = 16384
+
+
+# 与 notebook 开头的“关键差异总结”一致
+MODEL_PROFILES: Dict[str, ModelProfile] = {
+    "gpt-4o": ModelProfile("gpt-4o", token_limit_param="max_tokens",
+                           accepted_token_params=("max_tokens", "max_completion_tokens"), max_output_tokens=16384),
+    "gpt-4.1": ModelProfile("gpt-4.1", token_limit_param="max_tokens",
+                            accepted_token_params=("max_tokens", "max_completion_tokens"), max_output_tokens=32768),
+    "gpt-5.1": ModelProfile(
+        "gpt-5.1", token_limit_param="max_completion_tokens",
+        reasoning_efforts=("none", "minimal", "low", "medium", "high"), default_effort="none",
+        sampling_requires_no_reasoning=True, max_output_tokens=128000,
+    ),
+    "gpt-5": ModelProfile(
+        "gpt-5", token_limit_param="max_completion_tokens",
+        reasoning_efforts=("minimal", "low", "medium", "high"), default_effort="medium",
+        supports_sampling=False, max_output_tokens=128000,
+    ),
+    "o-series": ModelProfile(
+        "o-series", token_limit_param="max_completion_tokens",
+        reasoning_efforts=("low", "medium", "high"), default_effort="medium",
+        supports_sampling=False, max_output_tokens=100000,
+    ),
+}
+
+# 名称 / model 字段 -> 家族，按顺序匹配
+FAMILY_PATTERNS = [
+    (re.compile(r"gpt-?5\.1"), "gpt-5.1"),
+    (re.compile(r"gpt-?5"), "gpt-5"),
+    (re.compile(r"gpt-?4\.1"), "gpt-4.1"),
+    (re.compile(r"gpt-?4o"), "gpt-4o"),
+    (re.compile(r"(^|[^a-z])o[134](-|$|[^a-z0-9])"), "o-series"),
+]
+
+
+def infer_family(name: str) -> Optional[str]:
+    name = (name or "").lower()
+    for pattern, family in FAMILY_PATTERNS:
+        if pattern.search(name):
+            return family
+    return None
+
+
+class LocalValidationError(ValueError):
+    """请求在本地校验失败，未发送"""
+
+    def __init__(self, deployment: str, errors: List[str]):
+        super().__init__(f"Request to '{deployment}' rejected locally: " + "; ".join(errors))
+        self.deployment = deployment
+        self.errors = errors
+
+
+@dataclass
+class TranslationResult:
+    payload: Dict[str, Any]
+    profile: ModelProfile
+    rewrites: List[str] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+    rules: List[str] = field(default_factory=list)  # 命中的规则名，用于统计
+
+    def rewrite(self, rule: str, message: str) -> None:
+        self.rules.append(rule)
+        self.rewrites.append(message)
+
+    def reject(self, rule: str, message: str) -> None:
+        self.rules.append(rule)
+        self.errors.append(message)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+class CapabilityRegistry:
+    """部署 -> 模型能力画像，内存 + JSON 文件缓存"""
+
+    def __init__(self, overrides: Optional[Dict[str, str]] = None, cache_path: Optional[Path] = DEFAULT_PROFILE_CACHE,
+                 ttl_s: float = 7 * 24 * 3600):
+        """
+        Args:
+            overrides: 显式指定 部署名 -> 家族
+            cache_path: 缓存文件，None 表示只在内存中
+            ttl_s: 缓存条目有效期（部署可能被自动升级到新模型）
+        """
+        self.overrides = dict(overrides or {})
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._cache: Dict[str, Dict[str, Any]] = {}
+        if self.cache_path and self.cache_path.exists():
+            try:
+                self._cache = json.loads(self.cache_path.read_text(encoding="utf-8"))
+            except ValueError:
+                self._cache = {}
+
+    def _save(self) -> None:
+        if not self.cache_path:
+            return
+        tmp_path = self.cache_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self._cache, indent=2), encoding="utf-8")
+        os.replace(tmp_path, self.cache_path)
+
+    def resolve(self, deployment: str) -> ModelProfile:
+        """
+        Raises:
+            LocalValidationError: 部署名无法推断模型家族，且没有显式配置或缓存
+        """
+        if deployment in self.overrides:
+            return MODEL_PROFILES[self.overrides[deployment]]
+        with self._lock:
+            entry = self._cache.get(deployment)
+            if entry and time.time() - entry["learned_at"] < self.ttl_s:
+                return MODEL_PROFILES[entry["family"]]
+        family = infer_family(deployment)
+        if family is None:
+            if entry:
+                # 自定义部署名（如 prod-chat）无法按名称推断，过期的缓存仍比直接拒绝更可靠
+                return MODEL_PROFILES[entry["family"]]
+            raise LocalValidationError(deployment, [
+                f"unknown model family for deployment '{deployment}', add it to CapabilityRegistry overrides"
+            ])
+        self.remember(deployment, family, source="name")
+        return MODEL_PROFILES[family]
+
+    def remember(self, deployment: str, family: str, source: str, model: Optional[str] = None) -> None:
+        with self._lock:
+            self._cache[deployment] = {"family": family, "model": model, "source": source, "learned_at": time.time()}
+            self._save()
+
+    def learn_from_response(self, deployment: str, response_json: Dict[str, Any]) -> None:
+        """用响应中的 model 字段（例如 gpt-5.1-2025-11-13）校正画像，部署被自动升级后也能跟上"""
+        model = (response_json or {}).get("model")
+        family = infer_family(model) if model else None
+        if family is None:
+            return
+        with self._lock:
+            current = self._cache.get(deployment, {})
+            if current.get("family") == family and current.get("source") == "response":
+                # 每次确认都刷新有效期，避免按 TTL 过期后被名称推断覆盖；落盘按 ttl 的 1/10 节流
+                now = time.time()
+                saved_at = current["learned_at"]
+                current["learned_at"] = now
+                current["model"] = model
+                if now - saved_at > self.ttl_s / 10:
+                    self._save()
+                return
+        self.remember(deployment, family, source="response", model=model)
+
+
+class RequestTranslator:
+    """按目标部署改写并校验请求体"""
+
+    def __init__(self, registry: Optional[CapabilityRegistry] = None, strict_sampling: bool = False):
+        """
+        Args:
+            registry: 能力画像缓存
+            strict_sampling: True 时推理模式下的采样参数直接拒绝，False 时移除并记录
+        """
+        self.registry = registry or CapabilityRegistry()
+        self.strict_sampling = strict_sampling
+        self._lock = threading.Lock()
+        self.counters: Counter = Counter()
+
+    def translate(self, deployment: str, payload: Dict[str, Any], api: str = "chat") -> TranslationResult:
+        """
+        Args:
+            deployment: 部署名（Responses API 中即 model 字段）
+            payload: 原始请求体（不会被修改）
+            api: "chat"（Chat Completions）或 "responses"
+
+        Returns:
+            TranslationResult（改写后的请求体、改写记录、错误）
+
+        Raises:
+            LocalValidationError: 无法确定部署对应的模型家族
+        """
+        try:
+            profile = self.registry.resolve(deployment)
+        except LocalValidationError:
+            with self._lock:
+                self.counters["requests"] += 1
+                self.counters["rejected"] += 1
+                self.counters["rule:unknown_deployment"] += 1
+            raise
+        result = TranslationResult(payload=json.loads(json.dumps(payload)), profile=profile)
+        body = result.payload
+
+        self._translate_token_limit(body, profile, api, result)
+        effort = self._translate_reasoning(body, profile, api, result)
+        self._translate_sampling(body, profile, effort, result)
+        self._update_counters(result)
+        return result
+
+    def prepare(self, deployment: str, payload: Dict[str, Any], api: str = "chat") -> Dict[str, Any]:
+        """translate 的简便形式：有错误时抛出 LocalValidationError"""
+        result = self.translate(deployment, payload, api)
+        if not result.ok:
+            raise LocalValidationError(deployment, result.errors)
+        for rewrite in result.rewrites:
+            print(f"🔧 [{deployment}] {rewrite}")
+        return result.payload
+
+    # ---------- 规则 ----------
+
+    def _translate_token_limit(self, body: Dict[str, Any], profile: ModelProfile, api: str,
+                               result: TranslationResult) -> None:
+        accepted = ("max_output_tokens",) if api == "responses" else profile.accepted_token_params
+        present = [name for name in ("max_tokens", "max_completion_tokens", "max_output_tokens") if name in body]
+        if not present:
+            return
+        # 同时出现多个时以目标 API 认可的参数为准
+        target = next((name for name in present if name in accepted),
+                      "max_output_tokens" if api == "responses" else profile.token_limit_param)
+        value = body[target] if target in body else body[present[0]]
+        for name in present:
+            body.pop(name)
+            if name != target:
+                result.rewrite("token_limit_param", f"{name} -> {target}")
+        if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+            result.reject("token_limit_value", f"{target} must be a positive integer, got {value!r}")
+        elif value > profile.max_output_tokens:
+            result.rewrite("token_limit_clamp", f"{target} clamped {value} -> {profile.max_output_tokens}")
+            value = profile.max_output_tokens
+        body[target] = value
+
+    def _translate_reasoning(self, body: Dict[str, Any], profile: ModelProfile, api: str,
+                             result: TranslationResult) -> Optional[str]:
+        effort = body.pop("reasoning_effort", None)
+        reasoning = body.pop("reasoning", None)
+        if isinstance(reasoning, dict) and reasoning.get("effort") is not None:
+            if effort is not None and effort != reasoning["effort"]:
+                result.reject("reasoning_conflict",
+                              f"conflicting reasoning_effort={effort!r} and reasoning.effort={reasoning['effort']!r}")
+            effort = reasoning["effort"]
+            if api == "chat":
+                result.rewrite("reasoning_param", "reasoning.effort -> reasoning_effort")
+        elif effort is not None and api == "responses":
+            result.rewrite("reasoning_param", "reasoning_effort -> reasoning.effort")
+
+        if not profile.reasoning_efforts:
+            if effort is not None or reasoning:
+                result.rewrite("reasoning_unsupported", f"removed reasoning parameters ({profile.family} does not support them)")
+            return None
+        if effort is not None and effort not in profile.reasoning_efforts:
+            result.reject("reasoning_effort_value", f"reasoning effort {effort!r} not supported by {profile.family}, "
+                                                    f"expected one of {list(profile.reasoning_efforts)}")
+            return effort
+
+        if effort is not None:
+            if api == "responses":
+                body["reasoning"] = {**(reasoning if isinstance(reasoning, dict) else {}), "effort": effort}
+            else:
+                body["reasoning_effort"] = effort
+        elif isinstance(reasoning, dict) and api == "responses":
+            body["reasoning"] = reasoning
+        return effort if effort is not None else profile.default_effort
+
+    def _translate_sampling(self, body: Dict[str, Any], profile: ModelProfile, effort: Optional[str],
+                            result: TranslationResult) -> None:
+        present = [name for name in SAMPLING_PARAMS if name in body]
+        if not present:
+            return
+        if profile.supports_sampling and not (profile.sampling_requires_no_reasoning and effort not in (None, "none")):
+            return
+        reason = (f"not supported by {profile.family}" if not profile.supports_sampling
+                  else f"not allowed with reasoning effort {effort!r}")
+        if self.strict_sampling:
+            result.reject("sampling_params", f"{', '.join(present)} {reason}")
+            return
+        for name in present:
+            body.pop(name)
+        result.rewrite("sampling_params", f"removed {', '.join(present)} ({reason})")
+
+    def _update_counters(self, result: TranslationResult) -> None:
+        with self._lock:
+            self.counters["requests"] += 1
+            if result.errors:
+                self.counters["rejected"] += 1
+            elif result.rewrites:
+                self.counters["rewritten"] += 1
+            for rule in result.rules:
+                self.counters[f"rule:{rule}"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters)
+
+
+def post_chat_completions(translator: RequestTranslator, base_url: str, api_key: str, deployment: str,
+                          payload: Dict[str, Any], api_version: str = "2025-04-01-preview", session: Any = None):
+    """
+    改写 + 校验后再发送 Chat Completions 请求，并从响应中学习部署对应的模型
+
+    Raises:
+        LocalValidationError: 本地校验失败，请求未发送
+    """
+    import requests
+
+    body = translator.prepare(deployment, payload)
+    url = f"{base_url}/openai/deployments/{deployment}/chat/completions?api-version={api_version}"
+    response = (session or requests).post(url, headers={"Content-Type": "application/json", "api-key": api_key}, json=body)
+    if response.status_code == 200:
+        translator.registry.learn_from_response(deployment, response.json())
+    return response
+
+
+if __name__ == "__main__":
+    # 用 notebook 中两个错误示例的请求体演示本地改写 / 拒绝（不发送任何请求）
+    translator = RequestTranslator(CapabilityRegistry(cache_path=None))
+    messages = [{"role": "system", "content": "你是一个有帮助的助手。"}, {"role": "user", "content": "1+1等于几？"}]
+    samples = {
+        "wrong_way_a": ("gpt-5.1-globalstandard", {"messages": messages, "max_tokens": 1000, "temperature": 0.7,
+                                                   "top_p": 0.95, "frequency_penalty": 0, "presence_penalty": 0}),
+        "wrong_way_b": ("gpt-5.1-globalstandard", {"messages": messages, "max_completion_tokens": 2000,
+                                                   "reasoning_effort": "medium", "temperature": 0.7}),
+        "bad_effort": ("gpt-5.1-globalstandard", {"messages": messages, "reasoning_effort": "extreme"}),
+        "gpt4o_with_effort": ("gpt-4o-08-06-globalstandard", {"messages": messages, "max_completion_tokens": 500,
+                                                              "reasoning_effort": "low"}),
+    }
+    for name, (deployment, payload) in samples.items():
+        result = translator.translate(deployment, payload)
+        print(f"\n=== {name} -> {deployment} ({'ok' if result.ok else 'rejected'}) ===")
+        for rewrite in result.rewrites:
+            print(f"  🔧 {rewrite}")
+        for error in result.errors:
+            print(f"  ⛔ {error}")
+        print(f"  payload keys: {sorted(k for k in result.payload if k != 'messages')}")
+    print(f"\n📊 {translator.stats()}")
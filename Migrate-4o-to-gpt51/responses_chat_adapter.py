@@ -0,0 +1,272 @@
+# 基于 Responses API 的 Chat 风格适配器
+#
+# notebook 中的 call_chat_completions_* 每次都把完整的 messages 历史发给服务端，对话越长请求体越大，
+# 输入 token 随轮数平方增长。ResponsesChatAdapter 保留 chat 风格的接口（传入完整的 messages，返回 choices / usage），
+# 内部改用 Responses API：
+#   - 与上一次已发送的历史做前缀比对，只把新增的消息作为 input 发送，并用 previous_response_id 串联上下文
+#   - 历史被修改 / 截断、上一个 response 不存在（过期或 store 关闭）等情况自动退回完整历史模式
+#   - max_tokens / reasoning_effort 等参数经 request_translator.py 转换为 Responses API 的写法
+#
+# benchmark_conversation 用同一组多轮对话分别走 Chat Completions（完整历史）与本适配器，
+# 逐轮记录发送字节数、input tokens 和 cached tokens。
+# 注意：使用 previous_response_id 时服务端仍会把之前的上下文计入 input tokens（通常以 cached tokens 的形式命中缓存），
+# 节省主要体现在发送的字节数和请求构造 / 传输时间上。
+#
+# 用法:
+#   python responses_chat_adapter.py --turns 6 --output chain_benchmark.json
+
+import argparse
+import json
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from latency_benchmark import API_VERSION, DEFAULT_ENDPOINT_NAME, DEPLOYMENT_GPT51, AzureOpenAIEndpoint
+from request_translator import RequestTranslator
+
+DEFAULT_TURNS = [
+    "我想用 Python 写一个简单的待办事项命令行工具，先帮我设计一下数据结构。",
+    "很好。现在加上按优先级排序的功能。",
+    "如果要把数据持久化到 JSON 文件，应该怎么改？",
+    "再加一个按截止日期过滤的命令。",
+    "帮我写几个单元测试覆盖上面的功能。",
+    "最后总结一下整个工具的结构。",
+]
+
+
+@dataclass
+class TurnStats:
+    path: str
+    turn: int
+    mode: str                 # full_history / chained
+    bytes_sent: int
+    input_tokens: int
+    cached_tokens: int
+    output_tokens: int
+    latency_s: float
+
+
+def extract_output_text(response_json: Dict[str, Any]) -> str:
+    """REST 响应中没有 SDK 的 output_text 便捷字段，从 output 列表中拼出文本"""
+    if response_json.get("output_text"):
+        return response_json["output_text"]
+    texts = []
+    for item in response_json.get("output", []):
+        if item.get("type") == "message":
+            texts.extend(c.get("text", "") for c in item.get("content", []) if c.get("type") == "output_text")
+    return "".join(texts)
+
+
+def chat_finish_reason(response_json: Dict[str, Any]) -> Optional[str]:
+    """把 Responses API 的 status / incomplete_details.reason 映射为 Chat Completions 的 finish_reason"""
+    status = response_json.get("status")
+    if status == "incomplete":
+        reason = (response_json.get("incomplete_details") or {}).get("reason")
+        return {"max_output_tokens": "length", "content_filter": "content_filter"}.get(reason, "length")
+    if status == "completed":
+        if any(item.get("type") == "function_call" for item in response_json.get("output", [])):
+            return "tool_calls"
+        return "stop"
+    return status
+
+
+def _previous_response_unusable(response: requests.Response) -> bool:
+    """404，或错误内容指向 previous_response_id 的 400（过期 / 未存储）；其它参数错误不重试"""
+    if response.status_code == 404:
+        return True
+    return response.status_code == 400 and "previous_response" in response.text
+
+
+def _to_input_item(message: Dict[str, Any]) -> Dict[str, Any]:
+    return {"role": message["role"], "content": message["content"]}
+
+
+class ResponsesChatAdapter:
+    """chat(messages) -> Chat Completions 形状的结果，底层使用 Responses API 串联"""
+
+    def __init__(self, endpoint: AzureOpenAIEndpoint, deployment: str, translator: Optional[RequestTranslator] = None,
+                 use_chaining: bool = True, timeout: float = 300):
+        """
+        Args:
+            endpoint: Azure OpenAI endpoint
+            deployment: 部署名（Responses API 的 model）
+            translator: 参数转换器（max_tokens -> max_output_tokens 等）
+            use_chaining: False 时始终发送完整历史
+            timeout: 请求超时（秒）
+        """
+        self.endpoint = endpoint
+        self.deployment = deployment
+        self.translator = translator or RequestTranslator()
+        self.use_chaining = use_chaining
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.last_response_id: Optional[str] = None
+        self.sent_history: List[Dict[str, Any]] = []  # 服务端上下文中已有的消息（含 assistant 回复）
+        self.turn_stats: List[TurnStats] = []
+        self.fallbacks = 0
+        self._last_bytes = 0
+
+    def _split_messages(self, messages: List[Dict[str, Any]]):
+        """system 消息转为 instructions（不会随 previous_response_id 继承，每次都要带上）"""
+        instructions = "\n\n".join(m["content"] for m in messages if m["role"] in ("system", "developer")) or None
+        conversation = [m for m in messages if m["role"] not in ("system", "developer")]
+        return instructions, conversation
+
+    def _post(self, payload: Dict[str, Any]) -> requests.Response:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self._last_bytes = len(body)
+        return self.session.post(
+            f"{self.endpoint.base_url}/openai/v1/responses",
+            headers={"Content-Type": "application/json", "api-key": self.endpoint.api_key},
+            data=body, timeout=self.timeout,
+        )
+
+    def chat(self, messages: List[Dict[str, Any]], **params: Any) -> Dict[str, Any]:
+        """
+        Args:
+            messages: 与 Chat Completions 相同的完整消息列表
+            params: max_tokens / max_completion_tokens / temperature / reasoning_effort 等
+
+        Returns:
+            Chat Completions 形状的 dict（id / choices / usage），另附 response_id 与 mode
+        """
+        instructions, conversation = self._split_messages(messages)
+        known = len(self.sent_history)
+        can_chain = (self.use_chaining and self.last_response_id is not None
+                     and conversation[:known] == self.sent_history and len(conversation) > known)
+
+        start = time.time()
+        payload = self._build_payload(instructions, conversation[known:] if can_chain else conversation,
+                                      self.last_response_id if can_chain else None, params)
+        response = self._post(payload)
+        mode = "chained" if can_chain else "full_history"
+
+        if can_chain and _previous_response_unusable(response):
+            # 上一个 response 已过期 / 未存储等：退回完整历史
+            print(f"⚠️ Chaining failed ({response.status_code}), falling back to full history")
+            self.fallbacks += 1
+            payload = self._build_payload(instructions, conversation, None, params)
+            response = self._post(payload)
+            mode = "full_history"
+        response.raise_for_status()
+        data = response.json()
+
+        text = extract_output_text(data)
+        self.last_response_id = data.get("id")
+        self.sent_history = conversation + [{"role": "assistant", "content": text}]
+
+        usage = data.get("usage") or {}
+        stats = TurnStats(
+            path="responses", turn=len(self.turn_stats) + 1, mode=mode, bytes_sent=self._last_bytes,
+            input_tokens=usage.get("input_tokens", 0),
+            cached_tokens=(usage.get("input_tokens_details") or {}).get("cached_tokens", 0),
+            output_tokens=usage.get("output_tokens", 0), latency_s=time.time() - start,
+        )
+        self.turn_stats.append(stats)
+        return {
+            "id": data.get("id"),
+            "response_id": data.get("id"),
+            "mode": mode,
+            "model": data.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": chat_finish_reason(data)}],
+            "usage": {
+                "prompt_tokens": stats.input_tokens,
+                "completion_tokens": stats.output_tokens,
+                "total_tokens": stats.input_tokens + stats.output_tokens,
+                "prompt_tokens_details": {"cached_tokens": stats.cached_tokens},
+                "completion_tokens_details": {
+                    "reasoning_tokens": (usage.get("output_tokens_details") or {}).get("reasoning_tokens", 0)
+                },
+            },
+        }
+
+    def _build_payload(self, instructions: Optional[str], input_messages: List[Dict[str, Any]],
+                       previous_response_id: Optional[str], params: Dict[str, Any]) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {"model": self.deployment, "input": [_to_input_item(m) for m in input_messages],
+                                   "store": True, **params}
+        if instructions:
+            payload["instructions"] = instructions
+        if previous_response_id:
+            payload["previous_response_id"] = previous_response_id
+        return self.translator.prepare(self.deployment, payload, api="responses")
+
+
+class ChatCompletionsSession:
+    """对照组：与 notebook 相同的 Chat Completions 调用，每轮发送完整历史"""
+
+    def __init__(self, endpoint: AzureOpenAIEndpoint, deployment: str, translator: Optional[RequestTranslator] = None,
+                 timeout: float = 300):
+        self.endpoint = endpoint
+        self.deployment = deployment
+        self.translator = translator or RequestTranslator()
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.turn_stats: List[TurnStats] = []
+
+    def chat(self, messages: List[Dict[str, Any]], **params: Any) -> Dict[str, Any]:
+        payload = self.translator.prepare(self.deployment, {"messages": messages, **params})
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        start = time.time()
+        response = self.session.post(
+            f"{self.endpoint.base_url}/openai/deployments/{self.deployment}/chat/completions?api-version={API_VERSION}",
+            headers={"Content-Type": "application/json", "api-key": self.endpoint.api_key},
+            data=body, timeout=self.timeout,
+        )
+        response.raise_for_status()
+        data = response.json()
+        usage = data.get("usage") or {}
+        self.turn_stats.append(TurnStats(
+            path="chat_completions", turn=len(self.turn_stats) + 1, mode="full_history", bytes_sent=len(body),
+            input_tokens=usage.get("prompt_tokens", 0),
+            cached_tokens=(usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0),
+            output_tokens=usage.get("completion_tokens", 0), latency_s=time.time() - start,
+        ))
+        return data
+
+
+def run_conversation(client: Any, turns: List[str], system_prompt: str, **params: Any) -> List[TurnStats]:
+    """用同一个 chat(messages) 接口跑完多轮对话"""
+    messages = [{"role": "system", "content": system_prompt}]
+    for turn in turns:
+        messages.append({"role": "user", "content": turn})
+        result = client.chat(messages, **params)
+        messages.append({"role": "assistant", "content": result["choices"][0]["message"]["content"]})
+    return client.turn_stats
+
+
+def benchmark_conversation(endpoint: AzureOpenAIEndpoint, deployment: str, turns: List[str],
+                           system_prompt: str = "你是一个有帮助的助手。", **params: Any) -> Dict[str, List[TurnStats]]:
+    """两条路径逐轮对比"""
+    results = {
+        "chat_completions": run_conversation(ChatCompletionsSession(endpoint, deployment), turns, system_prompt, **params),
+        "responses_chained": run_conversation(ResponsesChatAdapter(endpoint, deployment), turns, system_prompt, **params),
+    }
+    print(f"\n{'轮次':>4} | {'Chat 字节':>10} {'input':>7} {'cached':>7} | {'Responses 字节':>14} {'input':>7} {'cached':>7} {'模式':>12}")
+    for chat, chained in zip(results["chat_completions"], results["responses_chained"]):
+        print(f"{chat.turn:>4} | {chat.bytes_sent:>10} {chat.input_tokens:>7} {chat.cached_tokens:>7} | "
+              f"{chained.bytes_sent:>14} {chained.input_tokens:>7} {chained.cached_tokens:>7} {chained.mode:>12}")
+    for path, stats in results.items():
+        print(f"📊 {path}: total bytes={sum(s.bytes_sent for s in stats)}, "
+              f"input tokens={sum(s.input_tokens for s in stats)}, cached={sum(s.cached_tokens for s in stats)}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare full-history Chat Completions with chained Responses API calls")
+    parser.add_argument("--endpoint", default=DEFAULT_ENDPOINT_NAME)
+    parser.add_argument("--deployment", default=DEPLOYMENT_GPT51)
+    parser.add_argument("--turns", type=int, default=len(DEFAULT_TURNS))
+    parser.add_argument("--max-tokens", type=int, default=800)
+    parser.add_argument("--output", default=f"chain_benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    args = parser.parse_args()
+
+    results = benchmark_conversation(
+        AzureOpenAIEndpoint.load(args.endpoint), args.deployment, DEFAULT_TURNS[:args.turns],
+        max_completion_tokens=args.max_tokens, reasoning_effort="none",
+    )
+    with open(args.output, "w", encoding="utf-8") as fp:
+        json.dump({path: [asdict(s) for s in stats] for path, stats in results.items()}, fp, indent=2, ensure_ascii=False)
+    print(f"\n📄 Report saved to {args.output}")
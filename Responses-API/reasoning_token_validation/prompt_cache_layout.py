@@ -0,0 +1,258 @@
+# 面向 prompt cache 的请求构造与命中率统计
+#
+# reasoning_token_reuse_analysis_detailed.md 的实验表明，cached tokens 只有在请求前缀完全一致时才会出现：
+#   - 第 3 轮引入图片后请求被路由到新的节点，cached tokens 为 0
+#   - 上一轮出现 assistant 消息后，第 6 轮 cached tokens 清零
+# 除了这些服务端行为，客户端自己也可能破坏前缀：工具定义按注册顺序 / dict 插入顺序序列化，
+# system 提示放在每次都不同的 input 里，user 等逐次变化的字段与静态内容混在一起。
+#
+# CacheAwareRequestBuilder 负责：
+#   - 工具定义按名称排序、JSON 键排序后序列化，同一组工具永远得到相同的字节
+#   - 开头的 system / developer 消息提升为 instructions，串联调用时也重复带上，保持前缀稳定；
+#     不串联的调用视为新对话，instructions 只取自本次 input
+#   - 请求体按「静态内容在前、逐次变化的字段在后」的顺序组织（model / instructions / tools ... -> user / input）
+#   - 按对话族设置 prompt_cache_key（族名 + 静态前缀哈希），同族请求路由到同一缓存
+# PrefixCacheTracker 按前缀哈希累计 input / cached tokens，并记录命中率下降的调用及可能的原因，
+# 用于发现破坏缓存的请求布局。
+
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+# 低于该命中率的非首次调用视为缓存未命中（服务端按 128 token 块缓存，且前缀需至少 1024 tokens）
+DEFAULT_MIN_HIT_RATIO = 0.5
+MIN_CACHEABLE_TOKENS = 1024
+
+
+def canonical_json(value: Any) -> str:
+    """键排序、无多余空白的 JSON，同样的内容总是得到同样的字符串"""
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def _sorted_keys(value: Any) -> Any:
+    # 递归按键排序；列表保持原顺序（如 JSON Schema 的 required / enum）
+    if isinstance(value, dict):
+        return {key: _sorted_keys(value[key]) for key in sorted(value)}
+    if isinstance(value, list):
+        return [_sorted_keys(item) for item in value]
+    return value
+
+
+def normalize_tools(tools: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """工具按 (type, name) 排序，每个定义内部键排序"""
+    return sorted((_sorted_keys(tool) for tool in tools), key=lambda t: (t.get("type", ""), t.get("name", "")))
+
+
+def _has_image(input_data: Any) -> bool:
+    if not isinstance(input_data, list):
+        return False
+    for item in input_data:
+        content = item.get("content") if isinstance(item, dict) else None
+        if isinstance(content, list) and any(part.get("type") == "input_image" for part in content if isinstance(part, dict)):
+            return True
+    return False
+
+
+@dataclass
+class CallRecord:
+    """一次调用的缓存命中情况"""
+    call_num: int
+    family: str
+    prefix_hash: str
+    chained: bool
+    has_image: bool
+    input_tokens: int = 0
+    cached_tokens: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        return self.cached_tokens / self.input_tokens if self.input_tokens else 0.0
+
+
+@dataclass
+class PrefixStats:
+    """同一静态前缀下的累计统计"""
+    prefix_hash: str
+    family: str
+    calls: int = 0
+    input_tokens: int = 0
+    cached_tokens: int = 0
+    warm_input_tokens: int = 0     # 除该前缀第一次调用以外的 input tokens（第一次调用不可能命中）
+    warm_cached_tokens: int = 0
+    misses: int = 0                # 非首次、可缓存长度以上、命中率低于阈值的调用数
+
+    @property
+    def hit_ratio(self) -> float:
+        return self.cached_tokens / self.input_tokens if self.input_tokens else 0.0
+
+    @property
+    def warm_hit_ratio(self) -> float:
+        return self.warm_cached_tokens / self.warm_input_tokens if self.warm_input_tokens else 0.0
+
+
+class PrefixCacheTracker:
+    """按前缀哈希统计 cached tokens 命中率"""
+
+    def __init__(self, min_hit_ratio: float = DEFAULT_MIN_HIT_RATIO):
+        """
+        Args:
+            min_hit_ratio: 非首次调用的命中率低于该值时记为一次缓存未命中
+        """
+        self.min_hit_ratio = min_hit_ratio
+        self.prefixes: Dict[str, PrefixStats] = {}
+        self.records: List[CallRecord] = []
+        self.family_prefixes: Dict[str, List[str]] = {}
+        self.busts: List[Tuple[CallRecord, str]] = []  # (调用, 可能原因)
+
+    def record(self, family: str, prefix_hash: str, chained: bool, has_image: bool,
+               input_tokens: int, cached_tokens: int) -> CallRecord:
+        """记录一次调用的 usage，返回该调用的 CallRecord"""
+        previous = self.records[-1] if self.records else None
+        stats = self.prefixes.setdefault(prefix_hash, PrefixStats(prefix_hash=prefix_hash, family=family))
+        call = CallRecord(call_num=len(self.records) + 1, family=family, prefix_hash=prefix_hash, chained=chained,
+                          has_image=has_image, input_tokens=input_tokens, cached_tokens=cached_tokens)
+        warm = stats.calls > 0
+        stats.calls += 1
+        stats.input_tokens += input_tokens
+        stats.cached_tokens += cached_tokens
+        if warm:
+            stats.warm_input_tokens += input_tokens
+            stats.warm_cached_tokens += cached_tokens
+
+        hashes = self.family_prefixes.setdefault(family, [])
+        reason = None
+        if prefix_hash not in hashes:
+            if hashes:
+                reason = "同一对话族的静态前缀发生变化（instructions / tools / 模型参数不同）"
+            hashes.append(prefix_hash)
+        elif warm and input_tokens >= MIN_CACHEABLE_TOKENS and call.hit_ratio < self.min_hit_ratio:
+            stats.misses += 1
+            if previous and has_image and not previous.has_image:
+                reason = "输入中新增了图片（多模态请求可能路由到其他节点）"
+            elif not chained:
+                reason = "未串联 previous_response_id，完整重发的上下文与之前不一致"
+            elif previous and previous.cached_tokens > 0:
+                reason = "命中率突然下降（上一轮可能以 assistant 消息结束，或缓存已过期）"
+            else:
+                reason = "前缀足够长但没有命中缓存"
+        if reason:
+            self.busts.append((call, reason))
+        self.records.append(call)
+        return call
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "prefixes": {
+                h: {"family": s.family, "calls": s.calls, "input_tokens": s.input_tokens, "cached_tokens": s.cached_tokens,
+                    "hit_ratio": round(s.hit_ratio, 4), "warm_hit_ratio": round(s.warm_hit_ratio, 4), "misses": s.misses}
+                for h, s in self.prefixes.items()
+            },
+            "busts": [{"call": c.call_num, "prefix_hash": c.prefix_hash, "reason": r} for c, r in self.busts],
+        }
+
+    def print_report(self) -> None:
+        if not self.records:
+            return
+        print("\nPROMPT CACHE 命中率（按静态前缀）")
+        print("-" * 80)
+        print(f"{'前缀哈希':<14} {'对话族':<28} {'调用数':<6} {'Input':<8} {'Cached':<8} {'命中率':<8} {'非首次命中率':<12}")
+        for s in self.prefixes.values():
+            print(f"{s.prefix_hash:<16} {s.family[:28]:<31} {s.calls:<9} {s.input_tokens:<8} {s.cached_tokens:<8} "
+                  f"{s.hit_ratio * 100:>6.1f}%  {s.warm_hit_ratio * 100:>10.1f}%")
+        for family, hashes in self.family_prefixes.items():
+            if len(hashes) > 1:
+                print(f"⚠️ 对话族 {family} 出现了 {len(hashes)} 种静态前缀：{', '.join(hashes)}")
+        for call, reason in self.busts:
+            print(f"⚠️ 第{call.call_num}轮 cached {call.cached_tokens}/{call.input_tokens} "
+                  f"({call.hit_ratio * 100:.1f}%, 前缀 {call.prefix_hash}): {reason}")
+
+
+class CacheAwareRequestBuilder:
+    """构造前缀稳定的 Responses API 请求体"""
+
+    # 请求体字段顺序：静态内容在前（其余 options 按键名排在其后），最后是 previous_response_id / user / input
+    STATIC_FIELDS = ("model", "instructions", "tools", "tool_choice", "parallel_tool_calls", "reasoning", "text",
+                     "max_output_tokens", "store", "stream")
+
+    def __init__(self, model: str, family: str = "default", options: Optional[Dict[str, Any]] = None,
+                 hoist_instructions: bool = True, tracker: Optional[PrefixCacheTracker] = None):
+        """
+        Args:
+            model: 部署名
+            family: 对话族名称（同一类任务 / 同一套提示词共用一个），用于 prompt_cache_key
+            options: 每次请求都相同的参数（reasoning / text / max_output_tokens / store 等）
+            hoist_instructions: 是否把 input 开头的 system / developer 消息提升为 instructions
+            tracker: 命中率统计（默认新建）
+        """
+        self.model = model
+        self.family = family
+        self.options = dict(options or {})
+        self.hoist_instructions = hoist_instructions
+        self.tracker = tracker or PrefixCacheTracker()
+        self.instructions: Optional[str] = None
+        self.last_prefix_hash: Optional[str] = None
+
+    def _split_input(self, input_data: Any) -> Tuple[Optional[str], Any]:
+        if not self.hoist_instructions or not isinstance(input_data, list):
+            return None, input_data
+        leading = 0
+        while (leading < len(input_data) and isinstance(input_data[leading], dict)
+               and input_data[leading].get("role") in ("system", "developer")
+               and isinstance(input_data[leading].get("content"), str)):
+            leading += 1
+        if not leading:
+            return None, input_data
+        return "\n\n".join(m["content"] for m in input_data[:leading]), input_data[leading:]
+
+    def prefix_hash(self, static: Dict[str, Any]) -> str:
+        """静态部分（不含 prompt_cache_key）的哈希"""
+        return hashlib.sha256(canonical_json(static).encode("utf-8")).hexdigest()[:12]
+
+    def build(self, input_data: Any, tools: Optional[List[Dict[str, Any]]] = None,
+              previous_response_id: Optional[str] = None, user: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Args:
+            input_data: 本次的 input（开头的 system 消息会被提升为 instructions，并在串联的后续调用中复用）
+            tools: 工具定义（会被排序 / 规范化）
+            previous_response_id: 串联的上一个 response
+            user: 终端用户标识（逐次字段，放在请求体末尾）
+
+        Returns:
+            请求体 dict（字段顺序即序列化顺序）
+        """
+        instructions, input_data = self._split_input(input_data)
+        if instructions is not None or not previous_response_id:
+            # 新对话（未串联）不能沿用上一段对话的 instructions，否则会发送并哈希过期的 system 提示
+            self.instructions = instructions
+
+        static: Dict[str, Any] = {"model": self.model}
+        if self.instructions:
+            static["instructions"] = self.instructions
+        if tools:
+            static["tools"] = normalize_tools(tools)
+        for key in sorted(self.options):
+            static[key] = _sorted_keys(self.options[key])
+        self.last_prefix_hash = self.prefix_hash(static)
+
+        order = [key for key in self.STATIC_FIELDS if key in static] + sorted(set(static) - set(self.STATIC_FIELDS))
+        payload = {key: static[key] for key in order}
+        payload["prompt_cache_key"] = f"{self.family}:{self.last_prefix_hash}"
+        if previous_response_id:
+            payload["previous_response_id"] = previous_response_id
+        if user:
+            payload["user"] = user
+        payload["input"] = input_data
+        return payload
+
+    def body(self, payload: Dict[str, Any]) -> bytes:
+        """序列化请求体：保持字段顺序，内部已规范化，不同调用之间静态部分字节一致"""
+        return json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    def record_usage(self, payload: Dict[str, Any], input_tokens: int, cached_tokens: int) -> CallRecord:
+        """把 build() 构造的请求对应的 usage 记入命中率统计"""
+        return self.tracker.record(
+            family=self.family, prefix_hash=payload["prompt_cache_key"].rsplit(":", 1)[-1],
+            chained="previous_response_id" in payload, has_image=_has_image(payload.get("input")),
+            input_tokens=input_tokens, cached_tokens=cached_tokens,
+        )
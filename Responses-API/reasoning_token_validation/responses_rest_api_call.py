@@ -4,12 +4,29 @@ import os
 import sys
 from typing import List, Dict, Any, Optional, Callable
 from dataclasses import dataclass, field
+from pathlib import Path
+
+# 共享的惰性配置位于仓库根目录；import 本模块时不读取任何配置文件
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from lazy_config import LazyConfig, once
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from prompt_cache_layout import CacheAwareRequestBuilder
 
-import configparser
-config = configparser.ConfigParser()
-config.read('C:\GitRepo\OpenAI-examples\.config')
 aoai_endpointname = 'jz-fdpo-swn'
-AZURE_OPENAI_KEY = config.get('AOAIEndpoints', aoai_endpointname)
+
+
+@once
+def get_settings() -> LazyConfig:
+    """首次使用时才加载 .env / .config（原来在 import 时读取 C:\\GitRepo\\OpenAI-examples\\.config）"""
+    return LazyConfig(search_from=Path(__file__).resolve().parent)
+
+
+def __getattr__(name: str):
+    # 兼容 `from responses_rest_api_call import AZURE_OPENAI_KEY`：访问时才读取
+    if name == "AZURE_OPENAI_KEY":
+        return get_settings().aoai_key(aoai_endpointname)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 @dataclass
 class TokenUsage:
@@ -20,6 +37,7 @@ class TokenUsage:
     reasoning_tokens: int = 0
     output_tokens: int = 0
     total_tokens: int = 0
+    prefix_hash: str = ""  # 请求静态前缀的哈希（见 prompt_cache_layout.py）
     
     def __post_init__(self):
         if self.total_tokens == 0:
@@ -38,7 +56,8 @@ class ResponsesAPIClient:
     """Azure OpenAI Responses API 客户端类"""
     
     def __init__(self, api_key: str, endpoint: str, model: str = "gpt-5-globalstandard", 
-                 max_rounds: int = 10, timeout: int = 300):
+                 max_rounds: int = 10, timeout: int = 300, cache_family: str = "reasoning_token_validation",
+                 user: Optional[str] = "joeyzeng"):
         """
         初始化客户端
         
@@ -48,6 +67,8 @@ class ResponsesAPIClient:
             model: 使用的模型名称
             max_rounds: 最大调用轮数（防止无限循环）
             timeout: 请求超时时间
+            cache_family: 对话族名称，同族请求共用 prompt_cache_key
+            user: 终端用户标识（逐次字段，放在请求体末尾）
         """
         self.api_key = api_key
         self.endpoint = endpoint
@@ -56,6 +77,20 @@ class ResponsesAPIClient:
         self.timeout = timeout
         self.function_handlers = {}
         self.token_stats = []
+        self.user = user
+        # 静态内容（model / instructions / tools / 推理参数）放在稳定的前缀里，并统计各前缀的缓存命中率
+        self.request_builder = CacheAwareRequestBuilder(
+            model=model,
+            family=cache_family,
+            options={
+                "store": True,
+                "max_output_tokens": 10000,
+                "stream": False,
+                "text": {"verbosity": "medium"},
+                "reasoning": {"effort": "high", "summary": "detailed"},
+                "parallel_tool_calls": False,
+            },
+        )
         
         # API配置
         self.url = f"{endpoint}/openai/v1/responses"
@@ -86,8 +121,8 @@ class ResponsesAPIClient:
         }
     
     def get_tool_definitions(self) -> List[Dict[str, Any]]:
-        """获取所有工具定义"""
-        return [func_info["definition"] for func_info in self.function_handlers.values()]
+        """获取所有工具定义（按名称排序，与注册顺序无关）"""
+        return [self.function_handlers[name]["definition"] for name in sorted(self.function_handlers)]
     
     def execute_function_call(self, function_call: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -142,27 +177,16 @@ class ResponsesAPIClient:
         Returns:
             API响应数据
         """
-        data = {
-            "model": self.model,
-            "user": "joeyzeng",
-            "store": True,
-            "max_output_tokens": 10000,
-            "stream": False,
-            "text": {"verbosity": "medium"},
-            "reasoning": {"effort": "high", "summary": "detailed"},
-            "tools": self.get_tool_definitions(),
-            "parallel_tool_calls": False,
-            "input": input_data
-        }
-        
-        if previous_response_id:
-            data["previous_response_id"] = previous_response_id
+        data = self.request_builder.build(
+            input_data, tools=self.get_tool_definitions(),
+            previous_response_id=previous_response_id, user=self.user,
+        )
         
         try:
-            print(f"发送API请求...")
+            print(f"发送API请求... (prompt_cache_key={data['prompt_cache_key']})")
             response = requests.post(
                 self.url, headers=self.headers, params=self.params,
-                json=data, timeout=self.timeout
+                data=self.request_builder.body(data), timeout=self.timeout
             )
             
             # 获取apim-request-id
@@ -182,8 +206,10 @@ class ResponsesAPIClient:
                     cached_tokens=usage_data.get('input_tokens_details', {}).get('cached_tokens', 0),
                     reasoning_tokens=usage_data.get('output_tokens_details', {}).get('reasoning_tokens', 0),
                     output_tokens=usage_data.get('output_tokens', 0),
-                    total_tokens=usage_data.get('total_tokens', 0)
+                    total_tokens=usage_data.get('total_tokens', 0),
+                    prefix_hash=self.request_builder.last_prefix_hash
                 )
+                self.request_builder.record_usage(data, token_usage.input_tokens, token_usage.cached_tokens)
                 
                 api_response = APIResponse(
                     id=result.get('id', ''),
@@ -325,7 +351,7 @@ class ResponsesAPIClient:
         print("="*80)
         
         # 表头
-        print(f"{'调用轮数':<10} {'Input Tokens':<12} {'Cached Tokens':<13} {'Reasoning Tokens':<16} {'Output Tokens':<13} {'Total Tokens':<12}")
+        print(f"{'调用轮数':<10} {'Input Tokens':<12} {'Cached Tokens':<13} {'Reasoning Tokens':<16} {'Output Tokens':<13} {'Total Tokens':<12} {'前缀':<12}")
         print("-" * 80)
         
         # 数据行和统计
@@ -336,7 +362,7 @@ class ResponsesAPIClient:
         total_all = sum(stat.total_tokens for stat in self.token_stats)
         
         for stat in self.token_stats:
-            print(f"第{stat.round_num}轮{'':<6} {stat.input_tokens:<12} {stat.cached_tokens:<13} {stat.reasoning_tokens:<16} {stat.output_tokens:<13} {stat.total_tokens:<12}")
+            print(f"第{stat.round_num}轮{'':<6} {stat.input_tokens:<12} {stat.cached_tokens:<13} {stat.reasoning_tokens:<16} {stat.output_tokens:<13} {stat.total_tokens:<12} {stat.prefix_hash:<12}")
         
         # 合计行
         print("-" * 80)
@@ -353,6 +379,7 @@ class ResponsesAPIClient:
             print(f"• 输出 tokens: {total_output} ({total_output/total_all*100:.1f}%)")
         if total_cached > 0:
             print(f"• 缓存效率: 节省了 {total_cached} tokens，相当于节省 {total_cached/(total_input+total_cached)*100:.1f}% 的输入成本")
+        self.request_builder.tracker.print_report()
         print("="*80)
 
 def get_file_content_by_filename(filename):
@@ -385,9 +412,9 @@ def search_image_by_keyword(keyword: str, count: int = 1, call_id: str = None) -
 
 def create_client_with_default_functions() -> ResponsesAPIClient:
     """创建配置了默认函数的客户端"""
-    endpoint = "https://jz-fdpo-swn.openai.azure.com"
+    endpoint = f"https://{aoai_endpointname}.openai.azure.com"
     client = ResponsesAPIClient(
-        api_key=AZURE_OPENAI_KEY,
+        api_key=get_settings().aoai_key(aoai_endpointname),
         endpoint=endpoint,
         model="gpt-5-globalstandard",
         max_rounds=10
@@ -0,0 +1,234 @@
+# import 耗时回归基准
+#
+# 各示例脚本都应当可以零副作用地 import（配置与客户端由 lazy_config.py 按需创建）。
+# 本脚本在独立子进程中逐个 import 目标模块（不执行 __main__ 块），记录：
+#   - import 墙钟时间（取多次运行的中位数）
+#   - import 期间的 I/O：通过 sys.addaudithook 捕获网络连接 / DNS 解析 / 子进程，
+#     以及对 sys.prefix 之外非 .py 文件的 open（例如 .env、.config）
+# 指定 --baseline 时与上次结果对比，耗时超出容差或出现 I/O 时以退出码 1 结束，可直接放进 CI。
+#
+# 用法:
+#   python import_time_benchmark.py                          # 打印报告
+#   python import_time_benchmark.py --baseline import_baseline.json --update-baseline
+#   python import_time_benchmark.py --baseline import_baseline.json --tolerance 0.5
+#   python import_time_benchmark.py --importtime Image-Generation/Flux/flux_image_gen.py
+#   python import_time_benchmark.py --output import_times.json
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+REPO_ROOT = Path(__file__).resolve().parent
+
+DEFAULT_TARGETS = [
+    "lazy_config.py",
+    "Responses-API/reasoning_token_validation/responses_rest_api_call.py",
+    "Image-Generation/Flux/flux_image_gen.py",
+    "Image-Generation/Flux/flux_image_edit.py",
+    "Azure-Agents/MCP-Tool/azure_ai_foundry_agent_with_mcp_mslearn_require_approval.py",
+    "Azure-Agents/MCP-Tool/batch_questions.py",
+]
+
+# 子进程中执行的探针：安装 audit hook 后按文件路径 import 目标模块，结果以 JSON 打印到 stdout 最后一行
+_PROBE = r"""
+import importlib.util, json, os, sys, time
+
+target = sys.argv[1]
+events = []
+prefixes = tuple({os.path.realpath(p) for p in (sys.prefix, sys.base_prefix, sys.exec_prefix)})
+ignored_suffixes = (".py", ".pyc", ".pyd", ".so", ".pth", ".zip", ".dll")
+
+def is_library(filename):
+    return filename.startswith("<") or os.path.realpath(filename).startswith(prefixes)
+
+def third_party_import_side_effect():
+    # 从触发事件的位置向外找到第一个仓库代码帧；途中若经过第三方 / 标准库模块的顶层代码，
+    # 说明是依赖包自身在 import 时的行为（例如 azure-core 调用 platform.uname），不计入目标模块
+    frame = sys._getframe(2)
+    while frame is not None and is_library(frame.f_code.co_filename):
+        if frame.f_code.co_name == "<module>" and not frame.f_code.co_filename.startswith("<"):
+            return True
+        frame = frame.f_back
+    return False
+
+def hook(event, args):
+    if event in ("socket.connect", "socket.getaddrinfo", "subprocess.Popen", "os.system"):
+        detail = f"{event}: {args[1] if event == 'socket.connect' else args[0]!r}"[:200]
+    elif event == "open" and isinstance(args[0], (str, bytes, os.PathLike)):
+        path = os.fsdecode(args[0])
+        mode = args[1] or "r"
+        if path.endswith(ignored_suffixes) or "__pycache__" in path or path == os.devnull:
+            return
+        real = os.path.realpath(path)
+        if real.startswith(prefixes) and "w" not in mode and "a" not in mode:
+            return
+        detail = f"open: {path} ({mode})"
+    else:
+        return
+    if not third_party_import_side_effect():
+        events.append(detail)
+
+sys.addaudithook(hook)
+directory = os.path.dirname(os.path.abspath(target))
+sys.path.insert(0, directory)  # 与直接运行脚本时一致，同目录模块可被 import
+name = "_import_probe_" + os.path.splitext(os.path.basename(target))[0]
+start = time.perf_counter()
+error = None
+try:
+    spec = importlib.util.spec_from_file_location(name, target)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+except ModuleNotFoundError as exc:
+    error = f"missing dependency: {exc.name}"
+except BaseException as exc:
+    error = f"{type(exc).__name__}: {exc}"
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "events": events, "error": error}))
+"""
+
+
+@dataclass
+class ImportResult:
+    target: str
+    seconds: Optional[float] = None   # 多次运行的中位数
+    runs: List[float] = field(default_factory=list)
+    io_events: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+    @property
+    def skipped(self) -> bool:
+        return bool(self.error and self.error.startswith("missing dependency"))
+
+
+def probe_import(target: Path, repeat: int = 3, importtime: bool = False) -> ImportResult:
+    """
+    在干净的子进程中 import 一个脚本
+
+    Args:
+        target: 脚本路径
+        repeat: 运行次数（每次都是新进程，没有模块缓存）
+        importtime: 额外打印 python -X importtime 的逐模块耗时（输出到 stderr）
+
+    Returns:
+        ImportResult
+    """
+    result = ImportResult(target=str(target.relative_to(REPO_ROOT)) if target.is_relative_to(REPO_ROOT) else str(target))
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    for attempt in range(repeat):
+        command = [sys.executable]
+        if importtime and attempt == 0:
+            command += ["-X", "importtime"]
+        command += ["-c", _PROBE, str(target)]
+        # 在 target 所在目录运行，与实际使用方式一致（会暴露对 cwd 下 .env 的读取）
+        proc = subprocess.run(command, capture_output=True, text=True, cwd=target.parent, env=env)
+        if importtime and attempt == 0:
+            print(proc.stderr, file=sys.stderr)
+        lines = proc.stdout.strip().splitlines()
+        try:
+            data = json.loads(lines[-1])
+        except (IndexError, json.JSONDecodeError):
+            result.error = f"probe failed (exit {proc.returncode}): {proc.stderr.strip()[-300:]}"
+            return result
+        for event in data["events"]:
+            if event not in result.io_events:
+                result.io_events.append(event)
+        if data["error"]:
+            result.error = data["error"]
+            return result
+        result.runs.append(data["seconds"])
+    result.seconds = statistics.median(result.runs)
+    return result
+
+
+def compare_with_baseline(results: List[ImportResult], baseline: Dict[str, float], tolerance: float,
+                          min_delta_s: float) -> List[str]:
+    """
+    对比基线，返回回归列表
+
+    Args:
+        tolerance: 允许的相对增幅（0.5 表示比基线慢 50% 以内不算回归）
+        min_delta_s: 绝对增量低于该值时忽略（避免毫秒级抖动误报）
+    """
+    regressions = []
+    for r in results:
+        if r.seconds is None or r.target not in baseline:
+            continue
+        before = baseline[r.target]
+        if r.seconds > before * (1 + tolerance) and r.seconds - before > min_delta_s:
+            regressions.append(f"{r.target}: {before * 1000:.1f}ms -> {r.seconds * 1000:.1f}ms")
+    return regressions
+
+
+def print_report(results: List[ImportResult], baseline: Dict[str, float]) -> None:
+    print(f"\n{'模块':<80} {'import 耗时':>12} {'基线':>10}  I/O")
+    for r in results:
+        if r.seconds is None:
+            status = "⏭️ skipped" if r.skipped else "❌ error"
+            print(f"{r.target:<80} {status:>12}              {r.error[:200]}")
+        else:
+            before = f"{baseline[r.target] * 1000:.1f}ms" if r.target in baseline else "-"
+            io = "✅ none" if not r.io_events else f"⚠️ {len(r.io_events)}"
+            print(f"{r.target:<80} {r.seconds * 1000:>10.1f}ms {before:>10}  {io}")
+        for event in r.io_events:
+            print(f"    {event}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure import time and import-time I/O of the sample scripts")
+    parser.add_argument("targets", nargs="*", help="Scripts to import (default: the sample clients)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", help="Baseline JSON file to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="Write the current timings to --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed relative slowdown before failing")
+    parser.add_argument("--min-delta-ms", type=float, default=20, help="Ignore slowdowns smaller than this")
+    parser.add_argument("--importtime", action="store_true", help="Also print python -X importtime output")
+    parser.add_argument("--output", help="Write the full results as JSON")
+    args = parser.parse_args()
+
+    targets = [Path(t).resolve() for t in args.targets] or [REPO_ROOT / t for t in DEFAULT_TARGETS]
+    results = [probe_import(t, repeat=args.repeat, importtime=args.importtime) for t in targets]
+
+    baseline: Dict[str, float] = {}
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as fp:
+            baseline = json.load(fp)
+    print_report(results, baseline)
+
+    failed = False
+    with_io = [r for r in results if r.io_events]
+    if with_io:
+        print(f"\n⚠️ {len(with_io)} module(s) perform I/O at import time")
+        failed = True
+    errors = [r for r in results if r.error and not r.skipped]
+    if errors:
+        print(f"\n❌ {len(errors)} module(s) failed to import")
+        failed = True
+    regressions = compare_with_baseline(results, baseline, args.tolerance, args.min_delta_ms / 1000)
+    if regressions:
+        print("\n⚠️ Import time regressions:")
+        for line in regressions:
+            print(f"    {line}")
+        failed = True
+
+    if args.baseline and args.update_baseline:
+        measured = {r.target: r.seconds for r in results if r.seconds is not None}
+        tmp_path = args.baseline + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fp:
+            json.dump({**baseline, **measured}, fp, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, args.baseline)
+        print(f"\n📄 Baseline updated: {args.baseline}")
+    elif not failed:
+        print("\n🎉 No import-time I/O or regressions")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fp:
+            json.dump([asdict(r) for r in results], fp, indent=2, ensure_ascii=False)
+        print(f"📄 Results saved to {args.output}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,150 @@
+# 共享的惰性配置 / 客户端工厂
+#
+# 原来的脚本在 import 时就读取 .config / .env、创建客户端甚至发请求：
+#   - responses_rest_api_call.py 在模块顶层读取 Windows 路径下的 .config 并取出 AZURE_OPENAI_KEY
+#   - flux_image_gen.py 在模块顶层加载 .env 并直接调用 generations 接口
+#   - MCP 脚本在模块顶层创建 AIProjectClient 和 agent
+# 因此无法在长期运行的服务或测试进程里低成本地 import。这里提供：
+#   - LazyConfig：第一次取值时才加载 .env / .config，之后缓存；环境变量优先
+#   - once：线程安全的零参数工厂缓存（客户端、配置对象等），可 reset
+# 各脚本通过 sys.path 引用仓库根目录下的本模块，import 本身不做任何 I/O。
+#
+# 取值顺序：
+#   get(name)          环境变量 -> .env（向上查找）
+#   aoai_key(endpoint) 环境变量 AOAI_KEY_<ENDPOINT> -> .config [AOAIEndpoints] -> AZURE_OPENAI_API_KEY / AZURE_OPENAI_KEY
+
+import configparser
+import os
+import threading
+from functools import wraps
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# 原脚本中硬编码的 .config 位置，作为最后的候选
+LEGACY_CONFIG_PATHS = (r"C:\GitRepo\OpenAI-examples\.config",)
+
+
+def once(factory: Callable[[], T]) -> Callable[[], T]:
+    """
+    零参数工厂的线程安全缓存：第一次调用时创建，之后返回同一个对象
+
+    被装饰的函数带有 reset()，用于测试或配置变更后重新创建
+    """
+    lock = threading.Lock()
+    state = {}
+
+    @wraps(factory)
+    def wrapper() -> T:
+        if "value" not in state:
+            with lock:
+                if "value" not in state:
+                    state["value"] = factory()
+        return state["value"]
+
+    def reset() -> None:
+        with lock:
+            state.pop("value", None)
+
+    wrapper.reset = reset
+    return wrapper
+
+
+def _find_upwards(start: Path, filename: str) -> Optional[Path]:
+    current = start.resolve()
+    for directory in (current, *current.parents):
+        candidate = directory / filename
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+class LazyConfig:
+    """按需加载的配置来源"""
+
+    def __init__(self, search_from: Optional[Path] = None, config_path: Optional[Path] = None,
+                 dotenv_override: bool = False, legacy_config_paths: Iterable[str] = LEGACY_CONFIG_PATHS):
+        """
+        Args:
+            search_from: 向上查找 .env / .config 的起始目录（默认当前工作目录）
+            config_path: 显式指定 .config 路径（也可通过环境变量 AOAI_CONFIG_PATH 指定）
+            dotenv_override: .env 中的值是否覆盖已有环境变量（与 dotenv.load_dotenv(override=...) 相同）
+            legacy_config_paths: 找不到 .config 时额外尝试的路径
+        """
+        self.search_from = Path(search_from) if search_from else None
+        self.config_path = Path(config_path) if config_path else None
+        self.dotenv_override = dotenv_override
+        self.legacy_config_paths = tuple(legacy_config_paths)
+        self._lock = threading.Lock()
+        self._dotenv_loaded = False
+        self._parser: Optional[configparser.ConfigParser] = None
+
+    def _start_dirs(self):
+        return [d for d in (self.search_from, Path.cwd()) if d is not None]
+
+    def load_dotenv(self) -> None:
+        """加载 .env（只执行一次）；未安装 python-dotenv 时跳过"""
+        if self._dotenv_loaded:
+            return
+        with self._lock:
+            if self._dotenv_loaded:
+                return
+            try:
+                from dotenv import load_dotenv
+            except ImportError:
+                load_dotenv = None
+            if load_dotenv is not None:
+                for start in self._start_dirs():
+                    dotenv_path = _find_upwards(start, ".env")
+                    if dotenv_path:
+                        load_dotenv(dotenv_path, override=self.dotenv_override)
+                        break
+            self._dotenv_loaded = True
+
+    def get(self, name: str, default: Optional[str] = None, required: bool = False) -> Optional[str]:
+        """读取环境变量（首次调用时先加载 .env）"""
+        self.load_dotenv()
+        value = os.environ.get(name, default)
+        if required and not value:
+            raise KeyError(f"Missing required setting '{name}' (environment variable or .env)")
+        return value
+
+    def resolve_config_path(self) -> Optional[Path]:
+        explicit = self.config_path or (Path(os.environ["AOAI_CONFIG_PATH"]) if os.environ.get("AOAI_CONFIG_PATH") else None)
+        if explicit:
+            return explicit
+        for start in self._start_dirs():
+            found = _find_upwards(start, ".config")
+            if found:
+                return found
+        for legacy in self.legacy_config_paths:
+            if os.path.isfile(legacy):
+                return Path(legacy)
+        return None
+
+    def config(self) -> configparser.ConfigParser:
+        """解析后的 .config（只读取一次）"""
+        if self._parser is None:
+            with self._lock:
+                if self._parser is None:
+                    parser = configparser.ConfigParser()
+                    path = self.resolve_config_path()
+                    if path:
+                        parser.read(path)
+                    self._parser = parser
+        return self._parser
+
+    def aoai_key(self, endpoint_name: str) -> str:
+        """某个 Azure OpenAI endpoint 的 API key"""
+        specific = self.get("AOAI_KEY_" + endpoint_name.upper().replace("-", "_"))
+        if specific:
+            return specific
+        parser = self.config()
+        if parser.has_option("AOAIEndpoints", endpoint_name):
+            return parser.get("AOAIEndpoints", endpoint_name)
+        generic = self.get("AZURE_OPENAI_API_KEY") or self.get("AZURE_OPENAI_KEY")
+        if generic:
+            return generic
+        raise KeyError(f"No API key for endpoint '{endpoint_name}': set AOAI_KEY_{endpoint_name.upper().replace('-', '_')}, "
+                       f"add it to [AOAIEndpoints] in .config, or set AZURE_OPENAI_API_KEY")